@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 from sqlalchemy.orm import selectinload
@@ -7,19 +7,27 @@ from typing import List, Optional
 from datetime import date
 
 from app.models import (
-    get_db, User, UserRole, Order, OrderStatus,
+    get_db, get_read_db, User, UserRole, Order, OrderStatus,
     ResidentialComplex, Subscription, Balance, BalanceTransaction, TariffPrice, ComplexBuilding
 )
+from app.api.deps import get_admin_user
+from app.config import settings
 from app.services.scheduler import generate_orders_for_today
 from app.services.notifications import get_telegram_user_info
+from app.services import ledger, tariff_cache, dispatcher, recipients, address_view, complex_catalog
+from app.services import events, order_state, sql_profile
+from app.services.sql_profile import statement_budget
+from app.logging_config import get_logger
 
 router = APIRouter()
+log = get_logger("ADMIN")
 
 
 class ComplexCreate(BaseModel):
     name: str
     short_name: Optional[str] = None
     buildings: List[str] = []
+    slot_capacity: Optional[int] = None  # Pickups per time slot; default settings.SLOT_CAPACITY
 
 
 class CourierCreate(BaseModel):
@@ -40,8 +48,9 @@ class StatsResponse(BaseModel):
     total_active_future: int    # New field: scheduled/in_progress for any date
 
 @router.get("/stats", response_model=StatsResponse)
+@statement_budget(6)
 async def get_dashboard_stats(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """
     Get dashboard statistics for admin
@@ -117,7 +126,7 @@ class TariffResponse(BaseModel):
 
 
 @router.get("/public/tariffs", response_model=List[TariffResponse])
-async def get_public_tariffs(db: AsyncSession = Depends(get_db)):
+async def get_public_tariffs(db: AsyncSession = Depends(get_read_db)):
     """
     PUBLIC endpoint - get all tariffs for client app
     """
@@ -142,7 +151,7 @@ async def get_public_tariffs(db: AsyncSession = Depends(get_db)):
 
 @router.get("/orders/today")
 async def get_today_orders(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """
     Get all active orders (scheduled + in_progress), not just today
@@ -166,21 +175,20 @@ async def assign_courier(
     """
     Assign a courier to an order
     """
-    result = await db.execute(select(Order).where(Order.id == order_id))
-    order = result.scalar_one_or_none()
-    
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-        
     result = await db.execute(select(User).where(User.id == request.courier_id, User.role == UserRole.COURIER))
     courier = result.scalar_one_or_none()
     
     if not courier:
         raise HTTPException(status_code=404, detail="Courier not found")
-        
-    order.courier_id = courier.id
-    order.status = OrderStatus.IN_PROGRESS
+    
+    try:
+        assigned = await order_state.transition(db, order_id, "assign", values={"courier_id": courier.id})
+    except order_state.TransitionError as e:
+        if e.status is None:
+            raise HTTPException(status_code=404, detail="Order not found")
+        raise HTTPException(status_code=400, detail=f"Order is {e.status.value}")
     await db.commit()
+    await order_state.emit(db, assigned)
     
     return {"status": "ok", "message": f"Assigned to {courier.name}"}
 
@@ -193,30 +201,15 @@ async def cancel_order_admin(
     """
     Cancel order by admin
     """
-    result = await db.execute(select(Order).where(Order.id == order_id))
-    order = result.scalar_one_or_none()
-    
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-        
-    if order.status == OrderStatus.CANCELLED:
+    # Refund logic is part of the transition
+    try:
+        cancelled = await order_state.transition(db, order_id, "cancel_admin")
+    except order_state.TransitionError as e:
+        if e.status is None:
+            raise HTTPException(status_code=404, detail="Order not found")
         return {"status": "ok", "message": "Already cancelled"}
-        
-    # Refund logic
-    result = await db.execute(select(Balance).where(Balance.user_id == order.user_id))
-    balance = result.scalar_one()
-    balance.credits += 1
-    
-    transaction = BalanceTransaction(
-        balance_id=balance.id,
-        amount=1,
-        description=f"Отмена заказа #{order.id} администратором",
-        order_id=order.id,
-    )
-    db.add(transaction)
-    
-    order.status = OrderStatus.CANCELLED
     await db.commit()
+    await order_state.emit(db, cancelled)
     
     return {"status": "ok", "message": "Order cancelled"}
 
@@ -232,6 +225,7 @@ async def create_complex(
     complex = ResidentialComplex(
         name=request.name,
         short_name=request.short_name or request.name[:10],
+        slot_capacity=request.slot_capacity,
     )
     db.add(complex)
     await db.flush()
@@ -242,29 +236,21 @@ async def create_complex(
             
     await db.commit()
     await db.refresh(complex)
+    complex_catalog.invalidate()
     
     return {"id": complex.id, "name": complex.name}
 
 
 @router.get("/complexes")
 async def list_complexes(
-    db: AsyncSession = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_read_db),
 ):
     """
-    List all residential complexes
+    List all residential complexes (cached snapshot, supports If-None-Match)
     """
-    result = await db.execute(
-        select(ResidentialComplex).options(selectinload(ResidentialComplex.buildings))
-    )
-    complexes = result.scalars().all()
-    
-    return [{
-        "id": c.id, 
-        "name": c.name, 
-        "short_name": c.short_name, 
-        "is_active": c.is_active,
-        "buildings": [b.building_number for b in c.buildings]
-    } for c in complexes]
+    catalog = await complex_catalog.get_catalog(db)
+    return complex_catalog.catalog_response(request, catalog.admin, "no-cache")
 
 
 @router.delete("/complexes/{complex_id}")
@@ -275,7 +261,12 @@ async def delete_complex(
     """
     Delete a residential complex
     """
-    result = await db.execute(select(ResidentialComplex).where(ResidentialComplex.id == complex_id))
+    # Buildings are deleted by cascade, so they have to be loaded up front
+    result = await db.execute(
+        select(ResidentialComplex)
+        .options(selectinload(ResidentialComplex.buildings))
+        .where(ResidentialComplex.id == complex_id)
+    )
     complex = result.scalar_one_or_none()
     
     if not complex:
@@ -283,6 +274,8 @@ async def delete_complex(
         
     await db.delete(complex)
     await db.commit()
+    address_view.invalidate_complex(complex_id)
+    complex_catalog.invalidate()
     
     return {"status": "ok", "message": "Complex deleted"}
 
@@ -316,13 +309,14 @@ async def add_courier(
     
     await db.commit()
     await db.refresh(user)
+    recipients.invalidate_couriers()
     
     return {"id": user.id, "name": user.name, "role": user.role.value}
 
 
 @router.get("/couriers")
 async def list_couriers(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """
     List all couriers
@@ -356,6 +350,7 @@ async def deactivate_courier(
     
     courier.is_active = False
     await db.commit()
+    recipients.invalidate_couriers()
     
     return {"status": "ok", "message": "Courier deactivated"}
 
@@ -363,56 +358,39 @@ async def deactivate_courier(
 # ================== CLIENTS ==================
 
 @router.get("/clients")
+@statement_budget(2)  # Plus one batched UPDATE when usernames were fetched
 async def list_clients(
     db: AsyncSession = Depends(get_db),
 ):
     """
     List all clients (users with CLIENT role)
     """
+    # Balance is joined in; order/subscription counts are denormalized on User
     result = await db.execute(
-        select(User).where(User.role == UserRole.CLIENT).order_by(User.created_at.desc())
+        select(User, Balance)
+        .outerjoin(Balance, Balance.user_id == User.id)
+        .where(User.role == UserRole.CLIENT)
+        .order_by(User.created_at.desc())
     )
-    clients = result.scalars().all()
+    rows = result.all()
     
     client_list = []
     
     # Track if we updated any usernames
     updated_usernames = False
     
-    for client in clients:
+    for client, balance in rows:
         # Check if username is missing and fetch it from Telegram
         if not client.username:
-            print(f"[ADMIN] Fetching missing username for user {client.id} (TG: {client.telegram_id})")
+            log.debug("Fetching missing username for user %s", client.id)
             tg_info = await get_telegram_user_info(client.telegram_id)
             if tg_info and tg_info.get("username"):
                 new_username = tg_info.get("username")
-                print(f"[ADMIN] Found username: @{new_username}")
                 client.username = new_username
                 updated_usernames = True
             else:
-                print(f"[ADMIN] No username found for user {client.id}")
+                log.debug("No username found for user %s", client.id)
 
-        # Get balance
-        balance_result = await db.execute(
-            select(Balance).where(Balance.user_id == client.id)
-        )
-        balance = balance_result.scalar_one_or_none()
-        
-        # Get active subscriptions count
-        subs_result = await db.execute(
-            select(func.count(Subscription.id)).where(
-                Subscription.user_id == client.id,
-                Subscription.is_active == True
-            )
-        )
-        active_subs = subs_result.scalar() or 0
-        
-        # Get total orders count
-        orders_result = await db.execute(
-            select(func.count(Order.id)).where(Order.user_id == client.id)
-        )
-        total_orders = orders_result.scalar() or 0
-        
         client_list.append({
             "id": client.id,
             "name": client.name,
@@ -420,8 +398,8 @@ async def list_clients(
             "username": client.username,  # Add username
             "phone": client.phone,
             "balance": balance.credits if balance else 0,
-            "active_subscriptions": active_subs,
-            "total_orders": total_orders,
+            "active_subscriptions": client.active_subscriptions_count or 0,
+            "total_orders": client.orders_count or 0,
             "created_at": client.created_at.isoformat() if client.created_at else None,
         })
     
@@ -468,27 +446,13 @@ async def add_credits_to_client(
         )
     
     # Get or create balance
-    result = await db.execute(
-        select(Balance).where(Balance.user_id == client.id)
-    )
-    balance = result.scalar_one_or_none()
-    
-    if not balance:
-        balance = Balance(user_id=client.id, credits=0, single_credits=0)
-        db.add(balance)
-        await db.flush()
+    balance = await ledger.get_or_create_balance(db, client.id)
     
     # Add credits
-    balance.credits += request.amount
-    
-    # Create transaction record
-    transaction = BalanceTransaction(
-        balance_id=balance.id,
-        amount=request.amount,
+    await ledger.post_entry(
+        db, balance, request.amount,
         description=request.description or f"Пополнение администратором (+{request.amount} вынос)",
-        order_id=None,
     )
-    db.add(transaction)
     
     await db.commit()
     await db.refresh(balance)
@@ -522,39 +486,22 @@ async def add_single_credits_to_client(
         )
     
     # Get or create balance
-    result = await db.execute(
-        select(Balance).where(Balance.user_id == client.id)
-    )
-    balance = result.scalar_one_or_none()
-    
-    if not balance:
-        balance = Balance(user_id=client.id, credits=0, single_credits=0)
-        db.add(balance)
-        await db.flush()
+    balance = await ledger.get_or_create_balance(db, client.id)
     
     # Log before adding
     old_balance = balance.single_credits
-    print(f"[ADMIN ADD SINGLE CREDITS] User: {client.name} (ID: {client.id})")
-    print(f"[ADMIN ADD SINGLE CREDITS] Old balance: {old_balance}, Adding: {request.amount}")
     
     # Add single_credits
-    balance.single_credits += request.amount
-    
-    print(f"[ADMIN ADD SINGLE CREDITS] New balance (before commit): {balance.single_credits}")
-    
-    # Create transaction record
-    transaction = BalanceTransaction(
-        balance_id=balance.id,
-        amount=request.amount,
+    await ledger.post_entry(
+        db, balance, request.amount,
         description=request.description or f"Пополнение разовых выносов администратором (+{request.amount})",
-        order_id=None,
+        credit_type=ledger.SINGLE_CREDITS,
     )
-    db.add(transaction)
     
     await db.commit()
     await db.refresh(balance)
     
-    print(f"[ADMIN ADD SINGLE CREDITS] New balance (after commit): {balance.single_credits}")
+    log.info("Single credits for user %s: %s + %s = %s", client.id, old_balance, request.amount, balance.single_credits)
     
     return {
         "status": "ok", 
@@ -573,8 +520,8 @@ async def reset_all_balances(
     from sqlalchemy import text
     
     try:
-        # Reset all balances to 0
-        await db.execute(text("UPDATE balances SET credits = 0"))
+        # Reset all balances to 0 (through the ledger, one offsetting entry per balance)
+        await ledger.reset_all(db, ledger.CREDITS, "Обнуление баланса администратором")
         await db.commit()
         
         # Get count of affected users
@@ -615,10 +562,39 @@ async def run_scheduler():
         )
 
 
+# ================== NOTIFICATIONS ==================
+
+@router.get("/notifications/stats")
+async def get_notification_stats():
+    """Background notification queue, per-job counts, delivery results, blocked recipients and SSE subscribers"""
+    return {**dispatcher.stats(), "recipients": recipients.stats(), "events": events.bus.stats()}
+
+
+# ================== SQL PROFILE ==================
+
+def _sql_profile_enabled():
+    # Statement texts and route timings are not for everyone: off unless profiling is on
+    if not settings.SQL_PROFILE_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="SQL profiling is disabled")
+
+
+@router.get("/sql-profile", dependencies=[Depends(_sql_profile_enabled), Depends(get_admin_user)])
+async def get_sql_profile(limit: int = 20, order: str = "total"):
+    """Top SQL statements by total time (or calls/max/mean), N+1 suspects and statement budget violations"""
+    return sql_profile.top(min(limit, 200), order)
+
+
+@router.delete("/sql-profile", dependencies=[Depends(_sql_profile_enabled), Depends(get_admin_user)])
+async def reset_sql_profile():
+    """Start a fresh measurement window"""
+    sql_profile.reset()
+    return {"status": "ok"}
+
+
 # ============ TARIFF PRICES MANAGEMENT ============
 
 @router.get("/tariffs")
-async def get_tariffs(db: AsyncSession = Depends(get_db)):
+async def get_tariffs(db: AsyncSession = Depends(get_read_db)):
     """Get all tariff prices"""
     result = await db.execute(select(TariffPrice).order_by(TariffPrice.id))
     tariffs = result.scalars().all()
@@ -645,8 +621,6 @@ async def update_tariff(
     """Update tariff price and details"""
     from sqlalchemy import text
     
-    print(f"[ADMIN] Updating tariff {tariff_id} with data: {request.model_dump()}")
-    
     # Build SET clause
     set_parts = []
     params = {"tariff_id": tariff_id}
@@ -657,7 +631,6 @@ async def update_tariff(
     if request.price is not None:
         set_parts.append("price = :price")
         params["price"] = request.price
-        print(f"[ADMIN] Setting price to {request.price}")
     if request.old_price is not None:
         set_parts.append("old_price = :old_price")
         params["old_price"] = request.old_price
@@ -679,14 +652,12 @@ async def update_tariff(
     
     # Raw SQL UPDATE
     sql = f"UPDATE tariff_prices SET {', '.join(set_parts)} WHERE tariff_id = :tariff_id"
-    print(f"[ADMIN] Executing SQL: {sql}")
-    print(f"[ADMIN] With params: {params}")
-    
     # Just execute normally - NullPool handles connection issues
     await db.execute(text(sql), params)
     await db.commit()
+    tariff_cache.invalidate()
     
-    print(f"[ADMIN] UPDATE executed!")
+    log.info("Tariff %s updated: %s", tariff_id, params)
     
     # Verify with SELECT in NEW session
     from app.models import async_session
@@ -699,8 +670,6 @@ async def update_tariff(
     if not row:
         raise HTTPException(status_code=404, detail="Tariff not found after update")
     
-    print(f"[ADMIN] Verified in NEW session: tariff_id={row[1]}, price={row[3]}")
-    
     return {
         "status": "ok",
         "tariff": {
@@ -4,11 +4,13 @@ from sqlalchemy import select
 from pydantic import BaseModel
 from typing import Optional
 
-from app.models import get_db, User, Balance, Order
-from sqlalchemy import func
+from app.models import get_db, User, Balance, replicas
+from app.logging_config import get_logger
 from app.services.auth import create_access_token, verify_telegram_data
+from app.services.sql_profile import statement_budget
 
 router = APIRouter()
+log = get_logger("AUTH")
 
 
 class TelegramAuthRequest(BaseModel):
@@ -31,6 +33,7 @@ class AuthResponse(BaseModel):
 
 
 @router.post("/telegram", response_model=AuthResponse)
+@statement_budget(2)
 async def telegram_auth(
     request: TelegramAuthRequest,
     db: AsyncSession = Depends(get_db)
@@ -41,7 +44,8 @@ async def telegram_auth(
     # Verify Telegram init data
     telegram_data = verify_telegram_data(request.init_data)
     if not telegram_data:
-        print(f"Telegram Auth Failed: Invalid data. Init data: {request.init_data}")
+        # init_data carries the user's profile and a replayable signature: never log it
+        log.warning("Telegram Auth Failed: Invalid data (%d bytes)", len(request.init_data))
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid Telegram data"
@@ -78,17 +82,16 @@ async def telegram_auth(
         db.add(balance)
         await db.commit()
         await db.refresh(user)
+        # A replica may not have the new user yet
+        replicas.pin_to_primary(user.id)
     else:
         # Update username if changed
         if username and user.username != username:
             user.username = username
             await db.commit()
     
-    # Count user's orders to determine if they are new
-    result = await db.execute(
-        select(func.count(Order.id)).where(Order.user_id == user.id)
-    )
-    orders_count = result.scalar() or 0
+    # Denormalized counter - no extra query needed
+    orders_count = user.orders_count or 0
     
     # Create access token
     access_token = create_access_token(data={"sub": str(user.id)})
@@ -158,18 +161,18 @@ async def telegram_contact_auth(
         db.add(balance)
         await db.commit()
         await db.refresh(user)
+        # A replica may not have the new user yet
+        replicas.pin_to_primary(user.id)
     else:
         # Update existing user's phone
         user.phone = phone
         user.name = request.first_name + (f" {request.last_name}" if request.last_name else "")
         await db.commit()
         await db.refresh(user)
+        replicas.pin_to_primary(user.id)
     
-    # Count user's orders to determine if they are new
-    result = await db.execute(
-        select(func.count(Order.id)).where(Order.user_id == user.id)
-    )
-    orders_count = result.scalar() or 0
+    # Denormalized counter - no extra query needed
+    orders_count = user.orders_count or 0
     
     # Create access token
     access_token = create_access_token(data={"sub": str(user.id)})
@@ -1,266 +1,134 @@
-from fastapi import APIRouter, Request, Depends
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.config import settings
-from app.models import get_db, User, Balance
-import httpx
-import asyncio
+from app.logging_config import get_logger
+from app.models import async_session, User, Balance
+from app.services.worker_pool import KeyedWorkerPool
+from app.services import telegram_api, telegram_media, tariff_cache, recipients
+import json
 
 router = APIRouter()
+log = get_logger("BOT")
+webhook_log = get_logger("WEBHOOK")
 
 async def send_telegram_message(chat_id: int, text: str, keyboard: dict = None):
-    token = settings.TELEGRAM_BOT_TOKEN
-    print(f"[BOT] Sending message to {chat_id}, token exists: {bool(token)}")
+    payload = {
+        "chat_id": chat_id,
+        "text": text,
+        "parse_mode": "Markdown",
+    }
+    if keyboard:
+        payload["reply_markup"] = keyboard
     
-    if not token:
-        print("[BOT ERROR] TELEGRAM_BOT_TOKEN is not set!")
-        return
-    
-    async with httpx.AsyncClient() as client:
-        url = f"https://api.telegram.org/bot{token}/sendMessage"
-        payload = {
-            "chat_id": chat_id,
-            "text": text,
-            "parse_mode": "Markdown",
-        }
-        if keyboard:
-            payload["reply_markup"] = keyboard
-        
-        try:
-            response = await client.post(url, json=payload)
-            print(f"[BOT] Telegram API response: {response.status_code} - {response.text}")
-        except Exception as e:
-            print(f"[BOT ERROR] Failed to send message: {e}")
+    data = await telegram_api.call("sendMessage", payload)
+    if data and data.get("ok"):
+        log.debug("Message sent to %s", chat_id)
 
 
 async def answer_callback_query(callback_query_id: str):
     """Answer callback query to remove loading state"""
-    token = settings.TELEGRAM_BOT_TOKEN
-    if not token:
-        return
-    
-    try:
-        async with httpx.AsyncClient() as client:
-            url = f"https://api.telegram.org/bot{token}/answerCallbackQuery"
-            payload = {"callback_query_id": callback_query_id}
-            await client.post(url, json=payload)
-    except Exception as e:
-        print(f"[BOT ERROR] Failed to answer callback query: {e}")
-
-
-async def send_telegram_photo(chat_id: int, photo_url: str, caption: str = None, keyboard: dict = None):
-    """Send a photo with optional caption and keyboard"""
-    token = settings.TELEGRAM_BOT_TOKEN
-    print(f"[BOT] Sending photo to {chat_id}")
-    
-    if not token:
-        print("[BOT ERROR] TELEGRAM_BOT_TOKEN is not set!")
-        return
-    
-    async with httpx.AsyncClient() as client:
-        url = f"https://api.telegram.org/bot{token}/sendPhoto"
-        payload = {
-            "chat_id": chat_id,
-            "photo": photo_url,
-        }
-        if caption:
-            payload["caption"] = caption
-            payload["parse_mode"] = "Markdown"
-        if keyboard:
-            payload["reply_markup"] = keyboard
-        
-        try:
-            response = await client.post(url, json=payload)
-            print(f"[BOT] Photo sent: {response.status_code}")
-        except Exception as e:
-            print(f"[BOT ERROR] Failed to send photo: {e}")
+    await telegram_api.call("answerCallbackQuery", {"callback_query_id": callback_query_id})
+
+
+async def send_telegram_photo(chat_id: int, photo: str, caption: str = None, keyboard: dict = None):
+    """Send a registered photo asset (see telegram_media.ASSETS) with optional caption and keyboard"""
+    data = await telegram_media.send_photo(chat_id, photo, caption=caption, keyboard=keyboard)
+    if data and data.get("ok"):
+        log.debug("Photo '%s' sent to %s", photo, chat_id)
+
+
+# 3 onboarding photos with captions
+WELCOME_SLIDES = [
+    ("welcome_1", "**1️⃣ Оставьте у двери**\n\nПросто выставьте пакет за дверь. Никаких лишних действий."),
+    ("welcome_2", "**2️⃣ Курьер заберет**\n\nКурьер придёт в выбранное время и заберёт мусор."),
+    ("welcome_3", "**3️⃣ Забудьте о мусоре**\n\nПодписка работает автоматически. Вы просто живете."),
+]
 
 
 async def send_welcome_slides(chat_id: int):
-    """Send 3 onboarding slides for new users"""
-    token = settings.TELEGRAM_BOT_TOKEN
-    if not token:
-        print("[BOT ERROR] TELEGRAM_BOT_TOKEN is not set!")
-        return
+    """Send 3 onboarding slides for new users as one album"""
+    messages = await telegram_media.send_media_group(chat_id, WELCOME_SLIDES)
+    log.debug("Welcome slides sent to %s: %d", chat_id, len(messages))
+
+def _update_chat_id(data: dict):
+    """Chat the update belongs to (ordering key for the worker pool)"""
+    if "callback_query" in data:
+        return data["callback_query"].get("message", {}).get("chat", {}).get("id")
+    if "message" in data:
+        return data["message"].get("chat", {}).get("id")
+    return data.get("update_id")
+
+
+async def process_update(data: dict):
+    """Worker entry point: handle one update in its own DB session"""
+    if settings.CLIENT_BOT_RECORD_UPDATES:
+        with open(settings.CLIENT_BOT_RECORD_UPDATES, "a", encoding="utf-8") as f:
+            f.write(json.dumps(data, ensure_ascii=False) + "\n")
     
-    # 3 onboarding photos with captions
-    slides = [
-        {
-            "url": "https://i.ibb.co/Dz8JQdc/11111111.jpg",
-            "caption": "**1️⃣ Оставьте у двери**\n\nПросто выставьте пакет за дверь. Никаких лишних действий."
-        },
-        {
-            "url": "https://i.ibb.co/5vRX8Sq/22222222.jpg",
-            "caption": "**2️⃣ Курьер заберет**\n\nКурьер придёт в выбранное время и заберёт мусор."
-        },
-        {
-            "url": "https://i.ibb.co/SXgzwmn/333333333.jpg",
-            "caption": "**3️⃣ Забудьте о мусоре**\n\nПодписка работает автоматически. Вы просто живете."
-        }
-    ]
+    # The chat is talking to the bot, so notifications to it can resume
+    recipients.mark_active("client", _update_chat_id(data))
     
-    async with httpx.AsyncClient() as client:
-        for slide in slides:
-            url = f"https://api.telegram.org/bot{token}/sendPhoto"
-            payload = {
-                "chat_id": chat_id,
-                "photo": slide["url"],
-                "caption": slide["caption"],
-                "parse_mode": "Markdown"
-            }
-            
-            try:
-                response = await client.post(url, json=payload)
-                print(f"[BOT] Slide sent: {response.status_code}")
-                # Small delay between slides
-                await asyncio.sleep(0.5)
-            except Exception as e:
-                print(f"[BOT ERROR] Failed to send slide: {e}")
+    async with async_session() as db:
+        try:
+            await handle_update(data, db)
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+
+
+# Updates are processed off the request path; same chat = same worker = in order
+update_queue = KeyedWorkerPool(
+    "CLIENT_BOT",
+    process_update,
+    workers=settings.CLIENT_BOT_WORKERS,
+    maxsize=settings.CLIENT_BOT_QUEUE_SIZE,
+)
+
 
 @router.post("/webhook")
-async def telegram_webhook(request: Request, db: AsyncSession = Depends(get_db)):
+async def telegram_webhook(request: Request):
+    """
+    Enqueue the update and answer Telegram immediately.
+    When the queue is full we return 503 so Telegram redelivers later.
+    """
     data = await request.json()
-    print(f"[WEBHOOK] Received: {data}")
     
-    # Handle callback queries (button clicks)
-    if "callback_query" in data:
-        callback = data["callback_query"]
-        chat_id = callback["message"]["chat"]["id"]
-        callback_data = callback.get("data", "")
-        callback_id = callback.get("id")
-        
-        print(f"[WEBHOOK] Callback query from {chat_id}, data: {callback_data}")
-        
-        # Answer callback query to remove loading state
-        if callback_id:
-            await answer_callback_query(callback_id)
-        
-        if callback_data == "help":
-            help_text = """❓ **Помощь**
+    if not update_queue.submit(_update_chat_id(data), data):
+        return JSONResponse(status_code=503, content={"status": "busy"})
+    
+    return {"status": "ok"}
 
-**Как это работает:**
-1️⃣ Купите пакет выносов
-2️⃣ Оформите заказ на удобное время
-3️⃣ Выставьте мешок у двери
-4️⃣ Курьер заберёт в нужный слот
 
-**Слоты времени:**
-🌅 08:00 — 10:00 (Утро)
-☀️ 12:00 — 14:00 (День)
-🌆 16:00 — 18:00 (Вечер)
-🌙 20:00 — 22:00 (Ночь)
-
-**Тарифы:**
-• Разовый: 300 ₽
-• Пробный (3 шт): 500 ₽
-• Стандарт (15 шт): 3000 ₽
-• Премиум (30 шт): 5000 ₽
-• Срочный (час): 450 ₽"""
-            
-            keyboard = {
-                "inline_keyboard": [[
-                    {"text": "🏠 Главное меню", "callback_data": "menu"}
-                ]]
-            }
-            await send_telegram_message(chat_id, help_text, keyboard)
-            
-        elif callback_data == "support":
-            support_text = """💬 **Поддержка**
+@router.get("/queue-stats")
+async def get_queue_stats():
+    """Backpressure metrics of the update worker pool"""
+    return update_queue.stats()
 
-⏰ Работаем: 9:00 — 21:00
 
-**Срочные вопросы:**
-• Курьер не приехал
-• Проблема с оплатой
-• Неправильный адрес
-• Жалоба на сервис
+# ============== PRECOMPILED RESPONSES ==============
+# Static replies are serialized once at import; only chat_id is spliced in per send.
 
-📩 Нажмите кнопку ниже, чтобы написать нам!
-Ответим за 15 минут!"""
-            
-            keyboard = {
-                "inline_keyboard": [
-                    [
-                        {"text": "💬 Написать в поддержку", "url": "https://t.me/yauberuhelp"}
-                    ],
-                    [
-                        {"text": "🏠 Главное меню", "callback_data": "menu"}
-                    ]
-                ]
-            }
-            await send_telegram_message(chat_id, support_text, keyboard)
-            
-        elif callback_data == "menu":
-            # Показываем главное меню снова с фото
-            telegram_user_id = callback["from"]["id"]
-            result = await db.execute(
-                select(User).where(User.telegram_id == telegram_user_id)
-            )
-            user = result.scalar_one_or_none()
-            
-            if user:
-                frontend_url = settings.FRONTEND_URL
-                balance_result = await db.execute(select(Balance).where(Balance.user_id == user.id))
-                balance = balance_result.scalar_one_or_none()
-                credits = balance.credits if balance else 0
-                
-                # Проверяем, админ ли пользователь
-                is_admin = telegram_user_id in settings.admin_ids
-                
-                keyboard = {
-                    "inline_keyboard": [
-                        [
-                            {
-                                "text": "🚀 Заказать вынос",
-                                "web_app": {"url": f"{frontend_url}/app"}
-                            }
-                        ],
-                        [
-                            {
-                                "text": "📦 Мои заказы",
-                                "web_app": {"url": f"{frontend_url}/app/orders"}
-                            }
-                        ],
-                        [
-                            {"text": "💬 Поддержка", "callback_data": "support"}
-                        ]
-                    ]
-                }
-                
-                # Добавляем кнопку админ-панели для админов
-                if is_admin:
-                    keyboard["inline_keyboard"].append([
-                        {
-                            "text": "👑 Админ-панель",
-                            "web_app": {"url": f"{frontend_url}/admin"}
-                        }
-                    ])
-                
-                caption = f"""👤 **{user.name}**
-💼 Баланс: **{credits} выносов**
+def _prepare_message(text: str, keyboard: dict = None) -> bytes:
+    """sendMessage body without chat_id, as JSON bytes"""
+    payload = {"text": text, "parse_mode": "Markdown"}
+    if keyboard:
+        payload["reply_markup"] = keyboard
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+async def send_prepared(chat_id: int, body: bytes):
+    """Send a message prepared by _prepare_message"""
+    data = await telegram_api.call("sendMessage", content=b'{"chat_id":%d,' % chat_id + body[1:])
+    if data and data.get("ok"):
+        log.debug("Message sent to %s", chat_id)
 
-Выберите действие 👇"""
-                
-                # Отправляем фото с меню
-                await send_telegram_photo(
-                    chat_id,
-                    photo_url="https://i.ibb.co/5WLCg2CG/22222222.jpg",
-                    caption=caption,
-                    keyboard=keyboard
-                )
-        
-        return {"status": "ok"}
-    
-    if "message" in data:
-        message = data["message"]
-        chat_id = message["chat"]["id"]
-        text = message.get("text", "")
-        telegram_user_id = message.get("from", {}).get("id")
-        print(f"[WEBHOOK] Processing message from {telegram_user_id}, text: {text}")
-        
-        # Команды
-        if text == "/help":
-            help_text = """❓ **Помощь**
+
+MAIN_MENU_BUTTON = {"inline_keyboard": [[{"text": "🏠 Главное меню", "callback_data": "menu"}]]}
+
+HELP_TEXT = """❓ **Помощь**
 
 **Как это работает:**
 1️⃣ Купите пакет выносов
@@ -272,25 +140,10 @@ async def telegram_webhook(request: Request, db: AsyncSession = Depends(get_db))
 🌅 08:00 — 10:00 (Утро)
 ☀️ 12:00 — 14:00 (День)
 🌆 16:00 — 18:00 (Вечер)
-🌙 20:00 — 22:00 (Ночь)
-
-**Тарифы:**
-• Разовый: 300 ₽
-• Пробный (3 шт): 500 ₽
-• Стандарт (15 шт): 3000 ₽
-• Премиум (30 шт): 5000 ₽
-• Срочный (час): 450 ₽"""
-            
-            keyboard = {
-                "inline_keyboard": [[
-                    {"text": "🏠 Главное меню", "callback_data": "menu"}
-                ]]
-            }
-            await send_telegram_message(chat_id, help_text, keyboard)
-            return {"status": "ok"}
-        
-        elif text == "/support":
-            support_text = """💬 **Поддержка**
+🌙 20:00 — 22:00 (Ночь)"""
+
+SUPPORT_RESPONSE = _prepare_message(
+    """💬 **Поддержка**
 
 ⏰ Работаем: 9:00 — 21:00
 
@@ -301,160 +154,17 @@ async def telegram_webhook(request: Request, db: AsyncSession = Depends(get_db))
 • Жалоба на сервис
 
 📩 Нажмите кнопку ниже, чтобы написать нам!
-Ответим за 15 минут!"""
-            
-            keyboard = {
-                "inline_keyboard": [
-                    [
-                        {"text": "💬 Написать в поддержку", "url": "https://t.me/yauberuhelp"}
-                    ],
-                    [
-                        {"text": "🏠 Главное меню", "callback_data": "menu"}
-                    ]
-                ]
-            }
-            await send_telegram_message(chat_id, support_text, keyboard)
-            return {"status": "ok"}
-        
-        elif text == "/menu":
-            result = await db.execute(select(User).where(User.telegram_id == telegram_user_id))
-            user = result.scalar_one_or_none()
-            
-            if user:
-                frontend_url = settings.FRONTEND_URL
-                balance_result = await db.execute(select(Balance).where(Balance.user_id == user.id))
-                balance = balance_result.scalar_one_or_none()
-                credits = balance.credits if balance else 0
-                
-                # Проверяем, админ ли пользователь
-                is_admin = telegram_user_id in settings.admin_ids
-                
-                keyboard = {
-                    "inline_keyboard": [
-                        [
-                            {
-                                "text": "🚀 Заказать вынос",
-                                "web_app": {"url": f"{frontend_url}/app"}
-                            }
-                        ],
-                        [
-                            {
-                                "text": "📦 Мои заказы",
-                                "web_app": {"url": f"{frontend_url}/app/orders"}
-                            }
-                        ],
-                        [
-                            {"text": "💬 Поддержка", "callback_data": "support"}
-                        ]
-                    ]
-                }
-                
-                # Добавляем кнопку админ-панели для админов
-                if is_admin:
-                    keyboard["inline_keyboard"].append([
-                        {
-                            "text": "👑 Админ-панель",
-                            "web_app": {"url": f"{frontend_url}/admin"}
-                        }
-                    ])
-                
-                caption = f"""👤 **{user.name}**
-💼 Баланс: **{credits} выносов**
+Ответим за 15 минут!""",
+    {
+        "inline_keyboard": [
+            [{"text": "💬 Написать в поддержку", "url": "https://t.me/yauberuhelp"}],
+            [{"text": "🏠 Главное меню", "callback_data": "menu"}],
+        ]
+    },
+)
 
-Выберите действие 👇"""
-                
-                # Отправляем фото с меню
-                await send_telegram_photo(
-                    chat_id,
-                    photo_url="https://i.ibb.co/5WLCg2CG/22222222.jpg",
-                    caption=caption,
-                    keyboard=keyboard
-                )
-            return {"status": "ok"}
-        
-        # Логика 1: Пользователь нажал /start
-        elif text == "/start" or text == "/start auth":
-            # Проверяем, есть ли у пользователя РЕАЛЬНЫЙ телефон в БД
-            result = await db.execute(select(User).where(User.telegram_id == telegram_user_id))
-            user = result.scalar_one_or_none()
-            
-            # Считаем телефон реальным, если он есть и НЕ начинается с +7999 (мок)
-            has_real_phone = user and user.phone and not user.phone.startswith("+7999")
-            
-            print(f"[WEBHOOK] User exists: {bool(user)}, phone: {user.phone if user else None}, has_real_phone: {has_real_phone}")
-            
-            if has_real_phone:
-                # Уже зарегистрирован с реальным телефоном, даем полное меню
-                frontend_url = settings.FRONTEND_URL
-                
-                # Получаем баланс пользователя
-                balance_result = await db.execute(select(Balance).where(Balance.user_id == user.id))
-                balance = balance_result.scalar_one_or_none()
-                credits = balance.credits if balance else 0
-                
-                # Проверяем, админ ли пользователь
-                is_admin = telegram_user_id in settings.admin_ids
-                
-                keyboard = {
-                    "inline_keyboard": [
-                        [
-                            {
-                                "text": "🚀 Заказать вынос",
-                                "web_app": {"url": f"{frontend_url}/app"}
-                            }
-                        ],
-                        [
-                            {
-                                "text": "📦 Мои заказы",
-                                "web_app": {"url": f"{frontend_url}/app/orders"}
-                            }
-                        ],
-                        [
-                            {"text": "💬 Поддержка", "callback_data": "support"}
-                        ]
-                    ]
-                }
-                
-                # Добавляем кнопку админ-панели для админов
-                if is_admin:
-                    keyboard["inline_keyboard"].append([
-                        {
-                            "text": "👑 Админ-панель",
-                            "web_app": {"url": f"{frontend_url}/admin"}
-                        }
-                    ])
-                
-                # Отправляем фото с приветствием
-                caption = f"""👋 **С возвращением, {user.name}!**
-
-💼 Баланс: **{credits} выносов**
-
-Выберите действие 👇"""
-                
-                await send_telegram_photo(
-                    chat_id,
-                    photo_url="https://i.ibb.co/5WLCg2CG/22222222.jpg",
-                    caption=caption,
-                    keyboard=keyboard
-                )
-            else:
-                # Новый пользователь или без реального телефона
-                # Отправляем 3 слайда-приветствия
-                await send_welcome_slides(chat_id)
-                
-                # Затем просим контакт
-                keyboard = {
-                    "keyboard": [[
-                        {
-                            "text": "📱 Поделиться телефоном",
-                            "request_contact": True
-                        }
-                    ]],
-                    "resize_keyboard": True,
-                    "one_time_keyboard": True
-                }
-                
-                welcome_text = """👋 **Привет! Это сервис «Я УБЕРУ»**
+WELCOME_RESPONSE = _prepare_message(
+    """👋 **Привет! Это сервис «Я УБЕРУ»**
 
 Я выношу ваш бытовой мусор в удобное для вас время — по подписке или разово.
 
@@ -464,68 +174,208 @@ async def telegram_webhook(request: Request, db: AsyncSession = Depends(get_db))
 • Заказать разовый вынос
 • Отслеживать статус услуги
 
-👉 Чтобы начать, поделитесь номером телефона 👇"""
-                
-                await send_telegram_message(chat_id, welcome_text, keyboard)
-            
-        # Логика 2: Пользователь отправил контакт
+👉 Чтобы начать, поделитесь номером телефона 👇""",
+    {
+        "keyboard": [[{"text": "📱 Поделиться телефоном", "request_contact": True}]],
+        "resize_keyboard": True,
+        "one_time_keyboard": True,
+    },
+)
+
+PHONE_SAVED_RESPONSE = _prepare_message("✅ **Спасибо! Ваш номер сохранен.**", {"remove_keyboard": True})
+
+OPEN_APP_RESPONSE = _prepare_message(
+    "Теперь вы можете войти в приложение и оформить вывоз мусора 🗑️✨",
+    {"inline_keyboard": [[{"text": "🚀 Открыть приложение", "web_app": {"url": settings.FRONTEND_URL}}]]},
+)
+
+MENU_KEYBOARD = {
+    "inline_keyboard": [
+        [{"text": "🚀 Заказать вынос", "web_app": {"url": f"{settings.FRONTEND_URL}/app"}}],
+        [{"text": "📦 Мои заказы", "web_app": {"url": f"{settings.FRONTEND_URL}/app/orders"}}],
+        [{"text": "💬 Поддержка", "callback_data": "support"}],
+    ]
+}
+
+# Админам добавляем кнопку админ-панели
+ADMIN_MENU_KEYBOARD = {
+    "inline_keyboard": MENU_KEYBOARD["inline_keyboard"] + [
+        [{"text": "👑 Админ-панель", "web_app": {"url": f"{settings.FRONTEND_URL}/admin"}}]
+    ]
+}
+
+# Help text depends on prices: (tariff_cache.version, prepared body)
+_help_response = (None, None)
+
+
+def _render_tariffs(tariffs) -> str:
+    lines = ["**Тарифы:**"]
+    for t in tariffs:
+        period = f" ({t.period})" if t.period else ""
+        lines.append(f"• {t.name}{period}: {t.price} ₽")
+        # Для разового old_price — цена срочного выноса (см. payments.create_payment)
+        if t.tariff_id == "single" and t.old_price:
+            lines.append(f"• Срочный (час): {t.old_price} ₽")
+    return "\n".join(lines)
+
+
+async def get_help_response(db: AsyncSession) -> bytes:
+    global _help_response
+    tariffs = await tariff_cache.get_tariffs(db)
+    if _help_response[0] != tariff_cache.version:
+        text = HELP_TEXT + ("\n\n" + _render_tariffs(tariffs) if tariffs else "")
+        _help_response = (tariff_cache.version, _prepare_message(text, MAIN_MENU_BUTTON))
+    return _help_response[1]
+
+
+# ============== HANDLERS ==============
+# All handlers take (chat_id, telegram_user_id, arg, db); `arg` is the text after
+# the command ("/start auth" -> "auth") or after "prefix:" in callback_data.
+
+async def _load_user_with_credits(db: AsyncSession, telegram_user_id: int):
+    result = await db.execute(
+        select(User, Balance.credits)
+        .outerjoin(Balance, Balance.user_id == User.id)
+        .where(User.telegram_id == telegram_user_id)
+    )
+    row = result.first()
+    return (row[0], row[1] or 0) if row else (None, 0)
+
+
+async def send_menu(chat_id: int, telegram_user_id: int, user: User, credits: int, greeting: str = None):
+    """Главное меню с фото"""
+    header = greeting or f"👤 **{user.name}**"
+    separator = "\n\n" if greeting else "\n"
+    caption = f"""{header}{separator}💼 Баланс: **{credits} выносов**
+
+Выберите действие 👇"""
+    
+    keyboard = ADMIN_MENU_KEYBOARD if recipients.is_admin(telegram_user_id) else MENU_KEYBOARD
+    await send_telegram_photo(chat_id, photo="menu", caption=caption, keyboard=keyboard)
+
+
+async def on_help(chat_id: int, telegram_user_id: int, arg: str, db: AsyncSession):
+    await send_prepared(chat_id, await get_help_response(db))
+
+
+async def on_support(chat_id: int, telegram_user_id: int, arg: str, db: AsyncSession):
+    await send_prepared(chat_id, SUPPORT_RESPONSE)
+
+
+async def on_menu(chat_id: int, telegram_user_id: int, arg: str, db: AsyncSession):
+    user, credits = await _load_user_with_credits(db, telegram_user_id)
+    if user:
+        await send_menu(chat_id, telegram_user_id, user, credits)
+
+
+async def on_start(chat_id: int, telegram_user_id: int, arg: str, db: AsyncSession):
+    # Проверяем, есть ли у пользователя РЕАЛЬНЫЙ телефон в БД
+    user, credits = await _load_user_with_credits(db, telegram_user_id)
+    
+    # Считаем телефон реальным, если он есть и НЕ начинается с +7999 (мок)
+    has_real_phone = user and user.phone and not user.phone.startswith("+7999")
+    
+    webhook_log.debug("/start: user exists: %s, has_real_phone: %s", bool(user), bool(has_real_phone))
+    
+    if has_real_phone:
+        # Уже зарегистрирован с реальным телефоном, даем полное меню
+        await send_menu(chat_id, telegram_user_id, user, credits, greeting=f"👋 **С возвращением, {user.name}!**")
+    else:
+        # Новый пользователь или без реального телефона:
+        # 3 слайда-приветствия, затем просим контакт
+        await send_welcome_slides(chat_id)
+        await send_prepared(chat_id, WELCOME_RESPONSE)
+
+
+async def on_contact(chat_id: int, contact: dict, db: AsyncSession):
+    phone = contact.get("phone_number")
+    user_id = contact.get("user_id")
+    first_name = contact.get("first_name", "User")
+    last_name = contact.get("last_name", "")
+    
+    # Если телефон без плюса, добавим
+    if phone and not phone.startswith("+"):
+        phone = f"+{phone}"
+
+    # Ищем пользователя или создаем
+    result = await db.execute(select(User).where(User.telegram_id == user_id))
+    user = result.scalar_one_or_none()
+    
+    full_name = first_name + (f" {last_name}" if last_name else "")
+    
+    if user:
+        # Обновляем телефон
+        user.phone = phone
+        user.name = full_name
+    else:
+        # Создаем нового
+        user = User(
+            telegram_id=user_id,
+            name=full_name,
+            phone=phone
+        )
+        db.add(user)
+        await db.flush()
+        
+        # Даем приветственные бонусы
+        balance = Balance(user_id=user.id, credits=0)
+        db.add(balance)
+    
+    await db.commit()
+    
+    # Убираем клавиатуру и даем кнопку входа в Web App
+    await send_prepared(chat_id, PHONE_SAVED_RESPONSE)
+    await send_prepared(chat_id, OPEN_APP_RESPONSE)
+
+
+# callback_data prefix (before ":") -> handler
+CALLBACK_HANDLERS = {
+    "help": on_help,
+    "support": on_support,
+    "menu": on_menu,
+}
+
+# Whole message text -> handler; only these exact forms are commands
+COMMAND_HANDLERS = {
+    "/help": on_help,
+    "/support": on_support,
+    "/menu": on_menu,
+    "/start": on_start,
+    "/start auth": on_start,
+}
+
+
+async def handle_update(data: dict, db: AsyncSession):
+    # Handle callback queries (button clicks)
+    if "callback_query" in data:
+        callback = data["callback_query"]
+        chat_id = callback["message"]["chat"]["id"]
+        callback_data = callback.get("data", "")
+        callback_id = callback.get("id")
+        
+        webhook_log.debug("Callback query from %s: %s", chat_id, callback_data.partition(":")[0])
+        
+        # Answer callback query to remove loading state
+        if callback_id:
+            await answer_callback_query(callback_id)
+        
+        prefix, _, arg = callback_data.partition(":")
+        handler = CALLBACK_HANDLERS.get(prefix)
+        if handler:
+            await handler(chat_id, callback["from"]["id"], arg, db)
+        return
+    
+    if "message" in data:
+        message = data["message"]
+        chat_id = message["chat"]["id"]
+        text = message.get("text", "")
+        telegram_user_id = message.get("from", {}).get("id")
+        # Free text may be a phone number or an address: log the command only
+        webhook_log.debug("Message from %s: %s", telegram_user_id,
+                          text.partition(" ")[0] if text.startswith("/") else f"<{len(text)} chars>")
+        
+        handler = COMMAND_HANDLERS.get(text)
+        if handler:
+            await handler(chat_id, telegram_user_id, text.partition(" ")[2], db)
         elif "contact" in message:
-            contact = message["contact"]
-            phone = contact.get("phone_number")
-            user_id = contact.get("user_id")
-            first_name = contact.get("first_name", "User")
-            last_name = contact.get("last_name", "")
-            
-            # Если телефон без плюса, добавим
-            if phone and not phone.startswith("+"):
-                phone = f"+{phone}"
-
-            # Ищем пользователя или создаем
-            result = await db.execute(select(User).where(User.telegram_id == user_id))
-            user = result.scalar_one_or_none()
-            
-            full_name = first_name + (f" {last_name}" if last_name else "")
-            
-            if user:
-                # Обновляем телефон
-                user.phone = phone
-                user.name = full_name
-            else:
-                # Создаем нового
-                user = User(
-                    telegram_id=user_id,
-                    name=full_name,
-                    phone=phone
-                )
-                db.add(user)
-                await db.flush()
-                
-                # Даем приветственные бонусы
-                balance = Balance(user_id=user.id, credits=0)
-                db.add(balance)
-            
-            await db.commit()
-            
-            # Отправляем ссылку на Web App
-            frontend_url = settings.FRONTEND_URL
-            
-            # Убираем клавиатуру и даем кнопку входа
-            remove_kb = {"remove_keyboard": True}
-            await send_telegram_message(chat_id, "✅ **Спасибо! Ваш номер сохранен.**", remove_kb)
-            
-            inline_keyboard = {
-                "inline_keyboard": [[
-                    {
-                        "text": "🚀 Открыть приложение",
-                        "web_app": {"url": frontend_url}
-                    }
-                ]]
-            }
-            
-            await send_telegram_message(
-                chat_id, 
-                "Теперь вы можете войти в приложение и оформить вывоз мусора 🗑️✨",
-                inline_keyboard
-            )
-            
-    return {"status": "ok"}
+            await on_contact(chat_id, message["contact"], db)
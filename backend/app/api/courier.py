@@ -1,24 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, WebSocket
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_, func, extract
 from typing import List, Dict, Any, Optional
+from collections import Counter
 from datetime import date, datetime, timedelta
 from pydantic import BaseModel
 
-from app.models import get_db, Order, OrderStatus, User, ResidentialComplex, Address, UserRole
-from app.services.notifications import notify_client_courier_took_order, notify_client_order_completed, notify_admins_courier_took_order, notify_admins_order_completed
+from app.models import get_db, get_read_db, async_session, Order, OrderStatus, User, UserRole
+from app.services import complex_catalog, courier_board, events, order_state
+from app.services.sql_profile import statement_budget
 from app.config import settings
+from app.logging_config import get_logger
 
 
 class TakeOrderRequest(BaseModel):
     courier_telegram_id: int
 
 router = APIRouter()
+log = get_logger("COURIER")
 
 
 # ================== COURIER CHECK ==================
 @router.get("/check/{telegram_id}")
-async def check_courier_status(telegram_id: int, db: AsyncSession = Depends(get_db)):
+async def check_courier_status(telegram_id: int, db: AsyncSession = Depends(get_read_db)):
     """Check if a telegram user is a registered courier"""
     
     result = await db.execute(
@@ -40,7 +46,7 @@ async def check_courier_status(telegram_id: int, db: AsyncSession = Depends(get_
 
 # ================== COURIER STATS ==================
 @router.get("/stats/{telegram_id}")
-async def get_courier_stats(telegram_id: int, db: AsyncSession = Depends(get_db)):
+async def get_courier_stats(telegram_id: int, db: AsyncSession = Depends(get_read_db)):
     """Get real statistics for a courier"""
     
     # Find courier
@@ -113,49 +119,30 @@ async def get_courier_stats(telegram_id: int, db: AsyncSession = Depends(get_db)
         "rating": 5.0  # TODO: implement rating system
     }
 
+
+def _manual_building(card: dict) -> str:
+    """Manual addresses are listed as "Street, Building" """
+    return f"{card['street'] or ''}, {card['building']}"
+
+
 @router.get("/complexes")
-async def get_complexes_with_orders(db: AsyncSession = Depends(get_db)):
+@statement_budget(3)  # Board and complex catalog (with buildings) on a cold cache
+async def get_complexes_with_orders(db: AsyncSession = Depends(get_read_db)):
     """Get complexes that have scheduled orders for today OR overdue"""
-    today = date.today()
+    # Active complexes come from the cached catalog, counts from the courier board
+    catalog = await complex_catalog.get_catalog(db)
+    board = await courier_board.get_board(db)
     
-    # Get all active complexes
-    result = await db.execute(select(ResidentialComplex).where(ResidentialComplex.is_active == True))
-    complexes = result.scalars().all()
+    counts = Counter(card["complex_id"] for card in board.cards.values())
     
-    response = []
-    for comp in complexes:
-        # Count scheduled orders for TODAY + OVERDUE (past dates)
-        result = await db.execute(
-            select(func.count(Order.id))
-            .join(Address, Order.address_id == Address.id)
-            .where(
-                and_(
-                    Address.complex_id == comp.id,
-                    Order.date <= today,  # Today OR past dates (overdue)
-                    Order.status.in_([OrderStatus.SCHEDULED, OrderStatus.IN_PROGRESS])
-                )
-            )
-        )
-        count = result.scalar() or 0
-        response.append({
-            "id": comp.id,
-            "name": comp.name,
-            "orders_count": count
-        })
+    response = [{
+        "id": comp["id"],
+        "name": comp["name"],
+        "orders_count": counts.get(comp["id"], 0)
+    } for comp in catalog.complexes if comp["is_active"]]
     
-    # Count orders with NO complex_id (Manual Addresses) for TODAY + OVERDUE
-    result = await db.execute(
-        select(func.count(Order.id))
-        .join(Address, Order.address_id == Address.id)
-        .where(
-            and_(
-                Address.complex_id.is_(None),
-                Order.date <= today,  # Today OR past dates (overdue)
-                Order.status.in_([OrderStatus.SCHEDULED, OrderStatus.IN_PROGRESS])
-            )
-        )
-    )
-    other_count = result.scalar() or 0
+    # complex_id 0 = manual addresses
+    other_count = counts.get(0, 0)
     
     if other_count > 0:
         response.append({
@@ -167,271 +154,137 @@ async def get_complexes_with_orders(db: AsyncSession = Depends(get_db)):
     return response
 
 @router.get("/buildings")
-async def get_buildings(complex_id: int, db: AsyncSession = Depends(get_db)):
+async def get_buildings(complex_id: int, db: AsyncSession = Depends(get_read_db)):
     """Get buildings in complex with orders for TODAY + OVERDUE"""
-    today = date.today()
+    board = await courier_board.get_board(db)
+    cards = [card for card in board.cards.values() if card["complex_id"] == complex_id]
     
     if complex_id == 0:
         # Manual addresses: return "Street, Building"
-        result = await db.execute(
-            select(Address.street, Address.building)
-            .join(Order, Order.address_id == Address.id)
-            .where(
-                and_(
-                    Address.complex_id.is_(None),
-                    Order.date <= today,  # Today OR past dates (overdue)
-                    Order.status.in_([OrderStatus.SCHEDULED, OrderStatus.IN_PROGRESS])
-                )
-            )
-            .distinct()
-        )
-        rows = result.all()
-        # Format: "Street, Building"
-        buildings = [f"{r.street or ''}, {r.building}" for r in rows]
-        return sorted(list(set(buildings)))
+        return sorted({_manual_building(card) for card in cards})
     
-    result = await db.execute(
-        select(Address.building)
-        .join(Order, Order.address_id == Address.id)
-        .where(
-            and_(
-                Address.complex_id == complex_id,
-                Order.date <= today,  # Today OR past dates (overdue)
-                Order.status.in_([OrderStatus.SCHEDULED, OrderStatus.IN_PROGRESS])
-            )
-        )
-        .distinct()
-    )
-    buildings = result.scalars().all()
-    return sorted(list(buildings))
+    return sorted({card["building"] for card in cards})
 
 @router.get("/orders")
-async def get_orders(complex_id: int, building: str, db: AsyncSession = Depends(get_db)):
+@statement_budget(1)  # Board on a cold cache
+async def get_orders(complex_id: int, building: str, db: AsyncSession = Depends(get_read_db)):
     """Get orders for specific building - today's + overdue orders"""
-    today = date.today()
+    board = await courier_board.get_board(db)
     
-    query = select(Order, Address, ResidentialComplex)\
-        .join(Address, Order.address_id == Address.id)\
-        .outerjoin(ResidentialComplex, Address.complex_id == ResidentialComplex.id)
-        
     if complex_id == 0:
-        # Manual address
-        # Parse "Street, Building"
-        if ", " in building:
-            street_val, building_val = building.rsplit(", ", 1)
-        else:
-            street_val = "" 
-            building_val = building
-            
-        query = query.where(
-            and_(
-                Address.complex_id.is_(None),
-                Address.street == street_val,
-                Address.building == building_val,
-                Order.date <= today,  # Today OR past dates (overdue)
-                Order.status.in_([OrderStatus.SCHEDULED, OrderStatus.IN_PROGRESS])
-            )
-        )
+        # Manual address: "Street, Building"
+        cards = [card for card in board.cards.values()
+                 if card["complex_id"] == 0 and _manual_building(card) == building]
     else:
-        query = query.where(
-            and_(
-                Address.complex_id == complex_id,
-                Address.building == building,
-                Order.date <= today,  # Today OR past dates (overdue)
-                Order.status.in_([OrderStatus.SCHEDULED, OrderStatus.IN_PROGRESS])
-            )
-        )
-        
-    result = await db.execute(query.order_by(Order.time_slot))
-    rows = result.all()
+        cards = [card for card in board.cards.values()
+                 if card["complex_id"] == complex_id and card["building"] == building]
     
-    response = []
-    for order, addr, complex_obj in rows:
-        # Build full address string
-        if complex_obj:
-            full_address = f"{complex_obj.name}, д. {addr.building}"
-            complex_name = complex_obj.name
-        else:
-            full_address = f"д. {addr.building}"
-            complex_name = "Другой адрес"
-        
-        # Get courier telegram_id if assigned
-        courier_telegram_id = None
-        if order.courier_id:
-            courier_result = await db.execute(select(User.telegram_id).where(User.id == order.courier_id))
-            courier_telegram_id = courier_result.scalar_one_or_none()
-        
-        # Check if order is overdue
-        is_overdue = order.date < today if order.date else False
-        
-        response.append({
-            "id": order.id,
-            "complex_name": complex_name,
-            "full_address": full_address,
-            "building": addr.building,
-            "entrance": addr.entrance,
-            "floor": addr.floor,
-            "apartment": addr.apartment,
-            "intercom": addr.intercom,
-            "date": order.date.strftime('%d.%m.%Y') if order.date else None,
-            "time_slot": order.time_slot,
-            "status": order.status.value,
-            "comment": order.comment,
-            "courier_telegram_id": courier_telegram_id,
-            "is_overdue": is_overdue  # Flag for overdue orders
-        })
-        
-    return response
+    return sorted(cards, key=lambda card: (card["time_slot"], card["id"]))
 
-@router.post("/orders/{order_id}/take")
-async def take_order(order_id: int, request: TakeOrderRequest, db: AsyncSession = Depends(get_db)):
-    # Get order
-    result = await db.execute(select(Order).where(Order.id == order_id))
-    order = result.scalar_one_or_none()
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
+@router.get("/board")
+async def get_board_snapshot(db: AsyncSession = Depends(get_read_db)):
+    """
+    The whole courier board (today's + overdue open orders) and active complexes,
+    for clients that keep a local mirror and follow /stream
+    """
+    catalog = await complex_catalog.get_catalog(db)
+    board = await courier_board.get_board(db)
+    return {
+        **board.snapshot(),
+        "complexes": [{"id": c["id"], "name": c["name"]} for c in catalog.complexes if c["is_active"]],
+    }
+
+@router.websocket("/stream")
+async def courier_board_stream(websocket: WebSocket):
+    """
+    Live courier board: {"type": "snapshot", ...board} first (same as GET /board),
+    then one message per change: {"type": "order.<event>", "order_id": ..., "card": {...} | null}.
+    A card of null means the order left the board. {"type": "ping"} is sent on idle.
+    A new snapshot is sent if this client fell behind.
+    """
+    await websocket.accept()
+    subscription = events.bus.subscribe(courier_board.TOPIC)
     
-    if order.status != OrderStatus.SCHEDULED:
-        raise HTTPException(status_code=400, detail="Order already taken")
+    async def send_snapshot():
+        async with async_session() as db:
+            snapshot = await get_board_snapshot(db)
+        await websocket.send_json({"type": "snapshot", **snapshot})
+    
+    async def forward():
+        try:
+            await send_snapshot()
+            while True:
+                event = await subscription.get(timeout=settings.EVENTS_HEARTBEAT_SECONDS)
+                if event is None:
+                    await websocket.send_json({"type": "ping"})
+                    continue
+                if subscription.lagged:
+                    subscription.lagged = False
+                    await send_snapshot()
+                    continue
+                await websocket.send_json({"type": f"order.{event['type']}", "version": courier_board.board.version, **event["data"]})
+        except Exception as e:
+            log.info("Closing stream: %s", e)
+            await websocket.close(code=1011)
     
+    sender = asyncio.create_task(forward())
+    try:
+        # Client messages are ignored; this returns as soon as the client goes away
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    finally:
+        sender.cancel()
+        subscription.close()
+
+@router.post("/orders/{order_id}/take")
+@statement_budget(3)
+async def take_order(order_id: int, request: TakeOrderRequest, db: AsyncSession = Depends(get_db)):
     # Get courier
-    result = await db.execute(select(User).where(User.telegram_id == request.courier_telegram_id))
-    courier = result.scalar_one_or_none()
+    result = await db.execute(select(User.id, User.name).where(User.telegram_id == request.courier_telegram_id))
+    courier = result.first()
     if not courier:
         raise HTTPException(status_code=404, detail="Courier not found")
     
-    # Assign courier and update status
-    order.courier_id = courier.id
-    order.status = OrderStatus.IN_PROGRESS
+    # Assign courier and update status (only one courier can win)
+    try:
+        taken = await order_state.transition(db, order_id, "take", values={"courier_id": courier.id})
+    except order_state.TransitionError as e:
+        if e.status is None:
+            raise HTTPException(status_code=404, detail="Order not found")
+        raise HTTPException(status_code=400, detail="Order already taken")
     await db.commit()
     
-    # Get address for notification
-    result = await db.execute(select(Address).where(Address.id == order.address_id))
-    addr = result.scalar_one_or_none()
-    address_str = ""
-    if addr:
-        if addr.complex_id:
-            result = await db.execute(select(ResidentialComplex).where(ResidentialComplex.id == addr.complex_id))
-            complex = result.scalar_one_or_none()
-            if complex:
-                address_str = f"{complex.name}, д. {addr.building}, кв. {addr.apartment}"
-            else:
-                address_str = f"д. {addr.building}, кв. {addr.apartment}"
-        else:
-            address_str = f"{addr.street}, д. {addr.building}, кв. {addr.apartment}"
-    
-    # === NOTIFY CLIENT ===
-    try:
-        # Get client
-        result = await db.execute(select(User).where(User.id == order.user_id))
-        client = result.scalar_one_or_none()
-        
-        if client and client.telegram_id:
-            time_slot_str = order.time_slot.value if hasattr(order.time_slot, 'value') else str(order.time_slot)
-            await notify_client_courier_took_order(
-                client_telegram_id=client.telegram_id,
-                courier_name=courier.name,
-                time_slot=time_slot_str
-            )
-    except Exception as e:
-        print(f"[NOTIFY ERROR] Failed to notify client: {e}")
-    
-    # === NOTIFY ADMINS ===
-    try:
-        await notify_admins_courier_took_order(
-            admin_telegram_ids=settings.admin_ids,
-            order_id=order.id,
-            courier_name=courier.name,
-            address=address_str
-        )
-    except Exception as e:
-        print(f"[NOTIFY ERROR] Failed to notify admins: {e}")
+    # Client and admins are notified in the background
+    await order_state.emit(db, taken)
     
     return {"status": "ok", "message": f"Заказ взят курьером {courier.name}"}
 
 @router.post("/orders/{order_id}/complete")
+@statement_budget(2)
 async def complete_order(order_id: int, bags_count: int, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Order).where(Order.id == order_id))
-    order = result.scalar_one_or_none()
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    # Get courier name for notifications
-    courier_name = "Курьер"
-    if order.courier_id:
-        result = await db.execute(select(User).where(User.id == order.courier_id))
-        courier = result.scalar_one_or_none()
-        if courier:
-            courier_name = courier.name
-    
-    # DEDUCT CREDIT FROM USER BALANCE (for subscription orders)
-    if order.is_subscription and order.subscription_id:
-        from app.models import Balance, BalanceTransaction, Subscription
-        
-        # Get user balance
-        balance_result = await db.execute(select(Balance).where(Balance.user_id == order.user_id))
-        balance = balance_result.scalar_one_or_none()
-        
-        if balance and balance.credits > 0:
-            balance.credits -= 1
-            
-            # Log transaction
-            transaction = BalanceTransaction(
-                balance_id=balance.id,
-                amount=-1,
-                description=f"Выполнен заказ #{order.id}",
-                order_id=order.id
-            )
-            db.add(transaction)
-            print(f"[COURIER] Deducted 1 credit for completed order #{order.id}")
-        
-        # Update subscription used_credits
-        sub_result = await db.execute(select(Subscription).where(Subscription.id == order.subscription_id))
-        subscription = sub_result.scalar_one_or_none()
-        if subscription:
-            subscription.used_credits += 1
-            # Check if subscription is complete
-            if subscription.used_credits >= subscription.total_credits:
-                subscription.is_active = False
-        
-    order.status = OrderStatus.COMPLETED
-    order.bags_count = bags_count
-    await db.commit()
-    
-    # === NOTIFY CLIENT ===
+    # Subscription orders deduct a credit and count against the subscription
     try:
-        result = await db.execute(select(User).where(User.id == order.user_id))
-        client = result.scalar_one_or_none()
-        
-        if client and client.telegram_id:
-            await notify_client_order_completed(
-                client_telegram_id=client.telegram_id,
-                bags_count=bags_count
-            )
-    except Exception as e:
-        print(f"[NOTIFY ERROR] Failed to notify client on completion: {e}")
+        completed = await order_state.transition(db, order_id, "complete", values={"bags_count": bags_count})
+    except order_state.TransitionError as e:
+        if e.status is None:
+            raise HTTPException(status_code=404, detail="Order not found")
+        raise HTTPException(status_code=400, detail="Order already completed or cancelled")
+    await db.commit()
     
-    # === NOTIFY ADMINS ===
-    try:
-        await notify_admins_order_completed(
-            admin_telegram_ids=settings.admin_ids,
-            order_id=order.id,
-            courier_name=courier_name,
-            bags_count=bags_count
-        )
-    except Exception as e:
-        print(f"[NOTIFY ERROR] Failed to notify admins on completion: {e}")
+    if completed.credit_change:
+        log.info("Deducted 1 credit for completed order #%s", order_id)
+    await order_state.emit(db, completed)
     
     return {"status": "ok"}
 
 @router.post("/orders/{order_id}/undo")
 async def undo_order(order_id: int, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Order).where(Order.id == order_id))
-    order = result.scalar_one_or_none()
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    order.status = OrderStatus.SCHEDULED
+    try:
+        undone = await order_state.transition(db, order_id, "undo")
+    except order_state.TransitionError as e:
+        if e.status is None:
+            raise HTTPException(status_code=404, detail="Order not found")
+        raise HTTPException(status_code=400, detail="Order cannot be returned")
     await db.commit()
+    await order_state.emit(db, undone)
     return {"status": "ok"}
-
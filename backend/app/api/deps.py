@@ -1,36 +1,94 @@
-from fastapi import Depends, HTTPException, status
+from typing import Optional
+
+from fastapi import Depends, HTTPException, Query, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
 from app.config import settings
-from app.models import User, get_db
+from app.models import User, get_db, get_read_db
+from app.models import replicas
+from app.models.base import async_session
+from app.services.auth import is_admin
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-async def get_current_user(
-    db: AsyncSession = Depends(get_db),
-    token: str = Depends(oauth2_scheme)
-) -> User:
-    credentials_exception = HTTPException(
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def _user_id_from_token(token: str) -> int:
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         user_id: str = payload.get("sub")
         if user_id is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-        
-    result = await db.execute(select(User).where(User.id == int(user_id)))
+            raise _credentials_exception()
+        return int(user_id)
+    except (JWTError, ValueError):
+        raise _credentials_exception()
+
+
+async def _load_user(db: AsyncSession, user_id: int) -> User:
+    result = await db.execute(select(User).where(User.id == user_id))
     user = result.scalar_one_or_none()
-    
+
     if user is None:
-        raise credentials_exception
-        
+        raise _credentials_exception()
+
     return user
 
+
+async def get_current_user(
+    db: AsyncSession = Depends(get_db),
+    token: str = Depends(oauth2_scheme)
+) -> User:
+    user_id = _user_id_from_token(token)
+    # A commit that writes pins the user's reads to the primary (models/replicas.py)
+    db.info["user_id"] = user_id
+    return await _load_user(db, user_id)
+
+
+async def get_current_user_read(
+    db: AsyncSession = Depends(get_read_db),
+    token: str = Depends(oauth2_scheme)
+) -> User:
+    """get_current_user for read-only routes: shares their get_read_db session"""
+    user_id = _user_id_from_token(token)
+    replicas.read_own_writes(db, user_id)
+    return await _load_user(db, user_id)
+
+
+async def get_admin_user(user: User = Depends(get_current_user_read)) -> User:
+    """get_current_user_read restricted to ADMIN_TELEGRAM_IDS"""
+    if not is_admin(user.telegram_id):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admins only")
+    return user
+
+
+async def get_stream_user_id(
+    request: Request,
+    token: Optional[str] = Query(None, description="JWT for clients that cannot set headers (EventSource)"),
+) -> int:
+    """
+    User id for long-lived streams.
+    Accepts the usual Bearer header or ?token=, and checks the user in a short
+    session of its own so no DB connection is held for the life of the stream.
+    """
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    if not token:
+        raise _credentials_exception()
+    user_id = _user_id_from_token(token)
+
+    async with async_session() as db:
+        exists = await db.scalar(select(User.id).where(User.id == user_id))
+    if exists is None:
+        raise _credentials_exception()
+    return user_id
@@ -1,17 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
+from sqlalchemy import select, and_, tuple_
 from pydantic import BaseModel
 from typing import List, Optional
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta, timezone
+import base64
+import json
 
-from app.models import get_db, Order, OrderStatus, TimeSlot, Address, Balance, BalanceTransaction, User, UserRole, ResidentialComplex, Subscription, Tariff
-from app.api.deps import get_current_user
-from app.services.notifications import notify_all_couriers_new_order, notify_admins_new_order, notify_client_order_created
+from app.models import get_db, get_read_db, Order, OrderStatus, TimeSlot, Address, Balance, User, Subscription, Tariff
+from app.models import replicas
+from app.api.deps import get_current_user, get_current_user_read, get_stream_user_id
+from app.services.notifications import notify_new_order
+from app.services.dispatcher import dispatch
 from app.services.subscription_orders import generate_all_subscription_orders
+from app.services import ledger, events, courier_board, order_state, slot_capacity
+from app.services.sql_profile import statement_budget
+from app.services.user_stats import record_orders_created, record_subscription_started
 from app.config import settings
+from app.logging_config import get_logger
 
 router = APIRouter()
+log = get_logger("ORDER")
 
 
 class TariffDetails(BaseModel):
@@ -37,6 +47,7 @@ class OrderResponse(BaseModel):
     status: str
     bags_count: int
     comment: Optional[str] = None
+    updated_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
@@ -47,28 +58,181 @@ class RescheduleRequest(BaseModel):
     new_time_slot: str  # e.g. "08:00 — 10:00"
 
 
+# Changes committed less than this long ago may still be joined by slower
+# transactions with an earlier updated_at, so the sync token stays behind "now"
+SYNC_SAFETY_WINDOW = timedelta(seconds=5)
+MAX_PAGE_SIZE = 200
+
+
+def _encode_cursor(key, order_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([key.isoformat(), order_id]).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, key_type):
+    try:
+        key, order_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return key_type.fromisoformat(key), int(order_id)
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+async def slot_full_error(db: AsyncSession, complex_id: int, day: date, time_slot: TimeSlot) -> HTTPException:
+    """409 for a full slot, with the nearest slots that still have room"""
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail={
+            "message": "На это время все места заняты. Выберите другое время",
+            "suggestions": await slot_capacity.suggest(db, complex_id, day, time_slot),
+        },
+    )
+
+
 @router.get("/", response_model=List[OrderResponse])
 async def get_orders(
+    response: Response,
     status_filter: Optional[OrderStatus] = None,
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    view: str = Query("full", pattern="^(full|summary)$"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_read)
 ):
     """
     Get user's orders
+    - Default: newest first by (date, id); with `limit`, the next page's cursor
+      is returned in the X-Next-Cursor header
+    - `since`: only orders changed after that time, oldest change first by
+      (updated_at, id), for incremental sync. X-Sync-Token is the `since` to use next time
+    - `view=summary`: only id, date, time_slot, status, updated_at
     """
-    query = select(Order).where(Order.user_id == current_user.id)
+    headers = {}
+    columns = (Order.id, Order.date, Order.time_slot, Order.status, Order.updated_at)
+    query = select(*columns) if view == "summary" else select(Order)
+    query = query.where(Order.user_id == current_user.id)
     
     if status_filter:
         query = query.where(Order.status == status_filter)
     
-    query = query.order_by(Order.date.desc())
+    if since is not None:
+        if since.tzinfo:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)  # updated_at is naive UTC
+        key_column, key_type = Order.updated_at, datetime
+        query = query.where(Order.updated_at > since).order_by(Order.updated_at, Order.id)
+        if cursor:
+            query = query.where(tuple_(Order.updated_at, Order.id) > _decode_cursor(cursor, key_type))
+        # Not from a replica: changes it has not replayed yet would be older than the token, never synced
+        await replicas.read_from_primary(db)
+        headers["X-Sync-Token"] = (datetime.utcnow() - SYNC_SAFETY_WINDOW).isoformat()
+    else:
+        key_column, key_type = Order.date, date
+        query = query.order_by(Order.date.desc(), Order.id.desc())
+        if cursor:
+            query = query.where(tuple_(Order.date, Order.id) < _decode_cursor(cursor, key_type))
+    
+    if limit:
+        query = query.limit(limit)
+    
     result = await db.execute(query)
-    orders = result.scalars().all()
+    orders = result.all() if view == "summary" else result.scalars().all()
+    
+    if limit and len(orders) == limit:
+        last = orders[-1]
+        headers["X-Next-Cursor"] = _encode_cursor(getattr(last, key_column.key), last.id)
     
+    if view == "summary":
+        return JSONResponse([
+            {
+                "id": o.id,
+                "date": o.date.isoformat(),
+                "time_slot": o.time_slot.value,
+                "status": o.status.value,
+                "updated_at": o.updated_at.isoformat() if o.updated_at else None,
+            }
+            for o in orders
+        ], headers=headers)
+    
+    response.headers.update(headers)
     return orders
 
 
+# Reconnect delay suggested to EventSource clients
+SSE_RETRY_MS = 3000
+
+
+def _sse_frame(event: dict) -> bytes:
+    data = json.dumps({"type": event["type"], "at": event["at"], **event["data"]}, ensure_ascii=False)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n".encode()
+
+
+@router.get("/events")
+async def order_events(user_id: int = Depends(get_stream_user_id)):
+    """
+    Server-sent events with the user's order status changes
+    (order.taken, order.completed, order.undone, order.rescheduled, order.cancelled)
+    - Auth: Bearer header or ?token= (EventSource cannot set headers)
+    - `: ping` comments keep idle connections alive through proxies
+    - `resync` means events were missed (slow reader or reconnect): refetch
+      with GET /api/orders?since=<X-Sync-Token>
+    No DB connection is held while the stream is open.
+    """
+    async def stream():
+        subscription = events.bus.subscribe(events.user_topic(user_id))
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n".encode()
+            while True:
+                event = await subscription.get(timeout=settings.EVENTS_HEARTBEAT_SECONDS)
+                if event is None:
+                    yield b": ping\n\n"
+                    continue
+                if subscription.lagged:
+                    subscription.lagged = False
+                    yield b"event: resync\ndata: {}\n\n"
+                yield _sse_frame(event)
+        finally:
+            subscription.close()
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/availability")
+async def get_availability(
+    address_id: Optional[int] = None,
+    complex_id: Optional[int] = None,
+    start: Optional[date] = None,
+    days: int = Query(settings.SLOT_AVAILABILITY_DAYS, ge=1, le=62),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_read)
+):
+    """
+    Free places per time slot for the next `days` days (from `start`, default today)
+    - For the complex of `address_id` (one of the user's addresses) or `complex_id`;
+      without either, for addresses outside any complex
+    """
+    if address_id is not None:
+        result = await db.execute(
+            select(Address.complex_id).where(
+                and_(Address.id == address_id, Address.user_id == current_user.id)
+            )
+        )
+        row = result.first()
+        if row is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Address not found"
+            )
+        complex_id = row.complex_id
+    
+    start = start or date.today()
+    return await slot_capacity.availability(db, slot_capacity.complex_key(complex_id), start, days)
+
+
 @router.post("/", response_model=OrderResponse)
+@statement_budget(10)
 async def create_order(
     request: CreateOrderRequest,
     db: AsyncSession = Depends(get_db),
@@ -78,6 +242,7 @@ async def create_order(
     Create a new order (uses credits from balance)
     For single orders: uses single_credits if available
     For subscription orders: uses subscription credits
+    A full time slot is answered with 409 and suggested slots
     """
     cost = 1  # Always 1 credit per order (urgent/bags_count handled in payment)
     
@@ -109,6 +274,10 @@ async def create_order(
                 detail="Address not found"
             )
         
+        complex_id = slot_capacity.complex_key(address.complex_id)
+        if not await slot_capacity.book(db, complex_id, request.date, request.time_slot):
+            raise await slot_full_error(db, complex_id, request.date, request.time_slot)
+        
         # Create order
         bags_count = request.tariff_details.bags_count if request.tariff_details else 1
         order = Order(
@@ -124,16 +293,12 @@ async def create_order(
         await db.flush()
         
         # Deduct single_credit
-        balance.single_credits -= cost
-        
-        # Log transaction
-        transaction = BalanceTransaction(
-            balance_id=balance.id,
-            amount=-cost,
+        await ledger.post_entry(
+            db, balance, -cost,
             description=f"Разовый заказ #{order.id}",
             order_id=order.id,
+            credit_type=ledger.SINGLE_CREDITS,
         )
-        db.add(transaction)
     
     # SUBSCRIPTION ORDER: Check subscription credits
     else:
@@ -157,6 +322,10 @@ async def create_order(
                 detail="Address not found"
             )
         
+        complex_id = slot_capacity.complex_key(address.complex_id)
+        if not await slot_capacity.book(db, complex_id, request.date, request.time_slot):
+            raise await slot_full_error(db, complex_id, request.date, request.time_slot)
+        
         # Create order
         order = Order(
             user_id=current_user.id,
@@ -170,18 +339,16 @@ async def create_order(
         await db.flush()
         
         # Deduct subscription credit
-        balance.credits -= cost
-        
-        # Log transaction
-        transaction = BalanceTransaction(
-            balance_id=balance.id,
-            amount=-cost,
+        await ledger.post_entry(
+            db, balance, -cost,
             description=f"Заказ #{order.id}",
             order_id=order.id,
         )
-        db.add(transaction)
+    
+    await record_orders_created(db, current_user.id)
     
     # Create Subscription if tariff is trial or monthly
+    new_subscription_id = None
     if request.tariff_type in ['trial', 'monthly']:
         # For trial: check if user has EVER had a trial subscription (active or not)
         # For monthly: check if user has an active subscription
@@ -222,94 +389,31 @@ async def create_order(
             )
             db.add(subscription)
             await db.flush()  # Get subscription ID
+            new_subscription_id = subscription.id
+            await record_subscription_started(db, current_user.id)
             
             # ADD subscription credits to balance (refund the order cost + add subscription credits)
-            balance.credits += (cost + total_credits)  # Refund order cost + add subscription credits
-            
-            # Log subscription purchase
-            subscription_transaction = BalanceTransaction(
-                balance_id=balance.id,
-                amount=total_credits,
+            await ledger.post_entry(
+                db, balance, cost,
+                description=f"Возврат за заказ #{order.id} (входит в подписку)",
+                order_id=order.id,
+            )
+            await ledger.post_entry(
+                db, balance, total_credits,
                 description=f"Подписка {'Пробная' if request.tariff_type == 'trial' else 'Месячная'} (+{total_credits} выносов)",
                 order_id=order.id,
             )
-            db.add(subscription_transaction)
             
             # Generate ALL orders for the entire subscription period
-            print(f"[ORDER] Generating all orders for subscription {subscription.id}")
             created_orders = await generate_all_subscription_orders(db, subscription, start_from_date=subscription.start_date)
-            print(f"[ORDER] Created {created_orders} orders for subscription period")
+            log.info("Created %d orders for subscription %s", created_orders, subscription.id)
     
     await db.commit()
     await db.refresh(order)
+    await courier_board.refresh_new_orders(db, order.id, new_subscription_id)
     
-    # === NOTIFY ALL COURIERS ===
-    try:
-        # Get all couriers
-        couriers_result = await db.execute(
-            select(User).where(User.role == UserRole.COURIER, User.is_active == True)
-        )
-        couriers = couriers_result.scalars().all()
-        courier_tg_ids = [c.telegram_id for c in couriers if c.telegram_id]
-        
-        # Get address details
-        # Build full address string
-        address_parts = []
-        
-        # Add street (if available)
-        if hasattr(address, 'street') and address.street:
-            address_parts.append(address.street)
-        
-        # Add complex name (if available)
-        if address.complex_id:
-            complex_result = await db.execute(select(ResidentialComplex).where(ResidentialComplex.id == address.complex_id))
-            complex_obj = complex_result.scalar_one_or_none()
-            if complex_obj:
-                address_parts.append(complex_obj.name)
-        
-        # Add building and apartment
-        address_parts.append(f"д. {address.building}")
-        address_parts.append(f"кв. {address.apartment}")
-        
-        address_str = ", ".join(address_parts)
-        time_slot_str = request.time_slot.value if hasattr(request.time_slot, 'value') else str(request.time_slot)
-        date_str = request.date.strftime('%d.%m.%Y')
-        
-        await notify_all_couriers_new_order(
-            courier_telegram_ids=courier_tg_ids,
-            order_id=order.id,
-            address=address_str,
-            date_str=date_str,
-            time_slot=time_slot_str,
-            comment=request.comment,
-            tariff_type=request.tariff_type,
-            order_date=request.date
-        )
-        
-        # Notify client about order creation
-        if current_user.telegram_id:
-            await notify_client_order_created(
-                client_telegram_id=current_user.telegram_id,
-                order_id=order.id,
-                address=address_str,
-                date_str=date_str,
-                time_slot=time_slot_str
-            )
-        
-        # Notify admins about new order
-        client_name = current_user.name or "Клиент"
-        await notify_admins_new_order(
-            admin_telegram_ids=settings.admin_ids,
-            order_id=order.id,
-            address=address_str,
-            date_str=date_str,
-            time_slot=time_slot_str,
-            client_name=client_name,
-            tariff_type=request.tariff_type,
-            order_date=request.date
-        )
-    except Exception as e:
-        print(f"[NOTIFY ERROR] Failed to notify couriers/admins/client: {e}")
+    # Couriers, client and admins are notified in the background
+    dispatch(f"order:{order.id}", notify_new_order, order_id=order.id, tariff_type=request.tariff_type)
     
     return order
 
@@ -368,6 +472,10 @@ async def reschedule_order(
             detail="Invalid time slot"
         )
     
+    # The UPDATE only applies if the order is still where it was read: of two concurrent
+    # reschedules the second fails, and its slot move() is rolled back with it
+    moved_from = (Order.date == order.date, Order.time_slot == order.time_slot)
+    
     # SUBSCRIPTION ORDER: Apply strict rules
     if order.is_subscription or order.subscription_id:
         # Rule 0: Can only reschedule once
@@ -396,7 +504,9 @@ async def reschedule_order(
                 detail=f"Можно перенести только на +1 день ({expected_new_date.strftime('%d.%m.%Y')})"
             )
         
-        order.was_rescheduled = True  # Mark as rescheduled (can't reschedule again)
+        # Mark as rescheduled (can't reschedule again); re-checked by the UPDATE
+        values = {"was_rescheduled": True}
+        where = (Order.user_id == current_user.id, Order.was_rescheduled.isnot(True), *moved_from)
     
     # SINGLE ORDER: No restrictions, can reschedule freely
     else:
@@ -407,11 +517,27 @@ async def reschedule_order(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Нельзя перенести на прошедшую дату"
             )
+        values = {}
+        where = (Order.user_id == current_user.id, *moved_from)
     
-    order.date = new_date
-    order.time_slot = new_time_slot
+    # Take the new slot first: a full one leaves the order untouched
+    complex_id = await slot_capacity.address_complex(db, order.address_id)
+    if not await slot_capacity.move(db, complex_id, order.date, order.time_slot, new_date, new_time_slot):
+        raise await slot_full_error(db, complex_id, new_date, new_time_slot)
     
+    try:
+        rescheduled = await order_state.transition(
+            db, order.id, "reschedule",
+            values={**values, "date": new_date, "time_slot": new_time_slot},
+            where=where,
+        )
+    except order_state.TransitionError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Перенести можно только запланированный заказ"
+        )
     await db.commit()
+    await order_state.emit(db, rescheduled)
     
     return {"status": "ok", "message": "Order rescheduled successfully"}
 
@@ -425,56 +551,24 @@ async def cancel_order(
     """
     Cancel an order and refund credit
     """
-    result = await db.execute(
-        select(Order).where(
-            and_(Order.id == order_id, Order.user_id == current_user.id)
-        )
-    )
-    order = result.scalar_one_or_none()
-    
-    if not order:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Order not found"
+    # Refund credit; subscription orders also give the pickup back to the subscription
+    try:
+        cancelled = await order_state.transition(
+            db, order_id, "cancel", where=(Order.user_id == current_user.id,)
         )
-    
-    if order.status != OrderStatus.SCHEDULED:
+    except order_state.TransitionError as e:
+        if e.status is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Order not found"
+            )
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Only scheduled orders can be cancelled"
         )
-    
-    # Refund credit
-    result = await db.execute(
-        select(Balance).where(Balance.user_id == current_user.id)
-    )
-    balance = result.scalar_one_or_none()
-    
-    if balance:
-        balance.credits += 1 
-        
-        # Log refund
-        transaction = BalanceTransaction(
-            balance_id=balance.id,
-            amount=1,
-            description=f"Возврат за отмену заказа #{order.id}",
-            order_id=order.id,
-        )
-        db.add(transaction)
-    
-    # If subscription order - update subscription used_credits
-    if order.subscription_id:
-        sub_result = await db.execute(
-            select(Subscription).where(Subscription.id == order.subscription_id)
-        )
-        subscription = sub_result.scalar_one_or_none()
-        if subscription and subscription.used_credits > 0:
-            subscription.used_credits -= 1
-            subscription.is_active = True  # Reactivate if was deactivated
-    
-    order.status = OrderStatus.CANCELLED
-    print(f"[ORDER] Cancelled order #{order.id}, refunded 1 credit")
+    log.info("Cancelled order #%s, refunded %s credit", order_id, cancelled.credit_change)
     
     await db.commit()
+    await order_state.emit(db, cancelled)
     
     return {"status": "ok", "message": "Order cancelled, credit refunded"}
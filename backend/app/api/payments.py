@@ -3,22 +3,30 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from yookassa import Configuration, Payment as YookassaPayment
 from yookassa.domain.notification import WebhookNotification
+import asyncio
 import json
 import uuid
 from datetime import date, datetime, timedelta
 
 from app.config import settings
-from app.models import get_db, User, Order, OrderStatus, TimeSlot, Address, Balance, BalanceTransaction, Subscription, Tariff, Payment, ResidentialComplex, UserRole, TariffPrice
+from app.models import get_db, replicas, User, Order, OrderStatus, TimeSlot, Address, Subscription, Tariff, Payment, TariffPrice
 from app.api.deps import get_current_user
-from app.api.orders import CreateOrderRequest, TariffDetails
+from app.api.orders import CreateOrderRequest, TariffDetails, slot_full_error
 from app.services.notifications import notify_all_couriers_new_order, notify_admins_new_order, notify_client_order_created
 from app.services.subscription_orders import generate_all_subscription_orders
+from app.services.user_stats import record_orders_created, record_subscription_started
+from app.services import ledger, recipients, address_view, courier_board, slot_capacity, metrics
+from app.services.sql_profile import statement_budget
+from app.logging_config import get_logger
 
 router = APIRouter()
+log = get_logger("PAYMENT")
+webhook_log = get_logger("WEBHOOK")
 
 # Initialize Yookassa
 Configuration.account_id = settings.YOOKASSA_SHOP_ID
 Configuration.secret_key = settings.YOOKASSA_SECRET_KEY
+Configuration.api_url = settings.YOOKASSA_API_URL
 
 @router.post("/create")
 async def create_payment(
@@ -90,6 +98,11 @@ async def create_payment(
     
     if amount == 0:
         raise HTTPException(status_code=400, detail="Invalid tariff type or price")
+    
+    # Don't take money for a full slot (the place itself is booked by the webhook)
+    complex_id = await slot_capacity.address_complex(db, request.address_id)
+    if not await slot_capacity.has_room(db, complex_id, request.date, request.time_slot):
+        raise await slot_full_error(db, complex_id, request.date, request.time_slot)
 
     # 2. Create payment in Yookassa
     idempotence_key = str(uuid.uuid4())
@@ -99,13 +112,9 @@ async def create_payment(
     customer = {}
     if current_user.phone:
         customer["phone"] = str(current_user.phone)
-        print(f"[PAYMENT] Using phone: {current_user.phone}")
     else:
         # Use email as fallback since telegram_id is too long for phone
         customer["email"] = f"user_{current_user.telegram_id}@ya-uberu.ru"
-        print(f"[PAYMENT] Using email fallback: {customer['email']}")
-    
-    print(f"[PAYMENT] Customer dict: {customer}")
     
     receipt = {
         "customer": customer,
@@ -124,8 +133,6 @@ async def create_payment(
         ]
     }
     
-    print(f"[PAYMENT] Full receipt: {receipt}")
-    
     payment_data = {
         "amount": {
             "value": str(amount),
@@ -144,9 +151,12 @@ async def create_payment(
         }
     }
     
-    print(f"[PAYMENT] Creating payment with data: {payment_data}")
+    # The receipt carries the customer's phone or email: log only what is being paid for
+    log.info("Creating payment for user %s: %s RUB, tariff %s, receipt contact %s",
+             current_user.id, amount, request.tariff_type, "phone" if "phone" in customer else "email")
     
-    payment = YookassaPayment.create(payment_data, idempotence_key)
+    # The SDK is synchronous (requests): keep it off the event loop
+    payment = await asyncio.to_thread(YookassaPayment.create, payment_data, idempotence_key)
 
     # 3. Save pending payment to DB
     db_payment = Payment(
@@ -165,6 +175,7 @@ async def create_payment(
 
 
 @router.post("/webhook")
+@statement_budget(14)
 async def yookassa_webhook(request: Request, db: AsyncSession = Depends(get_db)):
     """
     Handle webhooks from Yookassa
@@ -177,7 +188,8 @@ async def yookassa_webhook(request: Request, db: AsyncSession = Depends(get_db))
         yookassa_id = payment_data.id
         status = payment_data.status
         
-        print(f"[WEBHOOK] Received webhook for payment {yookassa_id}, status: {status}")
+        webhook_log.info("Received webhook for payment %s, status: %s", yookassa_id, status)
+        metrics.record_webhook_lag(body.get("event") or f"payment.{status}", payment_data.created_at)
 
         if status == "succeeded":
             # 1. Find payment in DB
@@ -185,11 +197,11 @@ async def yookassa_webhook(request: Request, db: AsyncSession = Depends(get_db))
             payment = result.scalar_one_or_none()
             
             if not payment:
-                print(f"[WEBHOOK] Payment {yookassa_id} not found in DB")
+                webhook_log.warning("Payment %s not found in DB", yookassa_id)
                 return {"status": "error", "message": "Payment not found"}
             
             if payment.status == "succeeded":
-                 print(f"[WEBHOOK] Payment {yookassa_id} already processed")
+                 webhook_log.info("Payment %s already processed", yookassa_id)
                  return {"status": "ok"} # Already processed
 
             # 2. Update payment status
@@ -204,17 +216,13 @@ async def yookassa_webhook(request: Request, db: AsyncSession = Depends(get_db))
                 order_data = json.loads(payment.order_data)
                 request_obj = CreateOrderRequest(**order_data) # Reconstruct request
             except Exception as e:
-                print(f"[WEBHOOK] Failed to parse order data: {e}")
+                webhook_log.error("Failed to parse order data: %s", e)
                 return {"status": "error", "message": "Invalid order data"}
 
             # --- LOGIC COPIED/ADAPTED FROM ORDERS.PY ---
             
             # A. Update Balance (Add credits purchased)
-            balance_result = await db.execute(select(Balance).where(Balance.user_id == user.id))
-            balance = balance_result.scalar_one_or_none()
-            if not balance:
-                balance = Balance(user_id=user.id, credits=0)
-                db.add(balance)
+            balance = await ledger.get_or_create_balance(db, user.id)
             
             # Credits logic
             credits_to_add = 0
@@ -242,13 +250,10 @@ async def yookassa_webhook(request: Request, db: AsyncSession = Depends(get_db))
                  cost_to_deduct = 1  # First order is created immediately
             
             # Add credits transaction
-            balance.credits += credits_to_add
-            t1 = BalanceTransaction(
-                balance_id=balance.id,
-                amount=credits_to_add,
+            await ledger.post_entry(
+                db, balance, credits_to_add,
                 description=f"Пополнение: {payment.description}"
             )
-            db.add(t1)
             
             # B. Create Order (if needed - usually yes because user selected time)
             # Find address
@@ -266,20 +271,23 @@ async def yookassa_webhook(request: Request, db: AsyncSession = Depends(get_db))
             )
             db.add(order)
             await db.flush() # get ID
+            await record_orders_created(db, user.id)
+            # Already paid: counted even if the slot filled up in the meantime
+            await slot_capacity.book(
+                db, slot_capacity.complex_key(address.complex_id if address else None),
+                order.date, order.time_slot, enforce=False,
+            )
             
             # Deduct credit for this specific order
-            balance.credits -= cost_to_deduct
-            t2 = BalanceTransaction(
-                balance_id=balance.id,
-                amount=-cost_to_deduct,
+            await ledger.post_entry(
+                db, balance, -cost_to_deduct,
                 description=f"Заказ #{order.id} (Оплачен)",
                 order_id=order.id
             )
-            db.add(t2)
             
             # C. Create Subscription (if trial/monthly)
             if request_obj.tariff_type in ['trial', 'monthly']:
-                print(f"[WEBHOOK] Creating subscription for user {user.id}, tariff: {request_obj.tariff_type}")
+                webhook_log.info("Creating subscription for user %s, tariff: %s", user.id, request_obj.tariff_type)
                 try:
                     # For trial: check if user has EVER had a trial subscription
                     should_create_subscription = True
@@ -294,7 +302,7 @@ async def yookassa_webhook(request: Request, db: AsyncSession = Depends(get_db))
                         existing_trial = existing_trial_result.scalar_one_or_none()
                         if existing_trial:
                             should_create_subscription = False
-                            print(f"[WEBHOOK] User {user.id} already has trial subscription #{existing_trial.id}")
+                            webhook_log.info("User %s already has trial subscription #%s", user.id, existing_trial.id)
                     
                     if should_create_subscription:
                         # Get tariff details
@@ -307,8 +315,6 @@ async def yookassa_webhook(request: Request, db: AsyncSession = Depends(get_db))
                             frequency = request_obj.tariff_details.frequency
                             bags_count = request_obj.tariff_details.bags_count
                         
-                        print(f"[WEBHOOK] Creating subscription: duration={duration_days}, frequency={frequency}, address={request_obj.address_id}")
-                        
                         sub = Subscription(
                            user_id=user.id,
                            address_id=request_obj.address_id,
@@ -324,38 +330,32 @@ async def yookassa_webhook(request: Request, db: AsyncSession = Depends(get_db))
                         )
                         db.add(sub)
                         await db.flush()
-                        print(f"[WEBHOOK] Subscription #{sub.id} created!")
+                        await record_subscription_started(db, user.id)
+                        webhook_log.info("Subscription #%s created: duration=%s, frequency=%s",
+                                         sub.id, duration_days, frequency)
                         
                         order.subscription_id = sub.id
                         order.is_subscription = True
                         
                         # Generate ALL future orders for this subscription
-                        print(f"[WEBHOOK] Generating all orders for subscription {sub.id}")
                         try:
                             created_orders = await generate_all_subscription_orders(db, sub, start_from_date=sub.start_date)
-                            print(f"[WEBHOOK] Created {created_orders} orders for subscription period")
+                            webhook_log.info("Created %d orders for subscription %s", created_orders, sub.id)
                         except Exception as gen_error:
-                            print(f"[WEBHOOK] ERROR generating orders: {gen_error}")
+                            webhook_log.exception("Generating orders failed: %s", gen_error)
                             # Continue anyway - subscription is created
                 except Exception as sub_error:
-                    print(f"[WEBHOOK] ERROR creating subscription: {sub_error}")
-                    import traceback
-                    traceback.print_exc()
+                    webhook_log.exception("Creating subscription failed: %s", sub_error)
 
             await db.commit()
+            # The client checks the new balance and orders right after paying
+            replicas.pin_to_primary(user.id)
+            await courier_board.refresh_new_orders(db, order.id, order.subscription_id)
             
             # --- NOTIFICATIONS ---
             # (Simplified version of notify logic)
             try:
-                 # Helper to get address string
-                address_parts = []
-                if hasattr(address, 'street') and address.street: address_parts.append(address.street)
-                if address.complex_id:
-                     c_res = await db.execute(select(ResidentialComplex).where(ResidentialComplex.id == address.complex_id))
-                     c_obj = c_res.scalar_one_or_none()
-                     if c_obj: address_parts.append(c_obj.name)
-                address_parts.append(f"д. {address.building}, кв. {address.apartment}")
-                address_str = ", ".join(address_parts)
+                address_str = await address_view.get_address(db, address.id)
                 time_slot_str = request_obj.time_slot.value if hasattr(request_obj.time_slot, 'value') else str(request_obj.time_slot)
                 # Format date if it's a date object, otherwise it might be a string depending on how pydantic parsed it
                 date_val = request_obj.date
@@ -363,7 +363,7 @@ async def yookassa_webhook(request: Request, db: AsyncSession = Depends(get_db))
                 
                 # Notify Admins
                 await notify_admins_new_order(
-                    admin_telegram_ids=settings.admin_ids,
+                    admin_telegram_ids=recipients.admin_ids(),
                     order_id=order.id,
                     address=address_str,
                     date_str=date_str,
@@ -378,18 +378,16 @@ async def yookassa_webhook(request: Request, db: AsyncSession = Depends(get_db))
                      await notify_client_order_created(user.telegram_id, order.id, address_str, date_str, time_slot_str)
 
                 # Notify Couriers
-                couriers_res = await db.execute(select(User).where(User.role == UserRole.COURIER, User.is_active == True))
-                couriers = couriers_res.scalars().all()
-                courier_ids = [c.telegram_id for c in couriers if c.telegram_id]
+                courier_ids = await recipients.get_courier_ids(db)
                 await notify_all_couriers_new_order(courier_ids, order.id, address_str, date_str, time_slot_str, request_obj.comment, tariff_type=request_obj.tariff_type, order_date=date_val)
 
             except Exception as e:
-                print(f"[WEBHOOK NOTIFY ERROR] {e}")
+                webhook_log.exception("Notify failed: %s", e)
 
-            print(f"[WEBHOOK] Successfully processed payment {yookassa_id} and created order {order.id}")
+            webhook_log.info("Successfully processed payment %s and created order %s", yookassa_id, order.id)
             
     except Exception as e:
-        print(f"[WEBHOOK ERROR] {e}")
+        webhook_log.exception("Processing failed: %s", e)
         return {"status": "error", "message": str(e)}
 
     return {"status": "ok"}
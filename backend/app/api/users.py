@@ -1,17 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_
 from pydantic import BaseModel
 from typing import List, Optional
 
 from app.models import (
-    get_db, User, Address, Balance, 
-    ResidentialComplex, TrialUsage, Order
+    get_db, get_read_db, User, Address, Balance, 
+    ResidentialComplex, TrialUsage
 )
-from sqlalchemy import func
-from app.api.deps import get_current_user
+from app.api.deps import get_current_user, get_current_user_read
+from app.services.user_stats import set_subscription_active
+from app.services import complex_catalog
+from app.logging_config import get_logger
 
 router = APIRouter()
+log = get_logger("SUBSCRIPTIONS")
 
 
 class AddressCreate(BaseModel):
@@ -50,17 +53,14 @@ class BalanceResponse(BaseModel):
 
 @router.get("/me")
 async def get_current_user_profile(
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_read)
 ):
     """
     Get current user profile with is_new_user flag
     """
-    # Count user's orders to determine if they are new
-    result = await db.execute(
-        select(func.count(Order.id)).where(Order.user_id == current_user.id)
-    )
-    orders_count = result.scalar() or 0
+    # Denormalized counter - no extra query needed
+    orders_count = current_user.orders_count or 0
     
     return {
         "id": current_user.id,
@@ -73,8 +73,8 @@ async def get_current_user_profile(
 
 @router.get("/balance", response_model=BalanceResponse)
 async def get_balance(
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_read)
 ):
     """
     Get user's credit balance (subscription + single pickups)
@@ -114,8 +114,8 @@ async def get_user_subscriptions(
     # Auto-deactivate expired subscriptions
     for s in subscriptions:
         if s.end_date and s.end_date < today:
-            print(f"[SUBSCRIPTIONS] Deactivating expired subscription #{s.id} (ended {s.end_date})")
-            s.is_active = False
+            log.info("Deactivating expired subscription #%s (ended %s)", s.id, s.end_date)
+            await set_subscription_active(db, s, False)
     
     await db.commit()
     
@@ -134,8 +134,8 @@ async def get_user_subscriptions(
 
 @router.get("/me/has-trial")
 async def check_has_trial_subscription(
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_read)
 ):
     """
     Check if user has ever purchased a trial subscription (active or inactive)
@@ -155,8 +155,8 @@ async def check_has_trial_subscription(
 
 @router.get("/addresses", response_model=List[AddressResponse])
 async def get_addresses(
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_read)
 ):
     """
     Get user's saved addresses
@@ -263,7 +263,7 @@ async def check_trial_eligibility(
     complex_id: int,
     building: str,
     apartment: str,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """
     Check if trial subscription is available for this apartment
@@ -285,23 +285,12 @@ async def check_trial_eligibility(
 
 @router.get("/complexes")
 async def get_residential_complexes(
-    db: AsyncSession = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_read_db),
 ):
     """
     Get list of available residential complexes with buildings
+    (cached snapshot, supports If-None-Match)
     """
-    from sqlalchemy.orm import selectinload
-    
-    result = await db.execute(
-        select(ResidentialComplex)
-        .where(ResidentialComplex.is_active == True)
-        .options(selectinload(ResidentialComplex.buildings))
-    )
-    complexes = result.scalars().all()
-    
-    return [{
-        "id": c.id, 
-        "name": c.name, 
-        "short_name": c.short_name,
-        "buildings": [b.building_number for b in c.buildings]
-    } for c in complexes]
+    catalog = await complex_catalog.get_catalog(db)
+    return complex_catalog.catalog_response(request, catalog.public, "public, max-age=60")
@@ -5,6 +5,12 @@ import os
 class Settings(BaseSettings):
     # Database
     DATABASE_URL: str = "sqlite+aiosqlite:///./sql_app.db"
+    # Read-only sessions (models/replicas.get_read_db: GET routes, reports)
+    DATABASE_READ_URL: str = ""  # Comma-separated replica URLs; empty = the primary
+    DB_READ_DEFERRABLE: bool = False  # Postgres: one snapshot per request (SERIALIZABLE READ ONLY DEFERRABLE)
+    DB_REPLICA_MAX_LAG_SECONDS: float = 5  # Replicas lagging more than this are skipped (reads go to the primary)
+    DB_REPLICA_LAG_CHECK_SECONDS: float = 2  # Lag probe interval
+    DB_READ_YOUR_WRITES_SECONDS: float = 10  # After a write, the user's reads stay on the primary this long
     
     # JWT
     SECRET_KEY: str = "your-super-secret-key-change-in-production"
@@ -15,6 +21,7 @@ class Settings(BaseSettings):
     TELEGRAM_BOT_TOKEN: str = ""  # Client bot token (@YaUberu_AppBot)
     TELEGRAM_COURIER_BOT_TOKEN: str = ""  # Courier bot token (@YaUberu_TeamBot)
     TELEGRAM_BOT_USERNAME: str = "YaUberu_AppBot"
+    TELEGRAM_API_URL: str = "https://api.telegram.org"  # Bot API server (a local stub for load tests)
     
     # Frontend
     FRONTEND_URL: str = "https://ya-uberu-frontend.up.railway.app"
@@ -22,6 +29,50 @@ class Settings(BaseSettings):
     # Admin
     ADMIN_TELEGRAM_IDS: str = "8141463258,574160946,622899263,353392922,443823398"  # Comma-separated admin Telegram IDs
     
+    # Client bot webhook processing
+    CLIENT_BOT_WORKERS: int = 8  # Concurrent update workers (per-chat ordering is kept)
+    CLIENT_BOT_QUEUE_SIZE: int = 2000  # Max queued updates before answering 503
+    CLIENT_BOT_RECORD_UPDATES: str = ""  # Append raw updates to this JSONL file (for replay tests)
+    
+    # Background notification dispatch
+    NOTIFY_WORKERS: int = 4  # Concurrent notification jobs (jobs with the same key run in order)
+    NOTIFY_QUEUE_SIZE: int = 5000  # Max queued jobs before new ones are dropped
+    COURIER_DIGEST: bool = True  # Scheduler: one summary per courier instead of a message per order
+    
+    # Order status events for the Mini App (GET /api/orders/events)
+    EVENTS_PG_NOTIFY: bool = False  # Fan events out to all workers via Postgres LISTEN/NOTIFY
+    EVENTS_HEARTBEAT_SECONDS: int = 15  # Keep-alive comment interval on idle SSE streams
+    
+    # Pickup slot capacity (orders per complex, date and time slot)
+    SLOT_CAPACITY: int = 30  # For complexes without their own slot_capacity and manual addresses
+    SLOT_AVAILABILITY_DAYS: int = 14  # Days in GET /api/orders/availability
+    
+    # Prometheus metrics at GET /metrics (per worker process)
+    METRICS_ENABLED: bool = False
+    METRICS_TOKEN: str = ""  # If set, /metrics needs "Authorization: Bearer <token>" (Prometheus bearer_token)
+    
+    # Logging (app/logging_config.py): queued writer thread, JSON lines or "[TAG] msg" text
+    LOG_LEVEL: str = "INFO"  # DEBUG adds per-recipient / per-subscription detail
+    LOG_FORMAT: str = "json"  # "json" or "text"
+    LOG_DEBUG_SAMPLE_RATE: float = 1.0  # Share of DEBUG records kept (0.01 = 1%)
+    LOG_QUEUE_SIZE: int = 10000  # Records beyond this are dropped, never block a request
+    
+    # SQL profiler (services/sql_profile.py): slow-query log, N+1 suspects, route statement budgets
+    SQL_PROFILE_ENABLED: bool = False
+    SQL_SLOW_MS: float = 200  # Log statements slower than this
+    SQL_REPEAT_LIMIT: int = 10  # Same normalized statement more often in one request = N+1 suspect
+    
+    # OpenTelemetry tracing (app/tracing.py, needs opentelemetry-sdk)
+    TRACING_ENABLED: bool = False
+    TRACING_EXPORTER: str = "file"  # "file" (JSON lines, offline) or "otlp" (OTEL_EXPORTER_OTLP_ENDPOINT)
+    TRACING_FILE: str = "traces.jsonl"
+    TRACING_SERVICE_NAME: str = "yauberu-backend"
+    TRACING_SAMPLE_RATE: float = 1.0  # Share of new traces kept; traces started by the courier bot follow its decision
+    
+    # ORM relationship loading: "raise" (implicit lazy loads are errors) or
+    # "count" (lazy loads allowed but counted per request, X-Lazy-Loads header)
+    ORM_LAZY_LOADS: str = "raise"
+    
     # Support
     SUPPORT_USERNAME: str = "@YaUberu_Support"
     SUPPORT_PHONE: str = "+7 (999) 123-45-67"
@@ -36,6 +87,7 @@ class Settings(BaseSettings):
     # YooKassa
     YOOKASSA_SHOP_ID: str = ""
     YOOKASSA_SECRET_KEY: str = ""
+    YOOKASSA_API_URL: str = "https://api.yookassa.ru/v3"  # A local stub for load tests
 
     class Config:
         env_file = ".env"
@@ -47,6 +99,17 @@ class Settings(BaseSettings):
             return []
         return [int(id.strip()) for id in self.ADMIN_TELEGRAM_IDS.split(",") if id.strip()]
 
+    @property
+    def read_urls(self) -> list:
+        """Replica URLs from comma-separated DATABASE_READ_URL"""
+        return [url.strip() for url in self.DATABASE_READ_URL.split(",") if url.strip()]
+
+def mask_token(token: str) -> str:
+    if not token:
+        return "EMPTY"
+    return f"{token.split(':', 1)[0]}:***"
+
+
 @lru_cache()
 def get_settings() -> Settings:
     settings = Settings()
@@ -54,10 +117,14 @@ def get_settings() -> Settings:
     # Auto-fix Railway DATABASE_URL for asyncpg
     if settings.DATABASE_URL and settings.DATABASE_URL.startswith("postgresql://"):
         settings.DATABASE_URL = settings.DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+    if settings.DATABASE_READ_URL:
+        settings.DATABASE_READ_URL = ",".join(
+            url.replace("postgresql://", "postgresql+asyncpg://", 1) for url in settings.read_urls
+        )
     
-    # DEBUG: Print bot tokens (first 20 chars only for security)
-    print(f"[CONFIG] TELEGRAM_BOT_TOKEN: {settings.TELEGRAM_BOT_TOKEN[:20] if settings.TELEGRAM_BOT_TOKEN else 'EMPTY'}...")
-    print(f"[CONFIG] TELEGRAM_COURIER_BOT_TOKEN: {settings.TELEGRAM_COURIER_BOT_TOKEN[:20] if settings.TELEGRAM_COURIER_BOT_TOKEN else 'EMPTY'}...")
+    # Bot id only (the part before ":"), never the secret
+    print(f"[CONFIG] TELEGRAM_BOT_TOKEN: {mask_token(settings.TELEGRAM_BOT_TOKEN)}")
+    print(f"[CONFIG] TELEGRAM_COURIER_BOT_TOKEN: {mask_token(settings.TELEGRAM_COURIER_BOT_TOKEN)}")
     print(f"[CONFIG] ADMIN_IDS: {settings.admin_ids}")
         
     return settings
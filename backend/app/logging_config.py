@@ -0,0 +1,172 @@
+"""
+Logging: non-blocking, tagged, optionally JSON
+
+Call sites log through get_logger("TAG"), the same tags the old print()
+lines carried ([NOTIFY], [WEBHOOK], ...). Records go into a bounded queue
+(QueueHandler); a QueueListener thread formats and writes them, so a slow
+stdout pipe never stalls the event loop. When the queue is full, records are
+dropped and counted instead of blocking.
+
+LOG_FORMAT=json writes one object per line ({"ts", "level", "tag", "msg",
+"request_id", ...extra}); "text" keeps the "[TAG] message" layout.
+DEBUG records (per-recipient and per-subscription detail) are sampled with
+LOG_DEBUG_SAMPLE_RATE when LOG_LEVEL=DEBUG.
+
+RequestIdMiddleware takes X-Request-ID (or generates one), returns it in the
+response and attaches it to every record logged while handling the request,
+including background jobs dispatched from it.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from app.config import settings
+
+ROOT = "app"
+# Attributes every LogRecord has; anything else came in through extra={...}
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "request_id", "tag"}
+
+request_id_var: ContextVar = ContextVar("request_id", default=None)
+
+_listener = None
+dropped = 0
+
+
+def get_logger(tag: str) -> logging.Logger:
+    setup_logging()
+    return logging.getLogger(f"{ROOT}.{tag}")
+
+
+class _ContextFilter(logging.Filter):
+    """Runs in the logging thread of the caller: stamps tag and request id, samples DEBUG"""
+
+    def __init__(self, debug_sample_rate: float):
+        super().__init__()
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno == logging.DEBUG and self.debug_sample_rate < 1 \
+                and random.random() >= self.debug_sample_rate:
+            return False
+        record.tag = record.name[len(ROOT) + 1:] if record.name.startswith(ROOT + ".") else record.name
+        record.request_id = request_id_var.get()
+        return True
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    def enqueue(self, record: logging.LogRecord):
+        global dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped += 1
+
+
+class TextFormatter(logging.Formatter):
+    """[TAG] message, [TAG ERROR] message for errors"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        suffix = " ERROR" if record.levelno >= logging.ERROR else " WARNING" if record.levelno == logging.WARNING else ""
+        line = f"[{getattr(record, 'tag', record.name)}{suffix}] {record.getMessage()}"
+        if getattr(record, "request_id", None):
+            line += f" (req {record.request_id})"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "tag": getattr(record, "tag", record.name),
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(level: str = None, fmt: str = None, stream=None, force: bool = False):
+    """Configure the "app" logger tree once (get_logger calls this); force=True reconfigures"""
+    global _listener
+    if _listener is not None and not force:
+        return
+    shutdown_logging()
+
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(JsonFormatter() if (fmt or settings.LOG_FORMAT) == "json" else TextFormatter())
+    log_queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    queue_handler = _DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(_ContextFilter(settings.LOG_DEBUG_SAMPLE_RATE))
+
+    root = logging.getLogger(ROOT)
+    root.handlers[:] = [queue_handler]
+    root.setLevel((level or settings.LOG_LEVEL).upper())
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, handler)
+    _listener.start()
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread; later records are written synchronously"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        root = logging.getLogger(ROOT)
+        filters = [f for h in root.handlers for f in h.filters]
+        root.handlers[:] = list(_listener.handlers)
+        for handler in root.handlers:
+            for f in filters:
+                handler.addFilter(f)
+        _listener = None
+
+
+atexit.register(shutdown_logging)
+
+
+class RequestIdMiddleware:
+    """Pure ASGI: X-Request-ID in, X-Request-ID out, request_id on every log record"""
+
+    header = b"x-request-id"
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == self.header:
+                # Keep caller ids short and printable
+                request_id = value.decode("latin-1")[:64] or None
+                break
+        request_id = request_id or uuid.uuid4().hex[:16]
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(self.header, request_id.encode("latin-1"))]
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id_var.reset(token)
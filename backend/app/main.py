@@ -1,23 +1,30 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
 import asyncio
+import hmac
 
-from app.config import settings
+from app.config import settings, mask_token
+from app.logging_config import get_logger, shutdown_logging, RequestIdMiddleware
+from app import logging_config, tracing
 from app.api import auth, orders, users, admin, courier, client_bot, payments
-from app.models.base import Base, engine
+from app.models.base import Base, engine, async_session, read_engine
+from app.models import replicas
 from app.services.scheduler import generate_orders_for_today
+from app.services.ledger import snapshot_balances
+from app.services import telegram_api, telegram_media, dispatcher, events, courier_board, metrics, sql_profile
 # Import models to ensure they are registered with Base
 from app import models
+from app.models import loading
 
-# ============== DEBUG: PRINT BOT TOKENS AT STARTUP ==============
-print("=" * 60)
-print("🚀 YA UBERU BACKEND STARTING")
-print("=" * 60)
-print(f"[TOKENS] CLIENT BOT: {settings.TELEGRAM_BOT_TOKEN[:30] if settings.TELEGRAM_BOT_TOKEN else '❌ EMPTY'}...")
-print(f"[TOKENS] COURIER BOT: {settings.TELEGRAM_COURIER_BOT_TOKEN[:30] if settings.TELEGRAM_COURIER_BOT_TOKEN else '❌ EMPTY'}...")
-print(f"[TOKENS] ADMIN IDS: {settings.admin_ids}")
-print("=" * 60)
+log = get_logger("STARTUP")
+scheduler_log = get_logger("SCHEDULER")
+
+log.info(
+    "🚀 YA UBERU BACKEND STARTING: client bot %s, courier bot %s, admin ids %s",
+    mask_token(settings.TELEGRAM_BOT_TOKEN), mask_token(settings.TELEGRAM_COURIER_BOT_TOKEN), settings.admin_ids,
+)
 
 
 async def scheduler_background_task():
@@ -35,17 +42,26 @@ async def scheduler_background_task():
             target += datetime.timedelta(days=1)
         
         wait_seconds = (target - now).total_seconds()
-        print(f"[SCHEDULER] Next run in {wait_seconds/3600:.1f} hours at {target}")
+        scheduler_log.info("Next run in %.1f hours at %s", wait_seconds / 3600, target)
         
         await asyncio.sleep(wait_seconds)
         
         # Run scheduler
         try:
-            print("[SCHEDULER] Running daily order generation...")
+            scheduler_log.info("Running daily order generation...")
             generated, skipped = await generate_orders_for_today()
-            print(f"[SCHEDULER] Done: {generated} generated, {skipped} skipped")
-        except Exception as e:
-            print(f"[SCHEDULER] Error: {e}")
+            scheduler_log.info("Done: %d generated, %d skipped", generated, skipped)
+        except Exception:
+            scheduler_log.exception("Daily order generation failed")
+        
+        # Checkpoint the balance ledger
+        try:
+            async with async_session() as db:
+                written = await snapshot_balances(db)
+                await db.commit()
+            scheduler_log.info("Balance snapshots updated: %d", written)
+        except Exception:
+            scheduler_log.exception("Snapshot error")
 
 
 @asynccontextmanager
@@ -54,25 +70,55 @@ async def lifespan(app: FastAPI):
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
     
+    # Load cached Telegram file_ids before the first /start
+    try:
+        await telegram_media.load()
+    except Exception as e:
+        log.warning("Media registry not loaded: %s", e)
+    
+    # Start client bot update workers and the notification dispatcher
+    client_bot.update_queue.start()
+    dispatcher.notification_queue.start()
+    
+    # Cross-worker order events (no-op unless EVENTS_PG_NOTIFY is set)
+    await events.bus.start()
+    
     # Start background scheduler task
     scheduler_task = asyncio.create_task(scheduler_background_task())
-    print("[STARTUP] Scheduler background task started")
+    log.info("Scheduler background task started")
+    
+    # Keep the courier board in step with day rollover and out-of-band edits
+    board_task = asyncio.create_task(courier_board.run_refresher())
+    
+    # Replica lag for read routing (no-op without DATABASE_READ_URL)
+    lag_task = asyncio.create_task(replicas.run_lag_monitor())
     
     # Run scheduler once on startup (catch up for today)
     try:
         generated, skipped = await generate_orders_for_today()
-        print(f"[STARTUP] Initial scheduler run: {generated} generated, {skipped} skipped")
-    except Exception as e:
-        print(f"[STARTUP] Initial scheduler error: {e}")
+        log.info("Initial scheduler run: %d generated, %d skipped", generated, skipped)
+    except Exception:
+        log.exception("Initial scheduler error")
     
     yield
     
-    # Shutdown: cancel scheduler
-    scheduler_task.cancel()
-    try:
-        await scheduler_task
-    except asyncio.CancelledError:
-        pass
+    # Shutdown: cancel scheduler, board refresher and lag monitor
+    for task in (scheduler_task, board_task, lag_task):
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    
+    # Finish queued bot updates
+    await client_bot.update_queue.stop()
+    # Deliver pending notifications before closing the Telegram client
+    await dispatcher.notification_queue.stop(timeout=15)
+    await telegram_api.close_client()
+    await events.bus.stop()
+    tracing.shutdown_tracing()
+    # Flush queued log records last
+    shutdown_logging()
 
 app = FastAPI(
     title=settings.APP_NAME,
@@ -92,6 +138,66 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ORM_LAZY_LOADS=count: report implicit relationship loads per request
+if loading.COUNT_MODE:
+    @app.middleware("http")
+    async def count_lazy_loads(request, call_next):
+        loads = loading.start_request()
+        response = await call_next(request)
+        response.headers["X-Lazy-Loads"] = str(len(loads))
+        if loads:
+            get_logger("LAZY LOAD").warning("%s %s: %d (%s)", request.method, request.url.path,
+                                            len(loads), ", ".join(sorted(set(loads))))
+        return response
+
+# Prometheus metrics: route latency, SQL per request, DB connections (see services/metrics.py)
+if settings.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+    for db_engine in (engine, read_engine, *replicas.engines()):
+        metrics.instrument_engine(db_engine)
+    metrics.watch_worker_pool(client_bot.update_queue)
+    metrics.watch_worker_pool(dispatcher.notification_queue)
+
+    @metrics.collector
+    def collect_sse_subscribers():
+        metrics.sse_subscribers.set(events.bus.stats()["subscribers"])
+
+    @metrics.collector
+    def collect_log_dropped():
+        metrics.log_records_dropped.set(logging_config.dropped)
+
+    @metrics.collector
+    def collect_replica_lag():
+        for replica in replicas.replicas:
+            metrics.db_replica_lag.set(-1 if replica.lag is None else replica.lag, replica.name)
+
+    if not settings.METRICS_TOKEN:
+        log.warning("METRICS_TOKEN is not set: GET /metrics is open to anyone who can reach the app")
+
+    @app.get("/metrics", include_in_schema=False)
+    async def prometheus_metrics(request: Request):
+        # Routes, traffic, queue depths and replica lag are not public: Prometheus sends the token
+        if settings.METRICS_TOKEN and not hmac.compare_digest(
+            request.headers.get("authorization", "").encode(), f"Bearer {settings.METRICS_TOKEN}".encode(),
+        ):
+            return PlainTextResponse("Unauthorized", status_code=401, headers={"WWW-Authenticate": "Bearer"})
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# SQL profiler: slow queries, N+1 suspects, @statement_budget (see services/sql_profile.py)
+if settings.SQL_PROFILE_ENABLED:
+    app.add_middleware(sql_profile.SqlProfileMiddleware)
+    for db_engine in (engine, read_engine, *replicas.engines()):
+        sql_profile.instrument_engine(db_engine)
+
+# OpenTelemetry spans for requests and SQL (no-op unless TRACING_ENABLED, see app/tracing.py)
+if tracing.setup_tracing():
+    app.add_middleware(tracing.TracingMiddleware)
+    for db_engine in (engine, read_engine, *replicas.engines()):
+        tracing.instrument_engine(db_engine)
+
+# Outermost: request ids cover everything logged while handling the request
+app.add_middleware(RequestIdMiddleware)
+
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(users.router, prefix="/api/users", tags=["Users"])
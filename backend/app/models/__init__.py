@@ -1,12 +1,17 @@
-from app.models.base import Base, engine, async_session, get_db
-from app.models.user import User, UserRole, Address, ResidentialComplex, Balance, BalanceTransaction, ComplexBuilding
-from app.models.order import Order, OrderStatus, TimeSlot, Tariff, Subscription, TrialUsage, TariffPrice, Payment
+from app.models.base import Base, engine, async_session, get_db, read_engine, read_session
+from app.models.replicas import get_read_db
+from app.models.user import User, UserRole, Address, ResidentialComplex, Balance, BalanceTransaction, BalanceSnapshot, ComplexBuilding
+from app.models.order import Order, OrderStatus, TimeSlot, Tariff, Subscription, SlotBooking, TrialUsage, TariffPrice, Payment
+from app.models.telegram import TelegramMedia
 
 __all__ = [
     "Base",
     "engine",
     "async_session",
     "get_db",
+    "read_engine",
+    "read_session",
+    "get_read_db",
     "User",
     "UserRole",
     "Address",
@@ -14,13 +19,16 @@ __all__ = [
     "ComplexBuilding",
     "Balance",
     "BalanceTransaction",
+    "BalanceSnapshot",
     "Order",
     "OrderStatus",
     "TimeSlot",
     "Tariff",
     "Subscription",
+    "SlotBooking",
     "TrialUsage",
     "TariffPrice",
     "Payment",
+    "TelegramMedia",
 ]
 
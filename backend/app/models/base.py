@@ -1,12 +1,18 @@
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 from datetime import datetime
-from sqlalchemy import Column, DateTime
+from sqlalchemy import Column, DateTime, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.pool import NullPool
 
 from app.config import settings
 
 
+# Relationships never load implicitly: queries must use selectinload/joinedload
+# (or explicit joins). In "count" mode they lazy-load and app.models.loading counts it.
+RELATIONSHIP_LAZY = "select" if settings.ORM_LAZY_LOADS == "count" else "raise"
+
+
 class Base(DeclarativeBase):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -20,7 +26,51 @@ engine = create_async_engine(
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
+def _create_read_engine(url: str, replica: bool):
+    """
+    Engine for read-only sessions. The database itself refuses writes:
+    - Postgres: default_transaction_read_only for the connection, statements in
+      autocommit (no BEGIN / COMMIT round-trips). With DB_READ_DEFERRABLE each
+      request gets one snapshot instead: SERIALIZABLE READ ONLY DEFERRABLE on
+      the primary, REPEATABLE READ READ ONLY on a replica (hot standbys reject
+      SERIALIZABLE)
+    - SQLite: PRAGMA query_only on every connection
+    """
+    if make_url(url).get_backend_name() != "postgresql":
+        read_engine = create_async_engine(url, echo=settings.DEBUG, poolclass=NullPool)
+
+        @event.listens_for(read_engine.sync_engine, "connect")
+        def _query_only(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA query_only = ON")
+            cursor.close()
+
+        return read_engine
+
+    if not settings.DB_READ_DEFERRABLE:
+        return create_async_engine(
+            url,
+            echo=settings.DEBUG,
+            poolclass=NullPool,
+            isolation_level="AUTOCOMMIT",
+            connect_args={"server_settings": {"default_transaction_read_only": "on"}},
+        )
+    return create_async_engine(
+        url,
+        echo=settings.DEBUG,
+        poolclass=NullPool,
+        isolation_level="REPEATABLE READ" if replica else "SERIALIZABLE",
+        execution_options={"postgresql_readonly": True, "postgresql_deferrable": not replica},
+    )
+
+
+# Read-only engine on the primary: read sessions use it when no replica is usable (models/replicas.py)
+read_engine = _create_read_engine(settings.DATABASE_URL, replica=False)
+read_session = async_sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+
+
 async def get_db():
+    """Read-write session: committed after the handler, rolled back on an error"""
     async with async_session() as session:
         try:
             yield session
@@ -31,3 +81,4 @@ async def get_db():
         finally:
             await session.close()
 
+
@@ -0,0 +1,48 @@
+"""
+Lazy-load accounting for ORM_LAZY_LOADS="count"
+
+In count mode relationships lazy-load instead of raising; every such load is
+recorded against the current request (see the middleware in app.main) and logged,
+so endpoints can be checked for implicit loads before switching back to "raise".
+Note that under AsyncSession a lazy load outside of flush/run_sync still fails
+with MissingGreenlet - it is counted first, which is what points at the culprit.
+"""
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.logging_config import get_logger
+
+log = get_logger("LAZY LOAD")
+
+COUNT_MODE = settings.ORM_LAZY_LOADS == "count"
+
+# Per-request list of "Model.relationship" names that were lazy-loaded
+_lazy_loads: ContextVar = ContextVar("lazy_loads", default=None)
+
+
+def start_request() -> list:
+    loads = []
+    _lazy_loads.set(loads)
+    return loads
+
+
+def _on_orm_execute(orm_execute_state):
+    if not orm_execute_state.is_select:
+        return
+    state = orm_execute_state.lazy_loaded_from
+    if state is None:
+        return
+    # The relationship being loaded is the last element of the load path
+    path = orm_execute_state.loader_strategy_path
+    name = f"{state.class_.__name__}.{path[-1].key}" if path else state.class_.__name__
+    loads = _lazy_loads.get()
+    if loads is not None:
+        loads.append(name)
+    log.debug("%s", name)
+
+
+if COUNT_MODE:
+    event.listen(Session, "do_orm_execute", _on_orm_execute)
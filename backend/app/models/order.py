@@ -1,8 +1,8 @@
-from sqlalchemy import Column, Integer, String, Boolean, Date, Time, ForeignKey, Enum as SQLEnum, Text
+from sqlalchemy import Column, Integer, String, Boolean, Date, Time, ForeignKey, Index, Enum as SQLEnum, Text
 from sqlalchemy.orm import relationship
 import enum
 
-from app.models.base import Base
+from app.models.base import Base, RELATIONSHIP_LAZY
 
 
 class OrderStatus(str, enum.Enum):
@@ -71,10 +71,27 @@ class Order(Base):
     was_rescheduled = Column(Boolean, default=False)
     
     # Relationships
-    user = relationship("User", back_populates="orders", foreign_keys=[user_id])
-    address = relationship("Address", back_populates="orders")
-    courier = relationship("User", foreign_keys=[courier_id])
-    subscription = relationship("Subscription", back_populates="orders")
+    user = relationship("User", back_populates="orders", foreign_keys=[user_id], lazy=RELATIONSHIP_LAZY)
+    address = relationship("Address", back_populates="orders", lazy=RELATIONSHIP_LAZY)
+    courier = relationship("User", foreign_keys=[courier_id], lazy=RELATIONSHIP_LAZY)
+    subscription = relationship("Subscription", back_populates="orders", lazy=RELATIONSHIP_LAZY)
+
+    __table_args__ = (
+        # GET /api/orders: history pages by (date, id), incremental sync by (updated_at, id)
+        Index("ix_orders_user_date_id", "user_id", "date", "id"),
+        Index("ix_orders_user_updated_id", "user_id", "updated_at", "id"),
+    )
+
+
+class SlotBooking(Base):
+    """Booked pickups per complex, date and time slot (see services/slot_capacity.py)"""
+    __tablename__ = "slot_bookings"
+
+    # The primary key doubles as the availability index: one range scan per complex
+    complex_id = Column(Integer, primary_key=True)  # 0 = addresses outside any complex
+    date = Column(Date, primary_key=True)
+    time_slot = Column(SQLEnum(TimeSlot), primary_key=True)
+    booked = Column(Integer, nullable=False, default=0)
 
 
 class Subscription(Base):
@@ -105,9 +122,9 @@ class Subscription(Base):
     last_generated_date = Column(Date, nullable=True)
     
     # Relationships
-    orders = relationship("Order", back_populates="subscription")
-    user = relationship("User")
-    address = relationship("Address")
+    orders = relationship("Order", back_populates="subscription", lazy=RELATIONSHIP_LAZY)
+    user = relationship("User", lazy=RELATIONSHIP_LAZY)
+    address = relationship("Address", lazy=RELATIONSHIP_LAZY)
 
 
 class TrialUsage(Base):
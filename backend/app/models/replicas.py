@@ -0,0 +1,201 @@
+"""
+Read replicas: lag-aware routing of read-only sessions
+
+DATABASE_READ_URL lists replicas (comma-separated). get_read_db (GET routes)
+and analytics_session() (reports) go round-robin to replicas whose lag is
+within DB_REPLICA_MAX_LAG_SECONDS, and to the primary's read-only engine
+(base.read_engine) when none is, or none are configured.
+
+run_lag_monitor() probes lag every DB_REPLICA_LAG_CHECK_SECONDS:
+- Postgres: now() - pg_last_xact_replay_timestamp() while the standby has
+  WAL left to replay, 0 once it has caught up
+- SQLite (a copy of the primary file, for local testing): time since the copy
+  was taken if the primary was written after it, else 0. Refresh the copy with
+  `sqlite3 sql_app.db ".backup replica.db"` or plain cp (not cp -p)
+A replica that has not answered a probe yet, or failed the last one, gets no reads.
+
+Read-your-writes: a user who just wrote is pinned to the primary for
+DB_READ_YOUR_WRITES_SECONDS. get_current_user marks its session with the user
+id, and a commit that wrote something pins that user; routes writing for a user
+without get_current_user (login, the payment webhook) call pin_to_primary().
+get_current_user_read moves a pinned user's read session to the primary.
+Pins live in the worker process. Reads that hand out a position to resume
+from (GET /api/orders?since=...) call read_from_primary(): a token taken
+past changes a replica has not replayed yet would skip them for good.
+"""
+import asyncio
+import itertools
+import os
+import time
+from typing import Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.logging_config import get_logger
+from app.models.base import _create_read_engine, read_engine, read_session
+
+log = get_logger("REPLICA")
+
+_PG_LAG = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+def _mtime(path: str) -> float:
+    """Last write to a SQLite database, counting its WAL file"""
+    wal = path + "-wal"
+    return max(os.stat(path).st_mtime, os.stat(wal).st_mtime if os.path.exists(wal) else 0)
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = make_url(url)
+        self.name = self.url.host or os.path.basename(self.url.database or "")
+        self.engine = _create_read_engine(url, replica=True)
+        self.session = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+        self.lag: Optional[float] = None  # Seconds; None until probed or after a failed probe
+        self.failing = False
+
+    @property
+    def usable(self) -> bool:
+        return self.lag is not None and self.lag <= settings.DB_REPLICA_MAX_LAG_SECONDS
+
+    async def measure_lag(self) -> float:
+        if self.url.get_backend_name() == "postgresql":
+            async with self.engine.connect() as conn:
+                return float(await conn.scalar(_PG_LAG))
+        # Stat before connecting: SQLite would create a missing file
+        copied = _mtime(self.url.database)
+        if _mtime(make_url(settings.DATABASE_URL).database) <= copied:
+            return 0.0
+        return time.time() - copied
+
+
+replicas = [Replica(url) for url in settings.read_urls]
+_round_robin = itertools.count()
+_pinned = {}  # user id -> time.monotonic() until which their reads go to the primary
+
+
+def engines() -> list:
+    return [replica.engine for replica in replicas]
+
+
+def pick() -> async_sessionmaker:
+    """Session factory for a read: a replica within the lag limit, else the primary"""
+    usable = [replica for replica in replicas if replica.usable]
+    if not usable:
+        return read_session
+    return usable[next(_round_robin) % len(usable)].session
+
+
+async def get_read_db():
+    """
+    Read-only session for GET routes: no autoflush and no commit, the
+    connection is just released after the handler. Writing through it fails.
+    """
+    async with pick()() as session:
+        yield session
+
+
+def analytics_session() -> AsyncSession:
+    """Read-only session for reports and background analytics (await check_lag() first outside the app)"""
+    return pick()()
+
+
+# ============ LAG MONITOR ============
+
+async def _probe(replica: Replica):
+    was_usable = replica.usable
+    try:
+        replica.lag = await asyncio.wait_for(replica.measure_lag(), timeout=settings.DB_REPLICA_LAG_CHECK_SECONDS)
+    except Exception as e:
+        if not replica.failing:
+            log.warning("Replica %s unreachable, reads go elsewhere: %s", replica.name, str(e) or type(e).__name__)
+        replica.lag, replica.failing = None, True
+        return
+    replica.failing = False
+    if was_usable and not replica.usable:
+        log.warning("Replica %s lags %.1f s (limit %s s), reads go elsewhere",
+                    replica.name, replica.lag, settings.DB_REPLICA_MAX_LAG_SECONDS)
+    elif replica.usable and not was_usable:
+        log.info("Replica %s in rotation (lag %.1f s)", replica.name, replica.lag)
+
+
+async def check_lag():
+    """Probe every replica once"""
+    await asyncio.gather(*(_probe(replica) for replica in replicas))
+    now = time.monotonic()
+    for user_id in [user_id for user_id, until in _pinned.items() if until < now]:
+        del _pinned[user_id]
+
+
+async def run_lag_monitor():
+    """Background task: keep replica lag current"""
+    if not replicas:
+        return
+    while True:
+        await check_lag()
+        await asyncio.sleep(settings.DB_REPLICA_LAG_CHECK_SECONDS)
+
+
+# ============ READ-YOUR-WRITES ============
+
+def pin_to_primary(user_id: int):
+    """Send the user's reads to the primary for DB_READ_YOUR_WRITES_SECONDS (they just wrote)"""
+    if replicas:
+        _pinned[user_id] = time.monotonic() + settings.DB_READ_YOUR_WRITES_SECONDS
+
+
+def is_pinned(user_id: int) -> bool:
+    until = _pinned.get(user_id)
+    return until is not None and until >= time.monotonic()
+
+
+def _to_primary(session: AsyncSession):
+    session.bind = read_engine
+    session.sync_session.bind = read_engine.sync_engine
+
+
+def read_own_writes(session: AsyncSession, user_id: int):
+    """Move a read session that has not run a statement yet to the primary if the user is pinned"""
+    if is_pinned(user_id) and session.bind is not read_engine:
+        _to_primary(session)
+
+
+async def read_from_primary(session: AsyncSession):
+    """
+    Move a read session to the primary's read-only engine. Closes it first:
+    objects it loaded stay usable (detached), its replica connection is released.
+    """
+    if session.bind is not read_engine:
+        await session.close()
+        _to_primary(session)
+
+
+def _flushed(session, flush_context):
+    session.info["wrote"] = True
+
+
+def _executed(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        state.session.info["wrote"] = True
+
+
+def _committed(session):
+    user_id = session.info.get("user_id")
+    if session.info.pop("wrote", False) and user_id is not None:
+        pin_to_primary(user_id)
+
+
+if replicas:
+    event.listen(Session, "after_flush", _flushed)
+    event.listen(Session, "do_orm_execute", _executed)
+    event.listen(Session, "after_commit", _committed)
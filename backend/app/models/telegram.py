@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer, String
+
+from app.models.base import Base
+
+
+class TelegramMedia(Base):
+    """Telegram file_id of an uploaded asset, so it is never re-fetched by URL"""
+    __tablename__ = "telegram_media"
+
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String(50), unique=True, nullable=False)  # e.g. 'welcome_1', 'menu'
+    source_url = Column(String(500), nullable=False)
+    file_id = Column(String(200), nullable=False)
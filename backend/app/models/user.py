@@ -1,8 +1,8 @@
-from sqlalchemy import Column, Integer, String, Boolean, BigInteger, ForeignKey, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Boolean, BigInteger, ForeignKey, Index, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 import enum
 
-from app.models.base import Base
+from app.models.base import Base, RELATIONSHIP_LAZY
 
 
 class UserRole(str, enum.Enum):
@@ -22,10 +22,14 @@ class User(Base):
     role = Column(SQLEnum(UserRole), default=UserRole.CLIENT)
     is_active = Column(Boolean, default=True)
     
+    # Denormalized counters, maintained by app.services.user_stats
+    orders_count = Column(Integer, default=0, nullable=False)  # All orders ever created (incl. cancelled)
+    active_subscriptions_count = Column(Integer, default=0, nullable=False)
+    
     # Relationships
-    addresses = relationship("Address", back_populates="user")
-    orders = relationship("Order", back_populates="user", foreign_keys="Order.user_id")
-    balance = relationship("Balance", back_populates="user", uselist=False)
+    addresses = relationship("Address", back_populates="user", lazy=RELATIONSHIP_LAZY)
+    orders = relationship("Order", back_populates="user", foreign_keys="Order.user_id", lazy=RELATIONSHIP_LAZY)
+    balance = relationship("Balance", back_populates="user", uselist=False, lazy=RELATIONSHIP_LAZY)
 
 
 class Address(Base):
@@ -49,9 +53,9 @@ class Address(Base):
     # This will be enforced at application level
     
     # Relationships
-    user = relationship("User", back_populates="addresses")
-    complex = relationship("ResidentialComplex")
-    orders = relationship("Order", back_populates="address")
+    user = relationship("User", back_populates="addresses", lazy=RELATIONSHIP_LAZY)
+    complex = relationship("ResidentialComplex", lazy=RELATIONSHIP_LAZY)
+    orders = relationship("Order", back_populates="address", lazy=RELATIONSHIP_LAZY)
 
 
 class ResidentialComplex(Base):
@@ -61,8 +65,9 @@ class ResidentialComplex(Base):
     name = Column(String(100), nullable=False)
     short_name = Column(String(20))  # For courier display
     is_active = Column(Boolean, default=True)
+    slot_capacity = Column(Integer, nullable=True)  # Pickups per time slot; None = settings.SLOT_CAPACITY
     
-    buildings = relationship("ComplexBuilding", back_populates="complex", cascade="all, delete-orphan")
+    buildings = relationship("ComplexBuilding", back_populates="complex", cascade="all, delete-orphan", lazy=RELATIONSHIP_LAZY)
 
 
 class ComplexBuilding(Base):
@@ -72,7 +77,7 @@ class ComplexBuilding(Base):
     complex_id = Column(Integer, ForeignKey("residential_complexes.id"), nullable=False)
     building_number = Column(String(50), nullable=False)
     
-    complex = relationship("ResidentialComplex", back_populates="buildings")
+    complex = relationship("ResidentialComplex", back_populates="buildings", lazy=RELATIONSHIP_LAZY)
 
 
 class Balance(Base):
@@ -84,19 +89,40 @@ class Balance(Base):
     single_credits = Column(Integer, default=0)  # Single pickups (можно перенести на любую дату)
     
     # Relationships
-    user = relationship("User", back_populates="balance")
-    transactions = relationship("BalanceTransaction", back_populates="balance")
+    user = relationship("User", back_populates="balance", lazy=RELATIONSHIP_LAZY)
+    transactions = relationship("BalanceTransaction", back_populates="balance", lazy=RELATIONSHIP_LAZY)
 
 
 class BalanceTransaction(Base):
+    """Append-only ledger row, written only by app.services.ledger"""
     __tablename__ = "balance_transactions"
+    __table_args__ = (
+        Index("ix_balance_transactions_balance_id_id", "balance_id", "id"),
+        Index("ix_balance_transactions_order_id", "order_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     balance_id = Column(Integer, ForeignKey("balances.id"), nullable=False)
     amount = Column(Integer, nullable=False)  # Positive = credit, Negative = debit
+    credit_type = Column(String(20), default="credits", nullable=False)  # 'credits' or 'single_credits'
     description = Column(String(200))
+    kind = Column(String(30), nullable=True)  # What the entry is for, when code acts on it (ledger.COMPLETION, ...)
     order_id = Column(Integer, ForeignKey("orders.id"), nullable=True)
     
     # Relationships
-    balance = relationship("Balance", back_populates="transactions")
+    balance = relationship("Balance", back_populates="transactions", lazy=RELATIONSHIP_LAZY)
+
+
+class BalanceSnapshot(Base):
+    """
+    Ledger checkpoint: balance values after applying all transactions up to last_transaction_id.
+    Reconciliation = snapshot + transactions with id > last_transaction_id.
+    """
+    __tablename__ = "balance_snapshots"
+
+    id = Column(Integer, primary_key=True, index=True)
+    balance_id = Column(Integer, ForeignKey("balances.id"), unique=True, nullable=False)
+    credits = Column(Integer, default=0, nullable=False)
+    single_credits = Column(Integer, default=0, nullable=False)
+    last_transaction_id = Column(Integer, default=0, nullable=False)
 
@@ -0,0 +1,91 @@
+"""
+Human-readable addresses for couriers, clients and admins
+
+format_address() is the single formatting rule. Formatted strings are memoized
+by address_id and loaded in batches (addresses outer-joined to complexes, one
+query per batch). Call invalidate_address / invalidate_complex after editing or
+deleting an address or a complex.
+"""
+from typing import Iterable, NamedTuple, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Address, ResidentialComplex
+
+MAX_ENTRIES = 20000
+
+
+class AddressView(NamedTuple):
+    complex_id: Optional[int]
+    full: str    # "ул. Ленина, ЖК Пример, д. 1, кв. 5"
+    short: str   # Without apartment, for building-level lists
+    group: str   # Complex name, or the street outside a complex (digests)
+    building: str
+
+
+def format_address(street: str, complex_name: str, building: str, apartment: str = None) -> str:
+    """
+    "street, complex, д. building, кв. apartment", skipping missing parts.
+    This is the order new-order notifications always used. Take/complete
+    messages and the scheduler used to drop the street for addresses in a
+    complex; they now show it too.
+    """
+    parts = []
+    if street:
+        parts.append(street)
+    if complex_name:
+        parts.append(complex_name)
+    parts.append(f"д. {building}")
+    if apartment:
+        parts.append(f"кв. {apartment}")
+    return ", ".join(parts)
+
+
+def _view(complex_id, street, complex_name, building, apartment) -> AddressView:
+    return AddressView(
+        complex_id=complex_id,
+        full=format_address(street, complex_name, building, apartment),
+        short=format_address(street, complex_name, building),
+        group=complex_name or street or "Другой адрес",
+        building=building,
+    )
+
+
+_views = {}
+
+
+def invalidate_address(address_id: int):
+    _views.pop(address_id, None)
+
+
+def invalidate_complex(complex_id: int):
+    for address_id in [a for a, v in _views.items() if v.complex_id == complex_id]:
+        del _views[address_id]
+
+
+async def load_addresses(db: AsyncSession, address_ids: Iterable[int]) -> dict:
+    """{address_id: AddressView} for the given ids; uncached ones are fetched in one query"""
+    ids = set(address_ids)
+    missing = [address_id for address_id in ids if address_id not in _views]
+    if missing:
+        if len(_views) + len(missing) > MAX_ENTRIES:
+            _views.clear()
+        result = await db.execute(
+            select(
+                Address.id, Address.complex_id, Address.street, ResidentialComplex.name,
+                Address.building, Address.apartment,
+            )
+            .outerjoin(ResidentialComplex, ResidentialComplex.id == Address.complex_id)
+            .where(Address.id.in_(missing))
+        )
+        for address_id, complex_id, street, complex_name, building, apartment in result.all():
+            _views[address_id] = _view(complex_id, street, complex_name, building, apartment)
+    return {address_id: _views[address_id] for address_id in ids if address_id in _views}
+
+
+async def get_address(db: AsyncSession, address_id: int) -> str:
+    """Full address string ("" if the address does not exist)"""
+    views = await load_addresses(db, [address_id])
+    view = views.get(address_id)
+    return view.full if view else ""
@@ -8,6 +8,10 @@ from urllib.parse import parse_qsl
 from jose import jwt
 
 from app.config import settings
+from app.logging_config import get_logger
+from app.services import recipients
+
+log = get_logger("AUTH")
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -36,7 +40,7 @@ def verify_telegram_data(init_data: str) -> Optional[dict]:
     """
     # PRODUCTION: Token is REQUIRED
     if not settings.TELEGRAM_BOT_TOKEN:
-        print("[AUTH] CRITICAL: TELEGRAM_BOT_TOKEN not set! Auth blocked.")
+        log.critical("TELEGRAM_BOT_TOKEN not set! Auth blocked.")
         return None
     
     try:
@@ -45,7 +49,7 @@ def verify_telegram_data(init_data: str) -> Optional[dict]:
         # Extract hash
         received_hash = parsed_data.pop("hash", None)
         if not received_hash:
-            print("[AUTH] No hash found in init_data")
+            log.warning("No hash found in init_data")
             return None
         
         # Create data check string (sorted keys)
@@ -70,23 +74,22 @@ def verify_telegram_data(init_data: str) -> Optional[dict]:
         
         # Constant-time comparison to prevent timing attacks
         if not hmac.compare_digest(calculated_hash, received_hash):
-            print(f"[AUTH] Hash mismatch!")
-            print(f"[AUTH] Calculated: {calculated_hash[:16]}...")
-            print(f"[AUTH] Received:   {received_hash[:16]}...")
+            # Never log the expected hash: it is a valid signature prefix
+            log.warning("Hash mismatch!")
             return None
         
         # Parse user data
         if "user" in parsed_data:
             parsed_data["user"] = json.loads(parsed_data["user"])
         
-        print(f"[AUTH] Verified user: {parsed_data.get('user', {}).get('id')}")
+        log.debug("Verified user: %s", parsed_data.get("user", {}).get("id"))
         return parsed_data
     
     except Exception as e:
-        print(f"[AUTH] Verification error: {e}")
+        log.warning("Verification error: %s", e)
         return None
 
 
 def is_admin(telegram_id: int) -> bool:
     """Check if user is admin"""
-    return telegram_id in settings.admin_ids
+    return recipients.is_admin(telegram_id)
@@ -0,0 +1,91 @@
+"""
+In-memory snapshot of residential complexes and their buildings
+
+The catalog changes only through admin.create_complex / delete_complex, which
+call invalidate(). Each snapshot is pre-serialized once, with an ETag, so the
+Mini App and the courier bot can revalidate with If-None-Match and get a 304.
+The TTL only catches edits made directly in the DB.
+"""
+import hashlib
+import json
+import time
+from typing import NamedTuple
+
+from fastapi import Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app.models import ResidentialComplex
+
+TTL_SECONDS = 300
+
+
+class CatalogView(NamedTuple):
+    body: bytes
+    etag: str
+
+
+class Catalog(NamedTuple):
+    version: int
+    complexes: tuple           # All complexes as dicts (id, name, short_name, is_active, slot_capacity, buildings)
+    public: CatalogView        # Active complexes, for users.get_residential_complexes
+    admin: CatalogView         # Everything, for admin.list_complexes
+
+
+_catalog = None
+_loaded_at = 0.0
+_version = 0
+
+
+def invalidate():
+    global _catalog
+    _catalog = None
+
+
+def _view(items: list) -> CatalogView:
+    body = json.dumps(items, ensure_ascii=False, separators=(",", ":")).encode()
+    return CatalogView(body=body, etag=f'"{hashlib.sha1(body).hexdigest()[:20]}"')
+
+
+async def get_catalog(db: AsyncSession) -> Catalog:
+    global _catalog, _loaded_at, _version
+    if _catalog is not None and time.monotonic() - _loaded_at < TTL_SECONDS:
+        return _catalog
+
+    result = await db.execute(
+        select(ResidentialComplex)
+        .options(selectinload(ResidentialComplex.buildings))
+        .order_by(ResidentialComplex.id)
+    )
+    complexes = tuple({
+        "id": c.id,
+        "name": c.name,
+        "short_name": c.short_name,
+        "is_active": c.is_active,
+        "slot_capacity": c.slot_capacity,
+        "buildings": [b.building_number for b in c.buildings],
+    } for c in result.scalars().all())
+
+    if _catalog is None or complexes != _catalog.complexes:
+        _version += 1
+    _catalog = Catalog(
+        version=_version,
+        complexes=complexes,
+        public=_view([
+            {"id": c["id"], "name": c["name"], "short_name": c["short_name"], "buildings": c["buildings"]}
+            for c in complexes if c["is_active"]
+        ]),
+        admin=_view(list(complexes)),
+    )
+    _loaded_at = time.monotonic()
+    return _catalog
+
+
+def catalog_response(request: Request, view: CatalogView, cache_control: str) -> Response:
+    """Serve a pre-serialized view, answering 304 when the client's ETag matches"""
+    headers = {"ETag": view.etag, "Cache-Control": cache_control}
+    if_none_match = request.headers.get("if-none-match", "")
+    if view.etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=view.body, media_type="application/json", headers=headers)
@@ -0,0 +1,189 @@
+"""
+In-memory courier board: open orders (scheduled / in progress) for today and
+overdue days, as the courier bot shows them
+
+Order lifecycle endpoints, payments and the scheduler call refresh_orders()
+after commit; reload() diffs a fresh load against the index. Every change is published as a delta on the
+event bus topic TOPIC and applied by the bus listener, so with EVENTS_PG_NOTIFY
+every worker's board follows the same deltas. run_refresher() reloads
+periodically to pick up day rollover (overdue) and edits made outside the API.
+
+Delta: {"order_id": ..., "card": {...} or None (left the board)}, event type
+one of created / taken / completed / undone / cancelled / rescheduled /
+assigned / overdue / updated / removed.
+"""
+import asyncio
+import time
+from datetime import date
+from typing import Iterable, Optional
+
+from sqlalchemy import select, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.models import Order, OrderStatus, User, Address, ResidentialComplex
+from app.models.base import async_session
+from app.logging_config import get_logger
+from app.services import events
+from app.services.address_view import format_address
+
+log = get_logger("COURIER BOARD")
+
+TOPIC = "courier_board"
+OPEN_STATUSES = (OrderStatus.SCHEDULED, OrderStatus.IN_PROGRESS)
+REFRESH_SECONDS = 60
+
+CourierUser = aliased(User)
+
+
+def card_query():
+    """Orders joined with everything a board card shows"""
+    return (
+        select(Order, Address, ResidentialComplex.name, CourierUser.telegram_id)
+        .join(Address, Order.address_id == Address.id)
+        .outerjoin(ResidentialComplex, Address.complex_id == ResidentialComplex.id)
+        .outerjoin(CourierUser, Order.courier_id == CourierUser.id)
+    )
+
+
+def order_card(order, addr, complex_name, courier_telegram_id, today: date) -> dict:
+    """One order as returned by GET /api/courier/orders (plus board keys)"""
+    return {
+        "id": order.id,
+        "complex_id": addr.complex_id or 0,
+        "street": addr.street,
+        # Building-level address (apartment is a separate field)
+        "full_address": format_address(addr.street, complex_name, addr.building),
+        "complex_name": complex_name or "Другой адрес",
+        "building": addr.building,
+        "entrance": addr.entrance,
+        "floor": addr.floor,
+        "apartment": addr.apartment,
+        "intercom": addr.intercom,
+        "date": order.date.strftime('%d.%m.%Y') if order.date else None,
+        "time_slot": order.time_slot.value if hasattr(order.time_slot, "value") else order.time_slot,
+        "status": order.status.value,
+        "comment": order.comment,
+        "courier_telegram_id": courier_telegram_id,
+        "is_overdue": order.date < today if order.date else False,
+    }
+
+
+def _on_board(order, today: date) -> bool:
+    return order.status in OPEN_STATUSES and order.date is not None and order.date <= today
+
+
+class CourierBoard:
+    def __init__(self):
+        self.cards = {}          # order_id -> card
+        self.version = 0
+        self.day = None          # date the board was loaded for
+        self.loaded_at = 0.0
+
+    @property
+    def loaded(self) -> bool:
+        return self.day is not None
+
+    def apply(self, order_id: int, card: Optional[dict]) -> bool:
+        """Upsert or remove one card; returns True if the board changed"""
+        if card is None:
+            if self.cards.pop(order_id, None) is None:
+                return False
+        elif self.cards.get(order_id) == card:
+            return False
+        else:
+            self.cards[order_id] = card
+        self.version += 1
+        return True
+
+    def snapshot(self) -> dict:
+        return {"version": self.version, "orders": list(self.cards.values())}
+
+
+board = CourierBoard()
+
+
+def _on_delta(event: dict):
+    if board.loaded:
+        delta = event["data"]
+        board.apply(delta["order_id"], delta["card"])
+
+
+events.bus.add_listener(TOPIC, _on_delta)
+
+
+async def _publish(event_type: str, order_id: int, card: Optional[dict]):
+    await events.bus.publish(TOPIC, event_type, {"order_id": order_id, "card": card})
+
+
+async def reload(db: AsyncSession):
+    """Load the board from the DB and publish the differences as deltas"""
+    today = date.today()
+    result = await db.execute(
+        card_query().where(and_(Order.date <= today, Order.status.in_(OPEN_STATUSES)))
+    )
+    fresh = {row[0].id: order_card(*row, today) for row in result.all()}
+    first_load = not board.loaded
+    board.day = today
+    board.loaded_at = time.monotonic()
+
+    if first_load:
+        board.cards = fresh
+        board.version += 1
+        return
+
+    changes = []
+    for order_id in set(board.cards) - set(fresh):
+        changes.append(("removed", order_id, None))
+    for order_id, card in fresh.items():
+        old = board.cards.get(order_id)
+        if old is None:
+            changes.append(("created", order_id, card))
+        elif old != card:
+            changes.append(("overdue" if card["is_overdue"] and not old["is_overdue"] else "updated", order_id, card))
+    for event_type, order_id, card in changes:
+        board.apply(order_id, card)
+        await _publish(event_type, order_id, card)
+
+
+async def get_board(db: AsyncSession) -> CourierBoard:
+    if not board.loaded or board.day != date.today():
+        await reload(db)
+    return board
+
+
+async def refresh_orders(db: AsyncSession, order_ids: Iterable[int], event_type: str):
+    """Re-read the given orders after a committed change and publish their deltas"""
+    ids = list(order_ids)
+    today = date.today()
+    result = await db.execute(card_query().where(Order.id.in_(ids)))
+    cards = {row[0].id: (order_card(*row, today) if _on_board(row[0], today) else None) for row in result.all()}
+    for order_id in ids:
+        card = cards.get(order_id)
+        if board.loaded:
+            board.apply(order_id, card)
+        await _publish(event_type, order_id, card)
+
+
+async def refresh_new_orders(db: AsyncSession, order_id: int, subscription_id: Optional[int] = None):
+    """A new order, plus any orders due today generated for its new subscription"""
+    ids = [order_id]
+    if subscription_id:
+        result = await db.execute(
+            select(Order.id).where(and_(Order.subscription_id == subscription_id, Order.date <= date.today()))
+        )
+        ids += [i for i in result.scalars().all() if i != order_id]
+    await refresh_orders(db, ids, "created")
+
+
+async def run_refresher():
+    """Background task: periodic diff reload (day rollover, changes made outside the API)"""
+    while True:
+        await asyncio.sleep(REFRESH_SECONDS)
+        if not board.loaded:
+            continue
+        try:
+            async with async_session() as db:
+                await reload(db)
+        except Exception as e:
+            log.error("Reload error: %s", e)
@@ -0,0 +1,102 @@
+"""
+Background dispatch of notification jobs
+
+Request handlers commit first, then hand notifications off with dispatch()
+and return; the Telegram round-trips happen on the NOTIFY worker pool.
+Jobs with the same key (e.g. "order:42") run in submission order.
+Every sendMessage outcome is recorded in `deliveries` for the admin stats endpoint.
+"""
+import time
+from collections import defaultdict, deque
+from typing import Any, Awaitable, Callable, Hashable, NamedTuple
+
+from app.config import settings
+from app import tracing
+from app.logging_config import get_logger
+from app.services.worker_pool import KeyedWorkerPool
+
+log = get_logger("NOTIFY")
+
+
+class DeliveryLog:
+    """Counters of Telegram deliveries per bot plus the most recent failures"""
+
+    def __init__(self, keep_failures: int = 50):
+        self.sent = defaultdict(int)
+        self.failed = defaultdict(int)
+        self.skipped = defaultdict(int)
+        self.recent_failures = deque(maxlen=keep_failures)
+
+    def record(self, chat_id: int, bot: str, ok: bool, error_code: int = None, description: str = None):
+        if ok:
+            self.sent[bot] += 1
+            return
+        self.failed[bot] += 1
+        self.recent_failures.append({
+            "chat_id": chat_id,
+            "bot": bot,
+            "error_code": error_code,
+            "description": description,
+            "at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        })
+
+    def skip(self, bot: str):
+        """Not sent: the recipient is known to have blocked the bot"""
+        self.skipped[bot] += 1
+
+    def stats(self) -> dict:
+        return {
+            "sent": dict(self.sent),
+            "failed": dict(self.failed),
+            "skipped": dict(self.skipped),
+            "recent_failures": list(self.recent_failures),
+        }
+
+
+class Job(NamedTuple):
+    name: str
+    func: Callable[..., Awaitable[Any]]
+    kwargs: dict
+
+
+deliveries = DeliveryLog()
+
+# Per job name: dispatched / completed / failed / dropped
+job_counts = defaultdict(lambda: defaultdict(int))
+
+
+async def _run_job(job: Job):
+    try:
+        with tracing.span(f"job {job.name}"):
+            await job.func(**job.kwargs)
+    except Exception:
+        job_counts[job.name]["failed"] += 1
+        raise
+    job_counts[job.name]["completed"] += 1
+
+
+notification_queue = KeyedWorkerPool(
+    "NOTIFY",
+    _run_job,
+    workers=settings.NOTIFY_WORKERS,
+    maxsize=settings.NOTIFY_QUEUE_SIZE,
+)
+
+
+def dispatch(key: Hashable, func: Callable[..., Awaitable[Any]], **kwargs) -> bool:
+    """Queue `await func(**kwargs)` to run after the response. Returns False if dropped."""
+    name = func.__name__
+    if not notification_queue.submit(key, Job(name, func, kwargs)):
+        job_counts[name]["dropped"] += 1
+        log.error("Queue full, dropped %s (%s)", name, key)
+        return False
+    job_counts[name]["dispatched"] += 1
+    return True
+
+
+def stats() -> dict:
+    return {
+        "queue": notification_queue.stats(),
+        "jobs": {name: dict(counts) for name, counts in job_counts.items()},
+        "deliveries": deliveries.stats(),
+    }
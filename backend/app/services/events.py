@@ -0,0 +1,168 @@
+"""
+In-process pub/sub for domain events (order status changes, ...)
+
+Subscribers get a bounded queue per topic; publish() never blocks - a
+subscriber that falls behind loses its oldest events and is flagged as lagged
+(SSE clients then resync with GET /api/orders?since=...).
+
+With EVENTS_PG_NOTIFY enabled (Postgres only) events are sent through
+NOTIFY on one channel and every worker delivers what it receives from LISTEN,
+so subscribers on any worker see events published on any other. NOTIFYs share
+one connection and are sent one at a time. Event ids carry the publishing
+process (pid and start time) so SSE ids from different workers never collide.
+"""
+import asyncio
+import itertools
+import json
+import os
+import time
+from collections import defaultdict
+
+from app.config import settings
+from app.logging_config import get_logger
+
+log = get_logger("EVENTS")
+
+PG_CHANNEL = "yauberu_events"
+
+
+class EventSubscription:
+    def __init__(self, bus: "EventBus", topic: str, maxsize: int):
+        self.bus = bus
+        self.topic = topic
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.lagged = False
+
+    def _offer(self, event: dict):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.lagged = True
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: float = None):
+        """Next event, or None on timeout"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)
+        self._listeners = defaultdict(list)
+        self._seq = itertools.count(1)
+        self._id_prefix = f"{os.getpid()}.{int(time.time())}"
+        self.published = 0
+        self.delivered = 0
+        self._pg_conn = None
+        self._pg_lock = asyncio.Lock()  # asyncpg runs one operation per connection at a time
+        self._pg_listener = None
+
+    # ---- subscribers ----
+
+    def subscribe(self, topic: str) -> EventSubscription:
+        subscription = EventSubscription(self, topic, self.queue_size)
+        self._subscribers[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: EventSubscription):
+        subscribers = self._subscribers.get(subscription.topic)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.topic]
+
+    def add_listener(self, topic: str, callback):
+        """Call callback(event) synchronously for every event delivered on topic"""
+        self._listeners[topic].append(callback)
+
+    def _deliver(self, topic: str, event: dict):
+        for callback in self._listeners.get(topic, ()):
+            try:
+                callback(event)
+            except Exception as e:
+                log.error("Listener for %s: %s", topic, e)
+        for subscription in tuple(self._subscribers.get(topic, ())):
+            subscription._offer(event)
+            self.delivered += 1
+
+    # ---- publishing ----
+
+    async def publish(self, topic: str, event_type: str, data: dict):
+        """Publish after the change is committed. Never raises."""
+        event = {"id": f"{self._id_prefix}-{next(self._seq)}", "type": event_type, "at": time.time(), "data": data}
+        self.published += 1
+        if self._pg_conn is not None:
+            try:
+                payload = json.dumps({"topic": topic, "event": event}, ensure_ascii=False, default=str)
+                async with self._pg_lock:
+                    await self._pg_conn.execute("SELECT pg_notify($1, $2)", PG_CHANNEL, payload)
+                return
+            except Exception as e:
+                log.error("NOTIFY failed, delivering locally: %s", e)
+        self._deliver(topic, event)
+
+    # ---- optional Postgres fan-out ----
+
+    async def start(self):
+        if not settings.EVENTS_PG_NOTIFY or "postgresql" not in settings.DATABASE_URL:
+            return
+        import asyncpg
+
+        dsn = settings.DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://", 1)
+        try:
+            self._pg_listener = await asyncpg.connect(dsn)
+            await self._pg_listener.add_listener(PG_CHANNEL, self._on_notify)
+            self._pg_conn = await asyncpg.connect(dsn)
+            log.info("LISTEN/NOTIFY fan-out on channel %s", PG_CHANNEL)
+        except Exception as e:
+            log.error("LISTEN/NOTIFY unavailable, events stay in-process: %s", e)
+            await self.stop()
+
+    async def stop(self):
+        for conn in (self._pg_listener, self._pg_conn):
+            if conn is not None:
+                try:
+                    await conn.close()
+                except Exception:
+                    pass
+        self._pg_listener = None
+        self._pg_conn = None
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        self._deliver(message["topic"], message["event"])
+
+    def stats(self) -> dict:
+        return {
+            "topics": len(self._subscribers),
+            "subscribers": sum(len(s) for s in self._subscribers.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+            "pg_notify": self._pg_conn is not None,
+        }
+
+
+bus = EventBus()
+
+
+def user_topic(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+async def publish_order_event(event_type: str, order) -> None:
+    """Order status change for the order's owner (order.taken, order.completed, ...)"""
+    await bus.publish(user_topic(order.user_id), event_type, {
+        "order_id": order.id,
+        "status": order.status.value if hasattr(order.status, "value") else order.status,
+        "date": order.date.isoformat() if order.date else None,
+        "time_slot": order.time_slot.value if hasattr(order.time_slot, "value") else order.time_slot,
+    })
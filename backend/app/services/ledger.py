@@ -0,0 +1,290 @@
+"""
+Balance ledger - the single writer for Balance.credits / Balance.single_credits
+
+Every change is an atomic `credits = credits + amount` UPDATE plus an
+append-only BalanceTransaction row in the same DB transaction.
+Periodic snapshots (BalanceSnapshot) checkpoint the ledger, so verifying
+a balance is: snapshot + transactions after snapshot.last_transaction_id.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update, insert, func, case, literal
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Balance, BalanceTransaction, BalanceSnapshot
+
+CREDITS = "credits"                 # Subscription pickups (trial/monthly)
+SINGLE_CREDITS = "single_credits"   # Single pickups
+
+# Entry kinds code looks entries up by; descriptions are for people and may be reworded
+COMPLETION = "completion"               # Subscription pickup charged on completion
+COMPLETION_UNDO = "completion_undo"     # That charge given back when the completion is undone
+
+# Transactions younger than this are left out of snapshots: a row with a lower id
+# may still be uncommitted, and skipping past it would hide it from the ledger forever
+SNAPSHOT_SAFETY_WINDOW = timedelta(minutes=5)
+
+
+def _column(credit_type: str):
+    if credit_type not in (CREDITS, SINGLE_CREDITS):
+        raise ValueError(f"Unknown credit type: {credit_type}")
+    return getattr(Balance, credit_type)
+
+
+async def get_or_create_balance(db: AsyncSession, user_id: int) -> Balance:
+    """Load user's balance, creating an empty one if missing"""
+    result = await db.execute(select(Balance).where(Balance.user_id == user_id))
+    balance = result.scalar_one_or_none()
+    if not balance:
+        balance = Balance(user_id=user_id, credits=0, single_credits=0)
+        db.add(balance)
+        await db.flush()
+    return balance
+
+
+async def post_entry(
+    db: AsyncSession,
+    balance: Balance,
+    amount: int,
+    description: str,
+    order_id: int = None,
+    credit_type: str = CREDITS,
+    kind: str = None,
+):
+    """
+    Apply `amount` to the balance and append a ledger row.
+    Returns the BalanceTransaction (None for zero amounts).
+    """
+    if not amount:
+        return None
+
+    column = _column(credit_type)
+    if balance.id is None:
+        await db.flush()
+
+    # Atomic increment; the in-session Balance object is synchronized by SQLAlchemy
+    await db.execute(
+        update(Balance)
+        .where(Balance.id == balance.id)
+        .values({column: column + amount})
+    )
+
+    entry = BalanceTransaction(
+        balance_id=balance.id,
+        amount=amount,
+        credit_type=credit_type,
+        description=description,
+        kind=kind,
+        order_id=order_id,
+    )
+    db.add(entry)
+    return entry
+
+
+def entry_ctes(balance_filter: tuple, amount: int, description: str, order_id: int = None,
+               credit_type: str = CREDITS, kind: str = None, name: str = "ledger"):
+    """
+    post_entry() as data-modifying CTEs (PostgreSQL), for callers that fold a
+    balance change into a larger single statement. `balance_filter` selects at
+    most one balance and may reference other CTEs of the statement.
+    Returns (balance_cte, entry_cte); balance_cte has a row (id) if it applied.
+    """
+    column = _column(credit_type)
+    now = datetime.utcnow()
+
+    balance_cte = (
+        update(Balance)
+        .where(*balance_filter)
+        .values({column: column + amount, Balance.updated_at: now})
+        .returning(Balance.id)
+        .cte(f"{name}_balance")
+    )
+    entry_cte = (
+        insert(BalanceTransaction)
+        .from_select(
+            ["balance_id", "amount", "credit_type", "description", "kind", "order_id", "created_at", "updated_at"],
+            select(
+                balance_cte.c.id,
+                literal(amount),
+                literal(credit_type),
+                literal(description),
+                literal(kind, BalanceTransaction.kind.type),
+                literal(order_id),
+                literal(now),
+                literal(now),
+            ),
+        )
+        .returning(BalanceTransaction.id)
+        .cte(f"{name}_entry")
+    )
+    return balance_cte, entry_cte
+
+
+async def reset_all(db: AsyncSession, credit_type: str, description: str) -> int:
+    """
+    Zero `credit_type` on every balance, writing one offsetting ledger row per
+    non-zero balance. Returns the number of balances changed.
+    """
+    column = _column(credit_type)
+    now = datetime.utcnow()
+
+    result = await db.execute(
+        insert(BalanceTransaction).from_select(
+            ["balance_id", "amount", "credit_type", "description", "created_at", "updated_at"],
+            select(
+                Balance.id,
+                -column,
+                literal(credit_type),
+                literal(description),
+                literal(now),
+                literal(now),
+            ).where(column != 0),
+        )
+    )
+    await db.execute(update(Balance).where(column != 0).values({column: 0}))
+    return result.rowcount or 0
+
+
+def _reconcile_query(cutoff_id=None):
+    """
+    One row per balance: live values, snapshot values and the ledger delta after the snapshot.
+    With cutoff_id only transactions up to that id are included (used for snapshotting).
+    """
+    last_id = func.coalesce(BalanceSnapshot.last_transaction_id, 0)
+    join_cond = (BalanceTransaction.balance_id == Balance.id) & (BalanceTransaction.id > last_id)
+    if cutoff_id is not None:
+        join_cond = join_cond & (BalanceTransaction.id <= cutoff_id)
+
+    delta = lambda ct: func.coalesce(
+        func.sum(case((BalanceTransaction.credit_type == ct, BalanceTransaction.amount), else_=0)), 0
+    )
+
+    return (
+        select(
+            Balance.id.label("balance_id"),
+            Balance.user_id,
+            func.coalesce(Balance.credits, 0).label("credits"),
+            func.coalesce(Balance.single_credits, 0).label("single_credits"),
+            func.coalesce(BalanceSnapshot.credits, 0).label("snapshot_credits"),
+            func.coalesce(BalanceSnapshot.single_credits, 0).label("snapshot_single_credits"),
+            last_id.label("last_transaction_id"),
+            BalanceSnapshot.id.label("snapshot_id"),
+            delta(CREDITS).label("delta_credits"),
+            delta(SINGLE_CREDITS).label("delta_single_credits"),
+            func.max(BalanceTransaction.id).label("max_transaction_id"),
+        )
+        .outerjoin(BalanceSnapshot, BalanceSnapshot.balance_id == Balance.id)
+        .outerjoin(BalanceTransaction, join_cond)
+        .group_by(
+            Balance.id, Balance.user_id, Balance.credits, Balance.single_credits,
+            BalanceSnapshot.id, BalanceSnapshot.credits, BalanceSnapshot.single_credits,
+            BalanceSnapshot.last_transaction_id,
+        )
+        .order_by(Balance.id)
+    )
+
+
+def _mismatch(row) -> dict:
+    expected_credits = row.snapshot_credits + row.delta_credits
+    expected_single = row.snapshot_single_credits + row.delta_single_credits
+    if expected_credits == row.credits and expected_single == row.single_credits:
+        return None
+    return {
+        "balance_id": row.balance_id,
+        "user_id": row.user_id,
+        "credits": row.credits,
+        "expected_credits": expected_credits,
+        "single_credits": row.single_credits,
+        "expected_single_credits": expected_single,
+    }
+
+
+async def verify_balance(db: AsyncSession, balance_id: int):
+    """Reconcile one balance; returns a mismatch dict or None"""
+    result = await db.execute(_reconcile_query().where(Balance.id == balance_id))
+    row = result.one_or_none()
+    return _mismatch(row) if row else None
+
+
+async def audit_balances(db: AsyncSession) -> dict:
+    """
+    Verify all balances against the ledger in one streaming pass.
+    Mismatches are re-checked individually to filter out writes that raced the scan.
+    """
+    checked = 0
+    suspects = []
+
+    result = await db.stream(_reconcile_query())
+    async for row in result:
+        checked += 1
+        mismatch = _mismatch(row)
+        if mismatch:
+            suspects.append(mismatch["balance_id"])
+
+    mismatches = []
+    for balance_id in suspects:
+        mismatch = await verify_balance(db, balance_id)
+        if mismatch:
+            mismatches.append(mismatch)
+
+    return {"checked": checked, "mismatches": mismatches}
+
+
+async def snapshot_balances(db: AsyncSession) -> int:
+    """
+    Advance per-balance snapshots using the ledger itself (previous snapshot + delta),
+    not the live columns, so existing drift stays visible to the audit.
+    Returns the number of snapshots written.
+    """
+    cutoff_result = await db.execute(
+        select(func.max(BalanceTransaction.id)).where(
+            BalanceTransaction.created_at < datetime.utcnow() - SNAPSHOT_SAFETY_WINDOW
+        )
+    )
+    cutoff_id = cutoff_result.scalar() or 0
+
+    inserts = []
+    updates = []
+    result = await db.stream(_reconcile_query(cutoff_id))
+    async for row in result:
+        if row.snapshot_id is not None and row.max_transaction_id is None:
+            continue  # Nothing new since the last snapshot
+
+        values = {
+            "credits": row.snapshot_credits + row.delta_credits,
+            "single_credits": row.snapshot_single_credits + row.delta_single_credits,
+            "last_transaction_id": row.max_transaction_id or row.last_transaction_id,
+        }
+        if row.snapshot_id is None:
+            inserts.append({"balance_id": row.balance_id, **values})
+        else:
+            updates.append({"id": row.snapshot_id, **values})
+
+    if inserts:
+        await db.execute(insert(BalanceSnapshot), inserts)
+    if updates:
+        await db.execute(update(BalanceSnapshot), updates)
+
+    return len(inserts) + len(updates)
+
+
+async def baseline_snapshots(db: AsyncSession) -> int:
+    """
+    Seed opening snapshots from current balances for balances without one
+    (same as migrations/add_balance_ledger.sql, for databases created via create_all).
+    """
+    max_result = await db.execute(select(func.max(BalanceTransaction.id)))
+    max_id = max_result.scalar() or 0
+
+    result = await db.execute(
+        insert(BalanceSnapshot).from_select(
+            ["balance_id", "credits", "single_credits", "last_transaction_id"],
+            select(
+                Balance.id,
+                func.coalesce(Balance.credits, 0),
+                func.coalesce(Balance.single_credits, 0),
+                literal(max_id),
+            ).where(~select(BalanceSnapshot.id).where(BalanceSnapshot.balance_id == Balance.id).exists()),
+        )
+    )
+    return result.rowcount or 0
@@ -0,0 +1,315 @@
+"""
+Prometheus metrics (GET /metrics, text exposition format 0.0.4)
+
+A minimal in-process registry: counters, gauges and histograms are plain
+dicts keyed by label values, updated from the event loop thread without
+locks. HTTP metrics come from MetricsMiddleware (labelled by route template,
+so /api/orders/42 and /api/orders/43 are one series), DB metrics from
+SQLAlchemy cursor/pool events, Telegram metrics from telegram_api.call,
+scheduler and webhook metrics from their call sites. Values that already
+live elsewhere (worker pool queues, SSE subscribers) are read at scrape time.
+Metrics are per worker process, like every other in-memory stat here.
+"""
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Callable
+
+from sqlalchemy import event
+
+from app.logging_config import get_logger
+
+log = get_logger("METRICS")
+
+INF_BUCKET = 'le="+Inf"'
+# Prometheus client defaults, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values = {}
+        REGISTRY.append(self)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+                for key, value in self.values.items()]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels):
+        self.values[labels] = value
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def render(self) -> list:
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+                for key, value in self.values.items()]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        series = self.values.get(labels)
+        if series is None:
+            # Per-bucket (non-cumulative) counts, then sum and count
+            series = self.values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list:
+        lines = []
+        for key, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = 'le="%s"' % _format_value(float(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, INF_BUCKET)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+REGISTRY = []
+# Called before rendering to refresh gauges that mirror state kept elsewhere
+_collectors = []
+
+
+def collector(func: Callable[[], None]) -> Callable[[], None]:
+    _collectors.append(func)
+    return func
+
+
+def render() -> str:
+    for collect in _collectors:
+        try:
+            collect()
+        except Exception as e:
+            log.warning("Collector %s failed: %s", collect.__name__, e)
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.header())
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ============ METRICS ============
+
+http_requests = Counter("http_requests_total", "HTTP requests by route template and status",
+                        ("method", "route", "status"))
+http_duration = Histogram("http_request_duration_seconds", "HTTP request latency by route template",
+                          ("method", "route"))
+http_in_flight = Gauge("http_requests_in_flight", "HTTP requests being handled (open SSE streams included)")
+
+db_statements = Counter("db_statements_total", "SQL statements executed")
+db_statement_duration = Histogram("db_statement_duration_seconds", "SQL statement execution time")
+db_request_statements = Histogram("db_statements_per_request", "SQL statements per HTTP request by route",
+                                  ("route",), buckets=COUNT_BUCKETS)
+db_request_time = Histogram("db_time_per_request_seconds", "Time spent in SQL per HTTP request by route",
+                            ("route",))
+db_connections_opened = Counter("db_connections_opened_total", "New DB connections (NullPool: one per session)")
+db_connections_checked_out = Gauge("db_connections_checked_out", "DB connections currently in use")
+db_replica_lag = Gauge("db_replica_lag_seconds", "Replication lag per read replica (-1: unreachable or not probed yet)",
+                       ("replica",))
+
+telegram_duration = Histogram("telegram_request_duration_seconds", "Bot API call latency", ("bot", "method"))
+telegram_responses = Counter("telegram_responses_total",
+                             "Bot API responses: ok, rate_limited (429), error or transport failure",
+                             ("bot", "method", "result"))
+
+scheduler_runs = Counter("scheduler_runs_total", "Morning order generation runs", ("result",))
+scheduler_duration = Gauge("scheduler_last_run_duration_seconds", "Duration of the last order generation run")
+scheduler_orders = Counter("scheduler_orders_total", "Subscription orders generated or skipped", ("result",))
+
+webhook_lag = Histogram("payment_webhook_lag_seconds",
+                        "Payment creation at YooKassa to webhook processing", ("event",),
+                        buckets=(1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600))
+
+queue_depth = Gauge("worker_queue_depth", "Queued jobs per worker pool", ("pool",))
+queue_in_flight = Gauge("worker_queue_in_flight", "Jobs being handled per worker pool", ("pool",))
+queue_rejected = Gauge("worker_queue_rejected", "Jobs rejected by a full queue since start", ("pool",))
+sse_subscribers = Gauge("sse_subscribers", "Open order event streams (GET /api/orders/events)")
+log_records_dropped = Gauge("log_records_dropped", "Log records dropped by a full logging queue since start")
+
+
+# ============ HTTP ============
+
+# [statements, seconds] for the current request; None outside requests
+_request_db: ContextVar = ContextVar("request_db", default=None)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: no request/response wrapping, a few dict updates per request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        db = [0, 0.0]
+        token = _request_db.set(db)
+        http_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_in_flight.dec()
+            _request_db.reset(token)
+            route = scope.get("route")
+            # Unmatched paths share one series so scanners cannot blow up cardinality
+            template = route.path if route is not None else "unmatched"
+            method = scope["method"]
+            http_requests.inc(method, template, status[0])
+            http_duration.observe(elapsed, method, template)
+            db_request_statements.observe(db[0], template)
+            db_request_time.observe(db[1], template)
+
+
+# ============ DATABASE ============
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["metrics_started"].pop()
+    db_statements.inc()
+    db_statement_duration.observe(elapsed)
+    db = _request_db.get()
+    if db is not None:
+        db[0] += 1
+        db[1] += elapsed
+
+
+def _handle_error(exception_context):
+    # A failed statement gets no after_cursor_execute: drop its start time
+    conn = exception_context.connection
+    started = conn.info.get("metrics_started") if conn is not None else None
+    if started:
+        started.pop()
+
+
+def _on_connect(dbapi_connection, connection_record):
+    db_connections_opened.inc()
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    db_connections_checked_out.inc()
+
+
+def _on_checkin(dbapi_connection, connection_record):
+    db_connections_checked_out.dec()
+
+
+def instrument_engine(engine):
+    sync_engine = engine.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+    event.listen(sync_engine.pool, "connect", _on_connect)
+    event.listen(sync_engine.pool, "checkout", _on_checkout)
+    event.listen(sync_engine.pool, "checkin", _on_checkin)
+
+
+# ============ TELEGRAM ============
+
+def record_telegram(bot: str, method: str, elapsed: float, data: dict = None, status: int = None):
+    if data is None:
+        result = "transport"
+    elif data.get("ok"):
+        result = "ok"
+    elif status == 429 or data.get("error_code") == 429:
+        result = "rate_limited"
+    else:
+        result = "error"
+    telegram_duration.observe(elapsed, bot, method)
+    telegram_responses.inc(bot, method, result)
+
+
+
+# ============ BACKGROUND WORK ============
+
+def record_scheduler_run(elapsed: float, generated: int = 0, skipped: int = 0, error: bool = False):
+    scheduler_runs.inc("error" if error else "ok")
+    scheduler_duration.set(elapsed)
+    scheduler_orders.inc("generated", amount=generated)
+    scheduler_orders.inc("skipped", amount=skipped)
+
+
+def record_webhook_lag(event_name: str, created_at: str):
+    """created_at is YooKassa's ISO timestamp, e.g. 2024-05-01T10:00:00.000Z"""
+    try:
+        created = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return
+    webhook_lag.observe((datetime.now(timezone.utc) - created).total_seconds(), event_name)
+
+
+def watch_worker_pool(pool):
+    """Mirror a KeyedWorkerPool's queue state at scrape time"""
+    @collector
+    def collect_pool():
+        stats = pool.stats()
+        queue_depth.set(stats["depth"], pool.name)
+        queue_in_flight.set(stats["in_flight"], pool.name)
+        queue_rejected.set(stats["rejected"], pool.name)
+    return collect_pool
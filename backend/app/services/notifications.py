@@ -1,44 +1,47 @@
 """
 Telegram notifications service
 """
-import httpx
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+
 from app.config import settings
+from app.logging_config import get_logger
+from app.models import async_session, Order, User
+from app.services import telegram_api, recipients, address_view
+from app.services.dispatcher import deliveries
+
+log = get_logger("NOTIFY")
 
 
 async def send_telegram_notification(chat_id: int, text: str, reply_markup: dict = None, use_courier_bot: bool = False):
     """Send a notification message to a Telegram user"""
-    # Choose bot token based on recipient type
-    bot_token = settings.TELEGRAM_COURIER_BOT_TOKEN if use_courier_bot else settings.TELEGRAM_BOT_TOKEN
-    
-    # DEBUG: Show which token is being used
-    token_preview = bot_token[:20] + "..." if bot_token else "EMPTY"
-    # print(f"[NOTIFY DEBUG] use_courier_bot={use_courier_bot}, token={token_preview}")
+    bot = "courier" if use_courier_bot else "client"
     
-    if not bot_token or not chat_id:
-        print(f"[NOTIFY] Skipping notification: token={bool(bot_token)}, chat_id={chat_id}, courier_bot={use_courier_bot}")
+    if not telegram_api.bot_token(use_courier_bot) or not chat_id:
+        log.warning("Skipping notification: token=%s, chat_id set=%s, courier_bot=%s",
+                    bool(telegram_api.bot_token(use_courier_bot)), bool(chat_id), use_courier_bot)
         return False
     
-    try:
-        async with httpx.AsyncClient() as client:
-            url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-            payload = {
-                "chat_id": chat_id,
-                "text": text,
-                # DISABLED parse_mode to avoid 400 Bad Request with special chars in addresses
-                # "parse_mode": "Markdown", 
-            }
-            if reply_markup:
-                payload["reply_markup"] = reply_markup
-            
-            response = await client.post(url, json=payload)
-            # print(f"[NOTIFY] Sent to {chat_id} (courier_bot={use_courier_bot}): {response.status_code}")
-            if response.status_code != 200:
-                error_text = await response.aread()
-                print(f"[NOTIFY ERROR] Response: {error_text.decode('utf-8')}")
-            return response.status_code == 200
-    except Exception as e:
-        print(f"[NOTIFY ERROR] {e}")
+    if not recipients.is_deliverable(bot, chat_id):
+        deliveries.skip(bot)
         return False
+    
+    payload = {
+        "chat_id": chat_id,
+        "text": text,
+        # DISABLED parse_mode to avoid 400 Bad Request with special chars in addresses
+        # "parse_mode": "Markdown", 
+    }
+    if reply_markup:
+        payload["reply_markup"] = reply_markup
+    
+    data = await telegram_api.call("sendMessage", payload, use_courier_bot=use_courier_bot)
+    ok = bool(data and data.get("ok"))
+    error_code = data.get("error_code") if data else None
+    description = data.get("description") if data else "request failed"
+    deliveries.record(chat_id, bot, ok, error_code=error_code, description=description)
+    recipients.record_delivery(bot, chat_id, ok, error_code=error_code, description=description)
+    return ok
 
 
 async def get_telegram_user_info(chat_id: int):
@@ -50,20 +53,11 @@ async def get_telegram_user_info(chat_id: int):
     if not bot_token or not chat_id:
         return None
         
-    try:
-        async with httpx.AsyncClient() as client:
-            url = f"https://api.telegram.org/bot{bot_token}/getChat"
-            payload = {"chat_id": chat_id}
-            
-            response = await client.post(url, json=payload)
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("ok"):
-                    return data.get("result")
-            return None
-    except Exception as e:
-        print(f"[TELEGRAM API ERROR] Failed to get chat info: {e}")
-        return None
+    # Shared pooled client; latency and errors are counted in metrics
+    data = await telegram_api.call("getChat", {"chat_id": chat_id})
+    if data and data.get("ok"):
+        return data.get("result")
+    return None
 
 
 # ============ NOTIFICATIONS FOR COURIERS ============
@@ -96,24 +90,80 @@ async def notify_all_couriers_new_order(courier_telegram_ids: list, order_id: in
     text += "\n⚡️ Кто первый возьмет — того и заказ!\n\n"
     text += "👉 Откройте бот курьеров @YaUberu_TeamBot → Мои задачи"
     
-    print(f"[NOTIFY] Sending order #{order_id} (URGENT={is_urgent}) to {len(courier_telegram_ids)} couriers via COURIER BOT")
-    
+    failed = 0
     for tg_id in courier_telegram_ids:
         # use_courier_bot=True - send directly to @YaUberu_TeamBot
         result = await send_telegram_notification(tg_id, text, use_courier_bot=True)
-        if result:
-            print(f"[NOTIFY] ✅ Courier {tg_id} notified")
-        else:
-            print(f"[NOTIFY] ❌ Failed to notify courier {tg_id}")
+        if not result:
+            failed += 1
+            log.debug("❌ Failed to notify courier %s", tg_id)
+    log.info("Order #%s (URGENT=%s) sent to %d couriers via COURIER BOT, %d failed",
+             order_id, is_urgent, len(courier_telegram_ids), failed)
     
     # If URGENT, send ADDITIONAL notification to all couriers (2nd ping!)
     if is_urgent:
-        print(f"[NOTIFY] 🚨 URGENT ORDER - Sending 2nd notification to all couriers!")
+        log.info("🚨 URGENT ORDER #%s - Sending 2nd notification to all couriers", order_id)
         urgent_text = f"🚨 СРОЧНЫЙ ЗАКАЗ #{order_id} ЖДЁТ!\n📍 {address}\n🕐 {time_slot}\n\n⏰ НУЖЕН КУРЬЕР ПРЯМО СЕЙЧАС!"
         for tg_id in courier_telegram_ids:
             await send_telegram_notification(tg_id, urgent_text, use_courier_bot=True)
 
 
+# Telegram rejects longer messages
+MAX_MESSAGE_LENGTH = 4096
+
+
+def build_courier_digest(entries: list, date_str: str) -> list:
+    """
+    Summary of many new orders, grouped complex -> building -> time slot with counts.
+    `entries` are (complex name or street, building, time slot) per order.
+    Returns the message split into parts that fit Telegram's limit.
+    """
+    groups = {}
+    for complex_name, building, time_slot in entries:
+        slots = groups.setdefault(complex_name, {}).setdefault(building, {})
+        slots[time_slot] = slots.get(time_slot, 0) + 1
+
+    header = f"📋 Новые заказы на {date_str}: {len(entries)}\n"
+    footer = "\n👉 Откройте бот курьеров @YaUberu_TeamBot → Мои задачи"
+    blocks = []
+    for complex_name in sorted(groups):
+        buildings = groups[complex_name]
+        total = sum(sum(slots.values()) for slots in buildings.values())
+        lines = [f"\n🏢 {complex_name} — {total}"]
+        for building in sorted(buildings):
+            slots = buildings[building]
+            counts = ", ".join(f"{slot} ×{slots[slot]}" for slot in sorted(slots))
+            lines.append(f"   д. {building}: {counts}")
+        blocks.append("\n".join(lines) + "\n")
+
+    parts = []
+    text = header
+    for block in blocks:
+        if len(text) + len(block) + len(footer) > MAX_MESSAGE_LENGTH:
+            parts.append(text)
+            text = ""
+        text += block
+    parts.append(text + footer)
+    return parts
+
+
+async def notify_couriers_digest(courier_telegram_ids: list, entries: list, date_str: str):
+    """One summary message (or a few parts) per courier instead of one per order - via COURIER BOT"""
+    if not entries:
+        return
+    parts = build_courier_digest(entries, date_str)
+    log.info("Sending digest of %d orders (%d parts) to %d couriers", len(entries), len(parts), len(courier_telegram_ids))
+
+    failed = 0
+    for tg_id in courier_telegram_ids:
+        for text in parts:
+            if not await send_telegram_notification(tg_id, text, use_courier_bot=True):
+                failed += 1
+                break
+    if failed:
+        log.warning("❌ Digest not delivered to %d couriers", failed)
+
+
 # ============ NOTIFICATIONS FOR CLIENTS ============
 
 async def notify_client_order_created(client_telegram_id: int, order_id: int, address: str, date_str: str, time_slot: str):
@@ -131,7 +181,6 @@ async def notify_client_order_created(client_telegram_id: int, order_id: int, ad
 
 async def notify_client_courier_took_order(client_telegram_id: int, courier_name: str, time_slot: str):
     """Notify client that a courier took their order"""
-    print(f"[NOTIFY] Sending 'courier took order' to client {client_telegram_id}")
     text = (
         f"🚀 Курьер выехал!\n\n"
         f"👤 Ваш курьер: {courier_name}\n"
@@ -140,14 +189,12 @@ async def notify_client_courier_took_order(client_telegram_id: int, courier_name
         f"(Если выбрали 'В руки' — ожидайте звонка)"
     )
     result = await send_telegram_notification(client_telegram_id, text)
-    print(f"[NOTIFY] Result: {result}")
+    log.debug("'courier took order' to client %s: %s", client_telegram_id, result)
     return result
 
 
 async def notify_client_order_completed(client_telegram_id: int, bags_count: int = 1):
     """Notify client that order is completed"""
-    print(f"[NOTIFY] Sending 'order completed' to client {client_telegram_id}, bags={bags_count}")
-    
     if bags_count == 1:
         bags_text = "1 пакет"
     elif bags_count < 5:
@@ -162,7 +209,7 @@ async def notify_client_order_completed(client_telegram_id: int, bags_count: int
         f"С баланса списан 1 кредит"
     )
     result = await send_telegram_notification(client_telegram_id, text)
-    print(f"[NOTIFY] Result: {result}")
+    log.debug("'order completed' to client %s, bags=%s: %s", client_telegram_id, bags_count, result)
     return result
 
 
@@ -196,14 +243,14 @@ async def notify_admins_new_order(admin_telegram_ids: list, order_id: int, addre
     
     text += f"Курьеры получили уведомление"
     
-    print(f"[NOTIFY] Sending order #{order_id} (URGENT={is_urgent}) to {len(admin_telegram_ids)} admins via CLIENT BOT")
-    
+    failed = 0
     for tg_id in admin_telegram_ids:
         result = await send_telegram_notification(tg_id, text, use_courier_bot=False)
-        if result:
-            print(f"[NOTIFY] ✅ Admin {tg_id} notified")
-        else:
-            print(f"[NOTIFY] ❌ Failed to notify admin {tg_id}")
+        if not result:
+            failed += 1
+            log.debug("❌ Failed to notify admin %s", tg_id)
+    log.info("Order #%s (URGENT=%s) sent to %d admins via CLIENT BOT, %d failed",
+             order_id, is_urgent, len(admin_telegram_ids), failed)
 
 
 async def notify_admins_courier_took_order(admin_telegram_ids: list, order_id: int, courier_name: str, address: str):
@@ -215,7 +262,7 @@ async def notify_admins_courier_took_order(admin_telegram_ids: list, order_id: i
         f"Клиент получил уведомление"
     )
     
-    print(f"[NOTIFY] Order #{order_id} taken by {courier_name}, notifying {len(admin_telegram_ids)} admins via CLIENT BOT")
+    log.info("Order #%s taken, notifying %d admins via CLIENT BOT", order_id, len(admin_telegram_ids))
     
     for tg_id in admin_telegram_ids:
         await send_telegram_notification(tg_id, text, use_courier_bot=False)
@@ -237,8 +284,129 @@ async def notify_admins_order_completed(admin_telegram_ids: list, order_id: int,
         f"Клиент получил уведомление"
     )
     
-    print(f"[NOTIFY] Order #{order_id} completed by {courier_name}, notifying {len(admin_telegram_ids)} admins via CLIENT BOT")
+    log.info("Order #%s completed, notifying %d admins via CLIENT BOT", order_id, len(admin_telegram_ids))
     
     for tg_id in admin_telegram_ids:
         await send_telegram_notification(tg_id, text, use_courier_bot=False)
 
+
+
+# ============ BACKGROUND JOBS (see services/dispatcher.py) ============
+
+async def notify_new_order(order_id: int, tariff_type: str = None):
+    """
+    Notify couriers, the client and admins about a new order.
+    Runs after the order is committed, in its own session.
+    """
+    async with async_session() as db:
+        result = await db.execute(
+            select(Order, User.telegram_id, User.name)
+            .join(User, User.id == Order.user_id)
+            .where(Order.id == order_id)
+        )
+        row = result.first()
+        if not row:
+            log.error("Order #%s not found", order_id)
+            return
+        order, client_telegram_id, client_name = row
+        
+        address_str = await address_view.get_address(db, order.address_id)
+        courier_tg_ids = await recipients.get_courier_ids(db)
+    
+    time_slot_str = order.time_slot.value if hasattr(order.time_slot, 'value') else str(order.time_slot)
+    date_str = order.date.strftime('%d.%m.%Y')
+    
+    await notify_all_couriers_new_order(
+        courier_telegram_ids=courier_tg_ids,
+        order_id=order_id,
+        address=address_str,
+        date_str=date_str,
+        time_slot=time_slot_str,
+        comment=order.comment,
+        tariff_type=tariff_type,
+        order_date=order.date
+    )
+    
+    if client_telegram_id:
+        await notify_client_order_created(
+            client_telegram_id=client_telegram_id,
+            order_id=order_id,
+            address=address_str,
+            date_str=date_str,
+            time_slot=time_slot_str
+        )
+    
+    await notify_admins_new_order(
+        admin_telegram_ids=recipients.admin_ids(),
+        order_id=order_id,
+        address=address_str,
+        date_str=date_str,
+        time_slot=time_slot_str,
+        client_name=client_name or "Клиент",
+        tariff_type=tariff_type,
+        order_date=order.date
+    )
+
+
+async def _load_order_parties(order_id: int):
+    """(order, client telegram_id, courier name, address) for transition notifications"""
+    courier = aliased(User)
+    async with async_session() as db:
+        result = await db.execute(
+            select(Order, User.telegram_id, courier.name)
+            .join(User, User.id == Order.user_id)
+            .outerjoin(courier, courier.id == Order.courier_id)
+            .where(Order.id == order_id)
+        )
+        row = result.first()
+        if not row:
+            log.error("Order #%s not found", order_id)
+            return None
+        order, client_telegram_id, courier_name = row
+        address_str = await address_view.get_address(db, order.address_id)
+    return order, client_telegram_id, courier_name or "Курьер", address_str
+
+
+async def notify_order_taken(order_id: int):
+    """Notify the client and admins that a courier took the order"""
+    parties = await _load_order_parties(order_id)
+    if not parties:
+        return
+    order, client_telegram_id, courier_name, address_str = parties
+    
+    if client_telegram_id:
+        time_slot_str = order.time_slot.value if hasattr(order.time_slot, 'value') else str(order.time_slot)
+        await notify_client_courier_took_order(
+            client_telegram_id=client_telegram_id,
+            courier_name=courier_name,
+            time_slot=time_slot_str
+        )
+    
+    await notify_admins_courier_took_order(
+        admin_telegram_ids=recipients.admin_ids(),
+        order_id=order_id,
+        courier_name=courier_name,
+        address=address_str
+    )
+
+
+async def notify_order_completed(order_id: int):
+    """Notify the client and admins that the order was completed"""
+    parties = await _load_order_parties(order_id)
+    if not parties:
+        return
+    order, client_telegram_id, courier_name, _ = parties
+    bags_count = order.bags_count or 1
+    
+    if client_telegram_id:
+        await notify_client_order_completed(
+            client_telegram_id=client_telegram_id,
+            bags_count=bags_count
+        )
+    
+    await notify_admins_order_completed(
+        admin_telegram_ids=recipients.admin_ids(),
+        order_id=order_id,
+        courier_name=courier_name,
+        bags_count=bags_count
+    )
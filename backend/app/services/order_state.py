@@ -0,0 +1,328 @@
+"""
+Order state machine - the single writer for Order.status
+
+Every transition is one conditional UPDATE (WHERE id = :id AND status IN
+<allowed>) ... RETURNING, so of two concurrent requests only one wins: two
+couriers cannot both take an order and a double "complete" cannot deduct
+twice. Undoing a completion reverses what "complete" did (the charge, the
+used credit and a deactivation it caused), so complete -> undo -> complete
+charges once. On PostgreSQL the balance/ledger, subscription and user-counter side
+effects (and freeing the slot of a cancelled order) are data-modifying CTEs
+of that same statement (one round-trip); on
+other databases (SQLite in development) they follow as separate statements
+in the same transaction.
+
+Callers commit, then pass the results to emit(): order events for the Mini App
+stream, courier board deltas and background notifications.
+"""
+from datetime import date, datetime
+from typing import NamedTuple, Optional
+
+from sqlalchemy import select, update, func, and_, not_, case, literal
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.models import Order, OrderStatus, TimeSlot, Balance, BalanceTransaction, Subscription, User, SlotBooking
+from app.services import ledger, courier_board, slot_capacity
+from app.services.dispatcher import dispatch
+from app.services.events import publish_order_event
+from app.services.user_stats import set_subscription_active, subscription_counter_cte
+
+
+class Rule(NamedTuple):
+    allowed_from: tuple
+    to_status: OrderStatus
+    event: str               # Event type for the order stream / courier board
+
+
+S = OrderStatus
+RULES = {
+    "take":         Rule((S.SCHEDULED,), S.IN_PROGRESS, "taken"),
+    "assign":       Rule((S.SCHEDULED, S.IN_PROGRESS), S.IN_PROGRESS, "assigned"),
+    "complete":     Rule((S.SCHEDULED, S.IN_PROGRESS), S.COMPLETED, "completed"),
+    "undo":         Rule((S.IN_PROGRESS,), S.SCHEDULED, "undone"),
+    "undo_complete": Rule((S.COMPLETED,), S.SCHEDULED, "undone"),  # transition("undo") tries this first
+    "reschedule":   Rule((S.SCHEDULED,), S.SCHEDULED, "rescheduled"),
+    "cancel":       Rule((S.SCHEDULED,), S.CANCELLED, "cancelled"),
+    "cancel_admin": Rule((S.SCHEDULED, S.IN_PROGRESS, S.COMPLETED), S.CANCELLED, "cancelled"),
+}
+RELEASES_SLOT = ("cancel", "cancel_admin")
+
+
+class TransitionError(Exception):
+    """The order does not exist (status None) or its status does not allow the transition"""
+
+    def __init__(self, order_id: int, name: str, status: Optional[OrderStatus]):
+        self.order_id = order_id
+        self.name = name
+        self.status = status
+        super().__init__(f"Order #{order_id}: cannot {name} from {status.value if status else 'missing'}")
+
+
+class TransitionResult(NamedTuple):
+    name: str
+    id: int
+    user_id: int
+    courier_id: Optional[int]
+    status: OrderStatus
+    date: date
+    time_slot: TimeSlot
+    is_subscription: bool
+    subscription_id: Optional[int]
+    bags_count: Optional[int]
+    credit_change: int       # Amount posted to the client's balance (credits)
+
+
+_RETURNING = (
+    Order.id, Order.user_id, Order.address_id, Order.courier_id, Order.status, Order.date, Order.time_slot,
+    Order.is_subscription, Order.subscription_id, Order.bags_count,
+)
+
+
+def _order_update(order_id: int, rule: Rule, values: dict, where: tuple):
+    return (
+        update(Order)
+        .where(Order.id == order_id, Order.status.in_(rule.allowed_from), *where)
+        .values(status=rule.to_status, **values)
+        .returning(*_RETURNING)
+    )
+
+
+# ---------- Side effects ----------
+# (credit amount, ledger description) posted to Balance.credits per transition
+def _refund(name: str, order_id: int):
+    if name == "cancel":
+        return 1, f"Возврат за отмену заказа #{order_id}"
+    if name == "cancel_admin":
+        return 1, f"Отмена заказа #{order_id} администратором"
+    if name == "complete":
+        return -1, f"Выполнен заказ #{order_id}"
+    if name == "undo_complete":
+        return 1, f"Отмена выполнения заказа #{order_id}"
+    return 0, None
+
+
+# Ledger entry kinds of transitions that later ones look up
+_KINDS = {"complete": ledger.COMPLETION, "undo_complete": ledger.COMPLETION_UNDO}
+
+
+def _completion_net(order_id: int):
+    """Sum of the order's completion / completion-undo ledger rows: -1 while a completion charge stands"""
+    return (
+        select(func.coalesce(func.sum(BalanceTransaction.amount), 0))
+        .where(
+            BalanceTransaction.order_id == order_id,
+            BalanceTransaction.kind.in_((ledger.COMPLETION, ledger.COMPLETION_UNDO)),
+        )
+        .scalar_subquery()
+    )
+
+
+def _single_statement(order_id: int, name: str, rule: Rule, values: dict, where: tuple):
+    """PostgreSQL: the order UPDATE plus all side effects as CTEs of one statement"""
+    o = _order_update(order_id, rule, values, where).cte("o")
+    ctes = []
+    credit_change = literal(0)
+
+    amount, description = _refund(name, order_id)
+    if amount:
+        balance_filter = (Balance.user_id == o.c.user_id,)
+        if name == "complete":
+            # Subscription pickups are paid on completion, while credits last
+            balance_filter += (o.c.is_subscription, o.c.subscription_id.isnot(None), Balance.credits > 0)
+        elif name == "undo_complete":
+            # Only give back a charge the completion actually made
+            balance_filter += (_completion_net(order_id) < 0,)
+        balance_cte, entry_cte = ledger.entry_ctes(balance_filter, amount, description, order_id=order_id,
+                                                   kind=_KINDS.get(name))
+        ctes.append(entry_cte)
+        credit_change = select(func.count() * amount).select_from(balance_cte).scalar_subquery()
+
+    # Multi-table UPDATEs cannot use the updated_at onupdate default, so set it here
+    now = datetime.utcnow()
+    prev = aliased(Subscription)  # Pre-update row, to tell real is_active flips apart
+    if name == "complete":
+        used = Subscription.used_credits + 1
+        subscription_cte = (
+            update(Subscription)
+            .where(Subscription.id == o.c.subscription_id, o.c.is_subscription, prev.id == Subscription.id)
+            .values(
+                used_credits=used,
+                is_active=case((used >= Subscription.total_credits, False), else_=Subscription.is_active),
+                updated_at=now,
+            )
+            .returning(
+                Subscription.user_id,
+                and_(func.coalesce(prev.is_active, False), Subscription.is_active.is_(False)).label("flipped"),
+            )
+            .cte("subscription")
+        )
+        delta = -1
+    elif name == "cancel":
+        subscription_cte = (
+            update(Subscription)
+            .where(Subscription.id == o.c.subscription_id, Subscription.used_credits > 0, prev.id == Subscription.id)
+            .values(used_credits=Subscription.used_credits - 1, is_active=True, updated_at=now)
+            .returning(
+                Subscription.user_id,
+                not_(func.coalesce(prev.is_active, False)).label("flipped"),
+            )
+            .cte("subscription")
+        )
+        delta = 1
+    elif name == "undo_complete":
+        used = Subscription.used_credits - 1
+        subscription_cte = (
+            update(Subscription)
+            .where(
+                Subscription.id == o.c.subscription_id, o.c.is_subscription, Subscription.used_credits > 0,
+                prev.id == Subscription.id,
+            )
+            .values(
+                used_credits=used,
+                # Reactivate only if the completion used up the last credit
+                is_active=case(
+                    (and_(Subscription.used_credits >= Subscription.total_credits, used < Subscription.total_credits),
+                     True),
+                    else_=Subscription.is_active,
+                ),
+                updated_at=now,
+            )
+            .returning(
+                Subscription.user_id,
+                and_(not_(func.coalesce(prev.is_active, False)), Subscription.is_active.is_(True)).label("flipped"),
+            )
+            .cte("subscription")
+        )
+        delta = 1
+    else:
+        subscription_cte = None
+
+    if subscription_cte is not None:
+        counter_cte = subscription_counter_cte(
+            (User.id == subscription_cte.c.user_id, subscription_cte.c.flipped), delta,
+        )
+        ctes += [subscription_cte, counter_cte]
+
+    if name in RELEASES_SLOT:
+        ctes.append(
+            slot_capacity.release_statement(
+                slot_capacity.order_complex_expression(o.c.address_id), o.c.date, o.c.time_slot,
+            )
+            .returning(SlotBooking.booked)
+            .cte("slot")
+        )
+
+    statement = select(*o.c, credit_change.label("credit_change"))
+    if ctes:
+        statement = statement.add_cte(*ctes)
+    return statement
+
+
+async def _side_effects(db: AsyncSession, name: str, row) -> int:
+    """Other databases: the same side effects as follow-up statements. Returns credit_change."""
+    credit_change = 0
+    amount, description = _refund(name, row.id)
+    if name == "undo_complete" and await db.scalar(select(_completion_net(row.id))) >= 0:
+        amount = 0  # The completion charged nothing
+    if amount and (name != "complete" or (row.is_subscription and row.subscription_id)):
+        result = await db.execute(select(Balance).where(Balance.user_id == row.user_id))
+        balance = result.scalar_one_or_none()
+        if balance and (amount > 0 or (balance.credits or 0) > 0):
+            await ledger.post_entry(db, balance, amount, description=description, order_id=row.id,
+                                    kind=_KINDS.get(name))
+            credit_change = amount
+
+    if row.subscription_id and name in ("complete", "undo_complete", "cancel") and (name == "cancel" or row.is_subscription):
+        result = await db.execute(select(Subscription).where(Subscription.id == row.subscription_id))
+        subscription = result.scalar_one_or_none()
+        if subscription and name == "complete":
+            subscription.used_credits += 1
+            if subscription.used_credits >= subscription.total_credits:
+                await set_subscription_active(db, subscription, False)
+        elif subscription and name == "undo_complete":
+            if subscription.used_credits > 0:
+                exhausted = subscription.used_credits >= subscription.total_credits
+                subscription.used_credits -= 1
+                if exhausted and subscription.used_credits < subscription.total_credits:
+                    await set_subscription_active(db, subscription, True)
+        elif subscription and subscription.used_credits > 0:
+            subscription.used_credits -= 1
+            await set_subscription_active(db, subscription, True)  # Reactivate if was deactivated
+
+    if name in RELEASES_SLOT:
+        await db.execute(slot_capacity.release_statement(
+            slot_capacity.order_complex_expression(row.address_id), row.date, row.time_slot,
+        ))
+    return credit_change
+
+
+async def _apply(db: AsyncSession, order_id: int, name: str, values: dict, where: tuple):
+    """(returned order row or None, credit_change)"""
+    rule = RULES[name]
+    if db.get_bind().dialect.name == "postgresql":
+        result = await db.execute(_single_statement(order_id, name, rule, values, where))
+        row = result.first()
+        return row, row.credit_change if row else 0
+    result = await db.execute(
+        _order_update(order_id, rule, values, where),
+        execution_options={"synchronize_session": False},
+    )
+    row = result.first()
+    return row, await _side_effects(db, name, row) if row else 0
+
+
+async def transition(
+    db: AsyncSession,
+    order_id: int,
+    name: str,
+    values: dict = None,
+    where: tuple = (),
+) -> TransitionResult:
+    """
+    Run transition `name` (see RULES) on one order inside the caller's transaction.
+    `values` are extra columns to set (courier_id, bags_count, date, ...), `where`
+    extra conditions (ownership, was_rescheduled, ...). Raises TransitionError.
+    "undo" of a completed order runs as "undo_complete", reversing the completion.
+    """
+    values = values or {}
+    if name == "undo":
+        row, credit_change = await _apply(db, order_id, "undo_complete", values, where)
+        if row is not None:
+            name = "undo_complete"
+        else:
+            row, credit_change = await _apply(db, order_id, name, values, where)
+    else:
+        row, credit_change = await _apply(db, order_id, name, values, where)
+
+    if row is None:
+        result = await db.execute(select(Order.status).where(Order.id == order_id, *where))
+        raise TransitionError(order_id, name, result.scalar_one_or_none())
+
+    return TransitionResult(
+        name=name,
+        id=row.id,
+        user_id=row.user_id,
+        courier_id=row.courier_id,
+        status=row.status,
+        date=row.date,
+        time_slot=row.time_slot,
+        is_subscription=bool(row.is_subscription),
+        subscription_id=row.subscription_id,
+        bags_count=row.bags_count,
+        credit_change=credit_change,
+    )
+
+
+async def emit(db: AsyncSession, *results: TransitionResult):
+    """After commit: order stream events, courier board deltas and notifications"""
+    from app.services.notifications import notify_order_taken, notify_order_completed
+
+    for result in results:
+        event = RULES[result.name].event
+        await publish_order_event(f"order.{event}", result)
+        await courier_board.refresh_orders(db, [result.id], event)
+        if result.name == "take":
+            dispatch(f"order:{result.id}", notify_order_taken, order_id=result.id)
+        elif result.name == "complete":
+            dispatch(f"order:{result.id}", notify_order_completed, order_id=result.id)
@@ -0,0 +1,124 @@
+"""
+Directory of notification recipients (active couriers, admins) and their delivery health
+
+Courier telegram ids are loaded once and kept as a tuple until admin.add_courier /
+deactivate_courier invalidate it (the TTL covers changes made outside the API).
+Admin ids are parsed from settings once at import.
+
+Delivery health is tracked per (bot, chat) for chats whose last delivery failed: a
+chat that answered 403 (bot blocked, user deactivated) is skipped by
+send_telegram_notification until BLOCKED_RETRY has passed or the chat talks to the
+bot again. A successful delivery forgets the chat; at most MAX_TRACKED_CHATS are
+kept, the least recently failed are dropped first.
+"""
+import time
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.logging_config import get_logger
+from app.models import User, UserRole
+
+log = get_logger("NOTIFY")
+
+TTL_SECONDS = 300
+BLOCKED_RETRY = 6 * 60 * 60  # Try a blocked chat again after 6 hours
+MAX_TRACKED_CHATS = 10000
+
+ADMIN_IDS = tuple(settings.admin_ids)
+_admin_id_set = frozenset(ADMIN_IDS)
+
+_courier_ids = None
+_loaded_at = 0.0
+
+
+def admin_ids() -> tuple:
+    return ADMIN_IDS
+
+
+def is_admin(telegram_id: int) -> bool:
+    return telegram_id in _admin_id_set
+
+
+def invalidate_couriers():
+    global _courier_ids
+    _courier_ids = None
+
+
+async def get_courier_ids(db: AsyncSession) -> tuple:
+    """Telegram ids of active couriers (cached)"""
+    global _courier_ids, _loaded_at
+    if _courier_ids is not None and time.monotonic() - _loaded_at < TTL_SECONDS:
+        return _courier_ids
+
+    result = await db.execute(
+        select(User.telegram_id)
+        .where(User.role == UserRole.COURIER, User.is_active == True, User.telegram_id.isnot(None))
+        .order_by(User.id)
+    )
+    _courier_ids = tuple(result.scalars().all())
+    _loaded_at = time.monotonic()
+    return _courier_ids
+
+
+# ============ DELIVERY HEALTH ============
+
+class _Health:
+    __slots__ = ("failed", "consecutive_failures", "blocked_at", "last_error")
+
+    def __init__(self):
+        self.failed = 0
+        self.consecutive_failures = 0
+        self.blocked_at = None
+        self.last_error = None
+
+
+_health = {}  # (bot, chat_id) -> _Health, least recently failed first
+
+
+def record_delivery(bot: str, chat_id: int, ok: bool, error_code: int = None, description: str = None):
+    key = (bot, chat_id)
+    if ok:
+        _health.pop(key, None)
+        return
+    health = _health.pop(key, None)
+    if health is None:
+        health = _Health()
+        if len(_health) >= MAX_TRACKED_CHATS:
+            del _health[next(iter(_health))]
+    _health[key] = health
+    health.failed += 1
+    health.consecutive_failures += 1
+    health.last_error = description
+    if error_code == 403:
+        if health.blocked_at is None:
+            log.info("Chat %s blocked the %s bot, skipping it: %s", chat_id, bot, description)
+        health.blocked_at = time.monotonic()
+
+
+def is_deliverable(bot: str, chat_id: int) -> bool:
+    health = _health.get((bot, chat_id))
+    if health is None or health.blocked_at is None:
+        return True
+    return time.monotonic() - health.blocked_at >= BLOCKED_RETRY
+
+
+def mark_active(bot: str, chat_id: int):
+    """The chat sent us an update, so it has not blocked the bot"""
+    _health.pop((bot, chat_id), None)
+
+
+def stats() -> dict:
+    return {
+        "couriers": len(_courier_ids) if _courier_ids is not None else None,
+        "admins": len(ADMIN_IDS),
+        "blocked": [
+            {"bot": bot, "chat_id": chat_id, "failed": h.failed, "last_error": h.last_error}
+            for (bot, chat_id), h in _health.items() if h.blocked_at is not None
+        ],
+        "failing": [
+            {"bot": bot, "chat_id": chat_id, "consecutive_failures": h.consecutive_failures, "last_error": h.last_error}
+            for (bot, chat_id), h in _health.items() if h.blocked_at is None and h.consecutive_failures
+        ],
+    }
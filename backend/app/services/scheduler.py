@@ -5,14 +5,22 @@ This should be run as a cron job or background task once per day (e.g., at 6:00
 It generates orders for all active subscriptions that have today in their schedule.
 """
 import asyncio
+import time
 from datetime import date, timedelta
 from sqlalchemy import select, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.base import async_session
 from app.models.order import Order, OrderStatus, Subscription, TimeSlot
-from app.models.user import User, UserRole, Balance, BalanceTransaction
-from app.services.notifications import notify_all_couriers_new_order
+from app.models.user import Balance
+from app.config import settings
+from app import tracing
+from app.logging_config import get_logger
+from app.services.notifications import notify_all_couriers_new_order, notify_couriers_digest
+from app.services.user_stats import record_orders_created, set_subscription_active
+from app.services import ledger, recipients, address_view, courier_board, slot_capacity, metrics
+
+log = get_logger("SCHEDULER")
 
 
 def get_weekday_number(d: date) -> int:
@@ -34,11 +42,28 @@ async def generate_orders_for_today():
     
     Returns: (generated_count, skipped_count)
     """
+    started = time.perf_counter()
+    with tracing.span("scheduler.generate_orders_for_today") as span:
+        try:
+            generated, skipped = await _generate_orders_for_today()
+        except Exception:
+            metrics.record_scheduler_run(time.perf_counter() - started, error=True)
+            raise
+        metrics.record_scheduler_run(time.perf_counter() - started, generated, skipped)
+        if span is not None:
+            span.set_attribute("scheduler.generated", generated)
+            span.set_attribute("scheduler.skipped", skipped)
+    return generated, skipped
+
+
+async def _generate_orders_for_today():
     today = date.today()
     today_weekday = get_weekday_number(today)
     
     generated = 0
     skipped = 0
+    new_order_ids = []
+    new_order_addresses = []  # (order id, AddressView, time slot) for courier notifications
     
     async with async_session() as db:
         # Get all active subscriptions
@@ -52,19 +77,13 @@ async def generate_orders_for_today():
         )
         subscriptions = result.scalars().all()
         
-        print(f"[SCHEDULER] Found {len(subscriptions)} active subscriptions")
+        log.info("Found %d active subscriptions", len(subscriptions))
         
         # Get all couriers for notifications
-        couriers_result = await db.execute(
-            select(User).where(
-                and_(
-                    User.role == UserRole.COURIER,
-                    User.is_active == True
-                )
-            )
-        )
-        couriers = couriers_result.scalars().all()
-        courier_tg_ids = [c.telegram_id for c in couriers if c.telegram_id]
+        courier_tg_ids = await recipients.get_courier_ids(db)
+        
+        # Address strings for notifications, one query for all subscriptions
+        addresses = await address_view.load_addresses(db, {sub.address_id for sub in subscriptions})
         
         for sub in subscriptions:
             # Check if today is in schedule based on frequency
@@ -97,13 +116,13 @@ async def generate_orders_for_today():
             # Check if already generated today
             if sub.last_generated_date == today:
                 skipped += 1
-                print(f"[SCHEDULER] Subscription {sub.id}: Already generated today, skipping")
+                log.debug("Subscription %s: Already generated today, skipping", sub.id)
                 continue
             
             # Check remaining credits
             remaining = sub.total_credits - sub.used_credits
             if remaining <= 0:
-                print(f"[SCHEDULER] Subscription {sub.id}: No credits remaining")
+                log.debug("Subscription %s: No credits remaining", sub.id)
                 continue
             
             # Create order
@@ -119,6 +138,12 @@ async def generate_orders_for_today():
             )
             db.add(order)
             await db.flush()  # Get order.id
+            await record_orders_created(db, sub.user_id)
+            address = addresses.get(sub.address_id)
+            await slot_capacity.book(
+                db, slot_capacity.complex_key(address.complex_id if address else None),
+                today, order.time_slot, enforce=False,
+            )
             
             # Deduct credit from balance
             balance_result = await db.execute(
@@ -127,18 +152,13 @@ async def generate_orders_for_today():
             balance = balance_result.scalar_one_or_none()
             
             if balance and balance.credits > 0:
-                balance.credits -= 1
-                
-                # Log transaction
-                transaction = BalanceTransaction(
-                    balance_id=balance.id,
-                    amount=-1,
+                await ledger.post_entry(
+                    db, balance, -1,
                     description=f"Авто-заказ по подписке #{order.id}",
                     order_id=order.id,
                 )
-                db.add(transaction)
             else:
-                print(f"[SCHEDULER] Warning: User {sub.user_id} has no credits, but order created")
+                log.warning("User %s has no credits, but order created", sub.user_id)
             
             # Update subscription
             sub.last_generated_date = today
@@ -146,36 +166,42 @@ async def generate_orders_for_today():
             
             # Check if subscription should be deactivated
             if sub.used_credits >= sub.total_credits:
-                sub.is_active = False
-                print(f"[SCHEDULER] Subscription {sub.id} completed (used all credits)")
+                await set_subscription_active(db, sub, False)
+                log.debug("Subscription %s completed (used all credits)", sub.id)
             
             generated += 1
-            print(f"[SCHEDULER] Created order for subscription {sub.id}, user {sub.user_id}")
+            new_order_ids.append(order.id)
+            log.debug("Created order #%s for subscription %s", order.id, sub.id)
             
-            # Get address for notification
-            if sub.address:
-                address_str = f"кв. {sub.address.apartment}"
-                if sub.address.complex:
-                    address_str = f"{sub.address.complex.name}, д. {sub.address.building}, " + address_str
-                
-                time_slot_str = sub.default_time_slot.value if sub.default_time_slot else "08:00-10:00"
-                date_str = today.strftime('%d.%m.%Y')
-                
-                # Notify couriers
-                await notify_all_couriers_new_order(
-                    courier_telegram_ids=courier_tg_ids,
-                    order_id=order.id,
-                    address=address_str,
-                    date_str=date_str,
-                    time_slot=time_slot_str,
-                    comment="Подписка",
-                    tariff_type='subscription',
-                    order_date=today
-                )
+            if address:
+                new_order_addresses.append((order.id, address, order.time_slot.value))
         
         await db.commit()
+        if new_order_ids:
+            await courier_board.refresh_orders(db, new_order_ids, "created")
     
-    print(f"[SCHEDULER] Done! Generated: {generated}, Skipped: {skipped}")
+    # Couriers are notified after commit: one digest each, or a message per order
+    date_str = today.strftime('%d.%m.%Y')
+    if settings.COURIER_DIGEST:
+        await notify_couriers_digest(
+            courier_tg_ids,
+            [(a.group, a.building, slot) for _, a, slot in new_order_addresses],
+            date_str,
+        )
+    else:
+        for order_id, address, time_slot_str in new_order_addresses:
+            await notify_all_couriers_new_order(
+                courier_telegram_ids=courier_tg_ids,
+                order_id=order_id,
+                address=address.full,
+                date_str=date_str,
+                time_slot=time_slot_str,
+                comment="Подписка",
+                tariff_type='subscription',
+                order_date=today
+            )
+    
+    log.info("Done! Generated: %d, Skipped: %d", generated, skipped)
     return generated, skipped
 
 
@@ -243,6 +269,11 @@ async def generate_orders_for_date(target_date: date):
                 comment="Авто-заказ по подписке"
             )
             db.add(order)
+            await record_orders_created(db, sub.user_id)
+            await slot_capacity.book(
+                db, await slot_capacity.address_complex(db, sub.address_id), target_date, order.time_slot,
+                enforce=False,
+            )
             generated += 1
         
         await db.commit()
@@ -252,6 +283,6 @@ async def generate_orders_for_date(target_date: date):
 
 # CLI entry point for cron jobs
 if __name__ == "__main__":
-    print(f"[SCHEDULER] Running for {date.today()}")
+    log.info("Running for %s", date.today())
     asyncio.run(generate_orders_for_today())
 
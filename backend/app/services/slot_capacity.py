@@ -0,0 +1,166 @@
+"""
+Pickup capacity per (complex, date, time slot)
+
+slot_bookings holds one `booked` counter per slot, changed by one atomic
+statement per order:
+- book() on create: INSERT ... ON CONFLICT DO UPDATE ... WHERE booked < capacity,
+  so two clients racing for the last place cannot both get it. Subscription
+  orders the client did not pick a slot for (generated days, paid orders) are
+  booked with enforce=False: counted, never rejected.
+- release() when an order is cancelled (order_state, same transaction)
+- move() on reschedule
+has_room() is the read-only check for flows that book later (payments).
+
+Addresses outside a complex share complex_id 0. Capacity is
+ResidentialComplex.slot_capacity or settings.SLOT_CAPACITY, read from the
+complex catalog snapshot. availability() builds the booking grid from one
+range scan of the primary key.
+"""
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import select, update, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models import SlotBooking, TimeSlot, Address
+from app.services import complex_catalog
+
+SLOTS = tuple(TimeSlot)  # In day order
+MANUAL_COMPLEX_ID = 0
+
+
+def complex_key(complex_id: Optional[int]) -> int:
+    return complex_id or MANUAL_COMPLEX_ID
+
+
+async def address_complex(db: AsyncSession, address_id: int) -> int:
+    result = await db.execute(select(Address.complex_id).where(Address.id == address_id))
+    return complex_key(result.scalar_one_or_none())
+
+
+async def capacity(db: AsyncSession, complex_id: int) -> int:
+    catalog = await complex_catalog.get_catalog(db)
+    for c in catalog.complexes:
+        if c["id"] == complex_id and c["slot_capacity"] is not None:
+            return c["slot_capacity"]
+    return settings.SLOT_CAPACITY
+
+
+def _insert(db: AsyncSession):
+    return (postgresql if db.get_bind().dialect.name == "postgresql" else sqlite).insert
+
+
+async def book(db: AsyncSession, complex_id: int, day: date, slot: TimeSlot, enforce: bool = True) -> bool:
+    """Take one place in the slot; False (nothing booked) if enforce and the slot is full"""
+    limit = await capacity(db, complex_id) if enforce else None
+    if limit is not None and limit <= 0:
+        return False
+
+    now = datetime.utcnow()
+    statement = _insert(db)(SlotBooking).values(
+        complex_id=complex_id, date=day, time_slot=slot, booked=1, created_at=now, updated_at=now,
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[SlotBooking.complex_id, SlotBooking.date, SlotBooking.time_slot],
+        set_={"booked": SlotBooking.booked + 1, "updated_at": now},
+        where=(SlotBooking.booked < limit) if limit is not None else None,
+    ).returning(SlotBooking.booked)
+    result = await db.execute(statement)
+    return result.first() is not None
+
+
+def release_statement(complex_id, day, slot):
+    """booked -= 1; arguments may be SQL expressions (order_state folds this into its CTEs)"""
+    return (
+        update(SlotBooking)
+        .where(
+            SlotBooking.complex_id == complex_id,
+            SlotBooking.date == day,
+            SlotBooking.time_slot == slot,
+            SlotBooking.booked > 0,
+        )
+        .values(booked=SlotBooking.booked - 1, updated_at=datetime.utcnow())
+    )
+
+
+def order_complex_expression(address_id):
+    """complex_key() of an order's address, as a scalar subquery"""
+    return (
+        select(func.coalesce(Address.complex_id, MANUAL_COMPLEX_ID))
+        .where(Address.id == address_id)
+        .scalar_subquery()
+    )
+
+
+async def release(db: AsyncSession, complex_id: int, day: date, slot: TimeSlot):
+    await db.execute(release_statement(complex_id, day, slot))
+
+
+async def move(db: AsyncSession, complex_id: int, old_day: date, old_slot: TimeSlot,
+               new_day: date, new_slot: TimeSlot) -> bool:
+    """Book the new slot, then free the old one; False (nothing changed) if the new slot is full"""
+    if (old_day, old_slot) == (new_day, new_slot):
+        return True
+    if not await book(db, complex_id, new_day, new_slot):
+        return False
+    await release(db, complex_id, old_day, old_slot)
+    return True
+
+
+async def has_room(db: AsyncSession, complex_id: int, day: date, slot: TimeSlot) -> bool:
+    """Read-only check, for flows that book later (payments)"""
+    booked = await _booked(db, complex_id, day, day)
+    return booked.get((day, slot), 0) < await capacity(db, complex_id)
+
+
+async def _booked(db: AsyncSession, complex_id: int, start: date, end: date) -> dict:
+    result = await db.execute(
+        select(SlotBooking.date, SlotBooking.time_slot, SlotBooking.booked)
+        .where(SlotBooking.complex_id == complex_id, SlotBooking.date.between(start, end))
+    )
+    return {(row.date, row.time_slot): row.booked for row in result.all()}
+
+
+async def availability(db: AsyncSession, complex_id: int, start: date, days: int) -> dict:
+    """Booking grid: every slot of `days` days from `start`"""
+    limit = await capacity(db, complex_id)
+    booked = await _booked(db, complex_id, start, start + timedelta(days=days - 1))
+    grid = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        slots = []
+        for slot in SLOTS:
+            count = booked.get((day, slot), 0)
+            slots.append({
+                "time_slot": slot.value,
+                "booked": count,
+                "available": max(limit - count, 0),
+            })
+        grid.append({"date": day.isoformat(), "slots": slots})
+    return {"complex_id": complex_id, "capacity": limit, "days": grid}
+
+
+async def suggest(db: AsyncSession, complex_id: int, day: date, slot: TimeSlot, count: int = 3) -> list:
+    """Nearest slots with free places around a full one (never before today)"""
+    limit = await capacity(db, complex_id)
+    start = max(day - timedelta(days=1), date.today())
+    end = day + timedelta(days=3)
+    booked = await _booked(db, complex_id, start, end)
+
+    wanted = day.toordinal() * len(SLOTS) + SLOTS.index(slot)
+    candidates = []
+    current = start
+    while current <= end:
+        for index, candidate in enumerate(SLOTS):
+            available = limit - booked.get((current, candidate), 0)
+            if available > 0 and (current, candidate) != (day, slot):
+                distance = abs(current.toordinal() * len(SLOTS) + index - wanted)
+                candidates.append((distance, current, candidate, available))
+        current += timedelta(days=1)
+    candidates.sort(key=lambda c: (c[0], c[1] != day, c[1], SLOTS.index(c[2])))  # Ties: same day first
+    return [
+        {"date": d.isoformat(), "time_slot": s.value, "available": available}
+        for _, d, s, available in candidates[:count]
+    ]
@@ -0,0 +1,243 @@
+"""
+SQL profiler: slow-query log, N+1 detection and per-route statement budgets
+
+Enabled with SQL_PROFILE_ENABLED. SQLAlchemy cursor events record every
+statement as normalized text (literals, bind markers and IN lists collapsed,
+so "WHERE id = 41" and "WHERE id = 42" are one entry) with its duration and
+rowcount. Process-wide totals back GET /api/admin/sql-profile.
+
+Per HTTP request (SqlProfileMiddleware):
+- statements slower than SQL_SLOW_MS are logged as they finish
+- a normalized statement repeated more than SQL_REPEAT_LIMIT times in one
+  request is logged as an N+1 suspect
+- every request to a route declaring @statement_budget(n) is counted in
+  `budgets` (requests, most statements seen); one running more than n
+  statements is logged as an error and counted as over budget.
+  benchmarks.hot_paths fails on those, and on budgeted routes it never calls
+
+Statements run by background jobs (notification workers, the scheduler) are
+in the totals but not attributed to a request.
+"""
+import re
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+
+from sqlalchemy import event
+
+from app.config import settings
+from app.logging_config import get_logger
+
+log = get_logger("SQL")
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_BIND = re.compile(r"\$\d+|%\(\w+\)s|(?<!:):\w+|\?")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_VALUES = re.compile(r"(VALUES\s*\(\?\))(?:\s*,\s*\(\?\))+", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+
+# Distinct statements kept in the process-wide table; later ones only count in `overflow`
+MAX_STATEMENTS = 1000
+
+
+@lru_cache(maxsize=4096)
+def normalize(statement: str) -> str:
+    text = _SPACE.sub(" ", statement).strip()
+    text = _STRING.sub("?", text)
+    text = _BIND.sub("?", text)
+    text = _NUMBER.sub("?", text)
+    text = _LIST.sub("(?)", text)
+    return _VALUES.sub(r"\1", text)
+
+
+def statement_budget(limit: int):
+    """
+    Declare the most SQL statements a route may run per request (dependencies
+    included). Checked by SqlProfileMiddleware on every request while
+    SQL_PROFILE_ENABLED is on; budgeted_routes() lists them.
+    """
+    def decorate(endpoint):
+        endpoint.statement_budget = limit
+        return endpoint
+    return decorate
+
+
+def budgeted_routes(routes) -> dict:
+    """{"METHOD /path": budget} for the app routes declaring @statement_budget"""
+    return {
+        f"{method} {route.path}": route.endpoint.statement_budget
+        for route in routes
+        if hasattr(getattr(route, "endpoint", None), "statement_budget")
+        for method in sorted(getattr(route, "methods", None) or ())
+    }
+
+
+class _StatementStats:
+    __slots__ = ("calls", "total", "max", "rows")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+
+
+class _RequestProfile:
+    __slots__ = ("scope", "statements", "seconds", "counts")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.statements = 0
+        self.seconds = 0.0
+        self.counts = {}
+
+
+statements = {}  # normalized text -> _StatementStats
+repeats = {}  # (route, normalized text) -> {"requests": ..., "max": ...}
+budgets = {}  # route -> {"budget": ..., "requests": ..., "over": ..., "max": ...}
+overflow = 0
+
+_request: ContextVar = ContextVar("sql_profile_request", default=None)
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    return f"{scope['method']} {route.path if route is not None else 'unmatched'}"
+
+
+# ============ CURSOR EVENTS ============
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("sql_profile_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    global overflow
+    elapsed = time.perf_counter() - conn.info["sql_profile_started"].pop()
+    text = normalize(statement)
+
+    stats = statements.get(text)
+    if stats is None:
+        if len(statements) >= MAX_STATEMENTS:
+            overflow += 1
+        else:
+            stats = statements[text] = _StatementStats()
+    if stats is not None:
+        stats.calls += 1
+        stats.total += elapsed
+        stats.max = max(stats.max, elapsed)
+        rowcount = getattr(cursor, "rowcount", -1)
+        if rowcount is not None and rowcount > 0:
+            stats.rows += rowcount
+
+    profile = _request.get()
+    if profile is not None:
+        profile.statements += 1
+        profile.seconds += elapsed
+        profile.counts[text] = profile.counts.get(text, 0) + 1
+
+    if elapsed * 1000 >= settings.SQL_SLOW_MS:
+        log.warning("Slow query %.1f ms (%s): %s", elapsed * 1000,
+                    _route_label(profile.scope) if profile else "background", text[:1000])
+
+
+def _handle_error(exception_context):
+    # A failed statement gets no after_cursor_execute: drop its start time
+    conn = exception_context.connection
+    started = conn.info.get("sql_profile_started") if conn is not None else None
+    if started:
+        started.pop()
+
+
+def instrument_engine(engine):
+    sync_engine = engine.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+# ============ PER REQUEST ============
+
+def _finish_request(profile: _RequestProfile):
+    label = _route_label(profile.scope)
+
+    for text, count in profile.counts.items():
+        if count > settings.SQL_REPEAT_LIMIT:
+            entry = repeats.setdefault((label, text), {"requests": 0, "max": 0})
+            entry["requests"] += 1
+            entry["max"] = max(entry["max"], count)
+            log.warning("N+1 suspect on %s: %d× %s", label, count, text[:500])
+
+    route = profile.scope.get("route")
+    budget = getattr(getattr(route, "endpoint", None), "statement_budget", None)
+    if budget is None:
+        return
+    entry = budgets.setdefault(label, {"budget": budget, "requests": 0, "over": 0, "max": 0})
+    entry["requests"] += 1
+    entry["max"] = max(entry["max"], profile.statements)
+    if profile.statements > budget:
+        entry["over"] += 1
+        log.error("Statement budget exceeded on %s: %d > %d (%.1f ms in SQL)",
+                  label, profile.statements, budget, profile.seconds * 1000)
+
+
+class SqlProfileMiddleware:
+    """Pure ASGI: attributes statements to the request running them"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        profile = _RequestProfile(scope)
+        token = _request.set(profile)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request.reset(token)
+            _finish_request(profile)
+
+
+# ============ REPORT ============
+
+def top(limit: int = 20, order: str = "total") -> dict:
+    """Statements sorted by total time (or "calls", "max", "mean"), plus N+1 suspects and budget violations"""
+    keys = {
+        "total": lambda item: item[1].total,
+        "calls": lambda item: item[1].calls,
+        "max": lambda item: item[1].max,
+        "mean": lambda item: item[1].total / item[1].calls,
+    }
+    ranked = sorted(statements.items(), key=keys.get(order, keys["total"]), reverse=True)[:limit]
+    return {
+        "enabled": settings.SQL_PROFILE_ENABLED,
+        "slow_ms": settings.SQL_SLOW_MS,
+        "repeat_limit": settings.SQL_REPEAT_LIMIT,
+        "distinct_statements": len(statements),
+        "overflow": overflow,
+        "statements": [{
+            "statement": text,
+            "calls": stats.calls,
+            "total_ms": round(stats.total * 1000, 3),
+            "mean_ms": round(stats.total / stats.calls * 1000, 3),
+            "max_ms": round(stats.max * 1000, 3),
+            "rows": stats.rows,
+        } for text, stats in ranked],
+        "repeats": [{"route": route, "statement": text, **entry}
+                    for (route, text), entry in sorted(repeats.items(), key=lambda item: -item[1]["max"])],
+        "budgets": [{"route": route, **entry} for route, entry in sorted(budgets.items())],
+        "budget_violations": [
+            {"route": route, "budget": entry["budget"], "requests": entry["over"], "max": entry["max"]}
+            for route, entry in sorted(budgets.items()) if entry["over"]
+        ],
+    }
+
+
+def reset():
+    global overflow
+    statements.clear()
+    repeats.clear()
+    budgets.clear()
+    overflow = 0
@@ -5,7 +5,12 @@ from datetime import date, timedelta
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
-from app.models import Order, OrderStatus, Subscription, Balance, BalanceTransaction
+from app.models import Order, OrderStatus, Subscription, Balance
+from app.services.user_stats import record_orders_created
+from app.services import slot_capacity
+from app.logging_config import get_logger
+
+log = get_logger("SUBSCRIPTION")
 
 
 async def generate_all_subscription_orders(
@@ -38,7 +43,7 @@ async def generate_all_subscription_orders(
     balance = balance_result.scalar_one_or_none()
     
     if not balance:
-        print(f"[SUBSCRIPTION] Warning: No balance found for user {subscription.user_id}")
+        log.warning("No balance found for user %s", subscription.user_id)
         return 0
     
     # Calculate all dates
@@ -73,8 +78,9 @@ async def generate_all_subscription_orders(
     )
     existing_dates = {row[0] for row in existing_orders.all()}
     
-    # Create missing orders
+    # Create missing orders (counted in slot capacity, never rejected)
     created_count = 0
+    complex_id = await slot_capacity.address_complex(db, subscription.address_id)
     
     for order_date in expected_dates:
         if order_date in existing_dates:
@@ -94,11 +100,14 @@ async def generate_all_subscription_orders(
         )
         db.add(order)
         await db.flush()  # Get order ID
+        await slot_capacity.book(db, complex_id, order_date, order.time_slot, enforce=False)
         
         # DON'T deduct credit now - will be deducted when courier completes order
         # This way user sees full balance until order is actually completed
         
         created_count += 1
-        print(f"[SUBSCRIPTION] Created order #{order.id} for {order_date}")
+        log.debug("Created order #%s for %s", order.id, order_date)
+    
+    await record_orders_created(db, subscription.user_id, created_count)
     
     return created_count
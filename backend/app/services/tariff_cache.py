@@ -0,0 +1,55 @@
+"""
+In-process cache of active TariffPrice rows
+
+Bot texts that mention prices are rendered from this cache instead of
+hardcoded numbers. admin.update_tariff calls invalidate(); the TTL only
+catches edits made directly in the DB (e.g. apply_tariff_sync.py).
+"""
+import time
+from typing import NamedTuple, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import TariffPrice
+
+TTL_SECONDS = 600
+
+
+class Tariff(NamedTuple):
+    tariff_id: str
+    name: str
+    price: int
+    old_price: Optional[int]
+    period: Optional[str]
+
+
+_tariffs = None
+_loaded_at = 0.0
+
+# Bumped on every reload so dependents can tell when to re-render
+version = 0
+
+
+def invalidate():
+    global _tariffs
+    _tariffs = None
+
+
+async def get_tariffs(db: AsyncSession) -> tuple:
+    """Active tariffs ordered by id (cached)"""
+    global _tariffs, _loaded_at, version
+    if _tariffs is not None and time.monotonic() - _loaded_at < TTL_SECONDS:
+        return _tariffs
+
+    result = await db.execute(
+        select(TariffPrice.tariff_id, TariffPrice.name, TariffPrice.price, TariffPrice.old_price, TariffPrice.period)
+        .where(TariffPrice.is_active == True)
+        .order_by(TariffPrice.id)
+    )
+    tariffs = tuple(Tariff(*row) for row in result.all())
+    if tariffs != _tariffs:
+        version += 1
+    _tariffs = tariffs
+    _loaded_at = time.monotonic()
+    return _tariffs
@@ -0,0 +1,76 @@
+"""
+Low-level Telegram Bot API client
+
+One pooled httpx.AsyncClient for the whole process instead of a new
+connection (and TLS handshake) per message.
+"""
+import time
+
+import httpx
+
+from app.config import settings
+from app import tracing
+from app.logging_config import get_logger
+from app.services import metrics
+
+log = get_logger("TELEGRAM")
+
+_client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def bot_token(use_courier_bot: bool = False) -> str:
+    return settings.TELEGRAM_COURIER_BOT_TOKEN if use_courier_bot else settings.TELEGRAM_BOT_TOKEN
+
+
+async def call(method: str, payload: dict = None, use_courier_bot: bool = False, content: bytes = None):
+    """
+    Call a Bot API method. Returns the decoded response dict ({"ok": ..., "result": ...})
+    or None if the bot token is missing or the request failed at transport level.
+    `content` sends pre-serialized JSON bytes as-is.
+    """
+    token = bot_token(use_courier_bot)
+    if not token:
+        log.warning("Skipping %s: bot token not set (courier_bot=%s)", method, use_courier_bot)
+        return None
+
+    url = f"{settings.TELEGRAM_API_URL}/bot{token}/{method}"
+    bot = "courier" if use_courier_bot else "client"
+    with tracing.span(f"telegram {method}", kind="client", **{"telegram.bot": bot, "telegram.method": method}) as span:
+        started = time.perf_counter()
+        try:
+            if content is not None:
+                response = await get_client().post(url, content=content, headers={"Content-Type": "application/json"})
+            else:
+                response = await get_client().post(url, json=payload or {})
+            data = response.json()
+        except Exception as e:
+            metrics.record_telegram(bot, method, time.perf_counter() - started)
+            tracing.set_error(span, type(e).__name__)
+            log.error("%s: %s", method, e)
+            return None
+
+        metrics.record_telegram(bot, method, time.perf_counter() - started, data, response.status_code)
+        if span is not None:
+            span.set_attribute("http.status_code", response.status_code)
+
+        if not data.get("ok"):
+            tracing.set_error(span, str(data.get("description")))
+            log.error("%s: %s %s", method, response.status_code, data.get("description"))
+        return data
@@ -0,0 +1,152 @@
+"""
+Registry of Telegram file_ids for bot images
+
+The first successful upload of an asset by URL returns a file_id; it is stored
+in telegram_media and reused for every later send, so Telegram no longer has
+to fetch the image from the external host on each /start or menu render.
+"""
+from sqlalchemy import select
+
+from app.models import async_session, TelegramMedia
+from app.logging_config import get_logger
+from app.services import telegram_api
+
+log = get_logger("MEDIA")
+
+# Asset key -> source URL
+ASSETS = {
+    "welcome_1": "https://i.ibb.co/Dz8JQdc/11111111.jpg",
+    "welcome_2": "https://i.ibb.co/5vRX8Sq/22222222.jpg",
+    "welcome_3": "https://i.ibb.co/SXgzwmn/333333333.jpg",
+    "menu": "https://i.ibb.co/5WLCg2CG/22222222.jpg",
+}
+
+# In-process cache: key -> file_id (loaded from DB on first use)
+_file_ids = {}
+_loaded = False
+
+
+async def load(force: bool = False):
+    """Fill the in-memory cache from the DB"""
+    global _loaded
+    if _loaded and not force:
+        return
+    async with async_session() as db:
+        result = await db.execute(select(TelegramMedia.key, TelegramMedia.file_id, TelegramMedia.source_url))
+        _file_ids.clear()
+        for key, file_id, source_url in result.all():
+            # A changed URL in ASSETS means a new image: the old file_id is stale
+            if ASSETS.get(key) == source_url:
+                _file_ids[key] = file_id
+    _loaded = True
+
+
+def cached(key: str):
+    return _file_ids.get(key)
+
+
+async def _store(key: str, file_id: str):
+    if not file_id or _file_ids.get(key) == file_id:
+        return
+    _file_ids[key] = file_id
+    try:
+        async with async_session() as db:
+            result = await db.execute(select(TelegramMedia).where(TelegramMedia.key == key))
+            media = result.scalar_one_or_none()
+            if media:
+                media.file_id = file_id
+                media.source_url = ASSETS[key]
+            else:
+                db.add(TelegramMedia(key=key, source_url=ASSETS[key], file_id=file_id))
+            await db.commit()
+        log.info("Registered %s", key)
+    except Exception as e:
+        # Still cached in memory; will be re-registered on the next cold start
+        log.error("Failed to persist %s: %s", key, e)
+
+
+def _largest_photo_id(message: dict):
+    photos = (message or {}).get("photo") or []
+    return photos[-1]["file_id"] if photos else None
+
+
+def _forget(keys):
+    for key in keys:
+        _file_ids.pop(key, None)
+
+
+async def send_photo(chat_id: int, key: str, caption: str = None, keyboard: dict = None):
+    """sendPhoto by cached file_id (falls back to the URL once if the id is rejected)"""
+    await load()
+    payload = {"chat_id": chat_id, "photo": _file_ids.get(key) or ASSETS[key]}
+    if caption:
+        payload["caption"] = caption
+        payload["parse_mode"] = "Markdown"
+    if keyboard:
+        payload["reply_markup"] = keyboard
+
+    data = await telegram_api.call("sendPhoto", payload)
+    if data and not data.get("ok") and key in _file_ids and data.get("error_code") == 400:
+        _forget([key])
+        payload["photo"] = ASSETS[key]
+        data = await telegram_api.call("sendPhoto", payload)
+
+    if data and data.get("ok"):
+        await _store(key, _largest_photo_id(data["result"]))
+    return data
+
+
+async def send_media_group(chat_id: int, items: list):
+    """
+    Send several assets as one album. `items` is a list of (key, caption) pairs.
+    Returns the list of sent messages (empty on failure).
+    """
+    await load()
+    keys = [key for key, _ in items]
+
+    def build(use_cache=True):
+        media = []
+        for key, caption in items:
+            entry = {"type": "photo", "media": (use_cache and _file_ids.get(key)) or ASSETS[key]}
+            if caption:
+                entry["caption"] = caption
+                entry["parse_mode"] = "Markdown"
+            media.append(entry)
+        return {"chat_id": chat_id, "media": media}
+
+    data = await telegram_api.call("sendMediaGroup", build())
+    if data and not data.get("ok") and data.get("error_code") == 400 and any(k in _file_ids for k in keys):
+        _forget(keys)
+        data = await telegram_api.call("sendMediaGroup", build(use_cache=False))
+
+    if not data or not data.get("ok"):
+        return []
+
+    messages = data["result"]
+    for key, message in zip(keys, messages):
+        await _store(key, _largest_photo_id(message))
+    return messages
+
+
+async def warm_up(chat_id: int, force: bool = False) -> dict:
+    """
+    Upload every unregistered asset to `chat_id` (an admin/service chat) and
+    delete the messages right away. Returns {key: file_id} for all assets.
+    """
+    await load(force=True)
+    if force:
+        _forget(list(ASSETS))
+
+    pending = [key for key in ASSETS if key not in _file_ids]
+    # sendMediaGroup accepts 2-10 items; a single leftover goes through sendPhoto
+    for i in range(0, len(pending), 10):
+        batch = pending[i:i + 10]
+        if len(batch) == 1:
+            data = await send_photo(chat_id, batch[0])
+            messages = [data["result"]] if data and data.get("ok") else []
+        else:
+            messages = await send_media_group(chat_id, [(key, None) for key in batch])
+        for message in messages:
+            await telegram_api.call("deleteMessage", {"chat_id": chat_id, "message_id": message["message_id"]})
+
+    return {key: _file_ids.get(key) for key in ASSETS}
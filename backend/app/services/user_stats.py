@@ -0,0 +1,130 @@
+"""
+Denormalized per-user counters (orders_count, active_subscriptions_count)
+
+Every code path that creates orders or flips Subscription.is_active goes through
+these helpers so the counters stay in the same transaction as the change itself.
+"""
+from datetime import datetime
+
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import User, Order, Subscription
+
+
+async def record_orders_created(db: AsyncSession, user_id: int, count: int = 1):
+    """Increment orders_count for a user (call after adding the Order rows)"""
+    if not count:
+        return
+    await db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(orders_count=User.orders_count + count)
+    )
+
+
+async def record_subscription_started(db: AsyncSession, user_id: int):
+    """A new subscription was created with is_active=True"""
+    await db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(active_subscriptions_count=User.active_subscriptions_count + 1)
+    )
+
+
+async def set_subscription_active(db: AsyncSession, subscription: Subscription, is_active: bool):
+    """
+    Set Subscription.is_active and keep the owner's counter in sync.
+    Only real transitions touch the counter, so repeated calls are safe.
+    """
+    was_active = bool(subscription.is_active)
+    subscription.is_active = is_active
+
+    if was_active == is_active:
+        return
+
+    delta = 1 if is_active else -1
+    await db.execute(
+        update(User)
+        .where(User.id == subscription.user_id)
+        .values(active_subscriptions_count=User.active_subscriptions_count + delta)
+    )
+
+
+def subscription_counter_cte(user_filter: tuple, delta: int, name: str = "subscription_counter"):
+    """
+    active_subscriptions_count += delta as a data-modifying CTE (PostgreSQL), for
+    statements that flip Subscription.is_active themselves. `user_filter` must only
+    match owners of subscriptions that really changed state.
+    """
+    return (
+        update(User)
+        .where(*user_filter)
+        .values(active_subscriptions_count=User.active_subscriptions_count + delta, updated_at=datetime.utcnow())
+        .returning(User.id)
+        .cte(name)
+    )
+
+
+def _actual_counts_query():
+    """Stored vs recomputed counters for every user"""
+    orders_sq = (
+        select(Order.user_id, func.count(Order.id).label("cnt"))
+        .group_by(Order.user_id)
+        .subquery()
+    )
+    subs_sq = (
+        select(Subscription.user_id, func.count(Subscription.id).label("cnt"))
+        .where(Subscription.is_active == True)
+        .group_by(Subscription.user_id)
+        .subquery()
+    )
+    return (
+        select(
+            User.id,
+            User.orders_count,
+            User.active_subscriptions_count,
+            func.coalesce(orders_sq.c.cnt, 0).label("actual_orders"),
+            func.coalesce(subs_sq.c.cnt, 0).label("actual_subscriptions"),
+        )
+        .outerjoin(orders_sq, orders_sq.c.user_id == User.id)
+        .outerjoin(subs_sq, subs_sq.c.user_id == User.id)
+    )
+
+
+async def check_user_stats(db: AsyncSession, fix: bool = False) -> list:
+    """
+    Recompute all counters in bulk and report drift.
+
+    Returns a list of dicts for users whose stored counters differ from the
+    recomputed ones. With fix=True the drifted rows are corrected in place.
+    """
+    result = await db.execute(_actual_counts_query())
+
+    drift = []
+    for row in result.all():
+        stored_orders = row.orders_count or 0
+        stored_subs = row.active_subscriptions_count or 0
+        if stored_orders != row.actual_orders or stored_subs != row.actual_subscriptions:
+            drift.append({
+                "user_id": row.id,
+                "orders_count": stored_orders,
+                "actual_orders": row.actual_orders,
+                "active_subscriptions_count": stored_subs,
+                "actual_subscriptions": row.actual_subscriptions,
+            })
+
+    if fix and drift:
+        await db.execute(
+            update(User),
+            [
+                {
+                    "id": d["user_id"],
+                    "orders_count": d["actual_orders"],
+                    "active_subscriptions_count": d["actual_subscriptions"],
+                }
+                for d in drift
+            ],
+        )
+
+    return drift
@@ -0,0 +1,133 @@
+"""
+Bounded async worker pool with per-key ordering
+
+Items are sharded by key across N worker queues, so items with the same key
+(e.g. the same Telegram chat) are handled strictly in order while different
+keys run concurrently. submit() never blocks: when a shard is full it returns
+False and the caller decides how to push back. The submitter's request id
+and trace context travel with the item, so a job's log lines and spans belong
+to the request that queued it.
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Hashable
+
+from app import tracing
+from app.logging_config import get_logger, request_id_var
+
+
+class KeyedWorkerPool:
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Any], Awaitable[None]],
+        workers: int = 4,
+        maxsize: int = 1000,
+    ):
+        self.name = name
+        self.log = get_logger(name)
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.shard_size = max(1, maxsize // self.workers)
+        self._queues = []
+        self._tasks = []
+
+        # Backpressure / throughput metrics
+        self.submitted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.max_depth = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._run_total = 0.0
+        self._run_max = 0.0
+
+    @property
+    def started(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        """Start workers (idempotent; must be called from a running event loop)"""
+        if self._tasks:
+            return
+        self._queues = [asyncio.Queue(maxsize=self.shard_size) for _ in range(self.workers)]
+        self._tasks = [
+            asyncio.create_task(self._worker(q), name=f"{self.name}-worker-{i}")
+            for i, q in enumerate(self._queues)
+        ]
+
+    async def stop(self, timeout: float = 5.0):
+        """Drain queued items (up to `timeout` seconds), then cancel workers"""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(asyncio.gather(*(q.join() for q in self._queues)), timeout)
+        except asyncio.TimeoutError:
+            self.log.warning("Stop timeout, dropping %d queued items", self.depth())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queues = []
+
+    def submit(self, key: Hashable, item: Any) -> bool:
+        """Enqueue without waiting. Returns False if the key's shard is full."""
+        self.start()
+        queue = self._queues[hash(key) % self.workers]
+        try:
+            queue.put_nowait((time.perf_counter(), request_id_var.get(), tracing.current_context(), item))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.submitted += 1
+        self.max_depth = max(self.max_depth, self.depth())
+        return True
+
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            enqueued_at, request_id, trace_context, item = await queue.get()
+            started_at = time.perf_counter()
+            wait = started_at - enqueued_at
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            self.in_flight += 1
+            token = request_id_var.set(request_id)
+            trace_token = tracing.attach(trace_context)
+            try:
+                await self.handler(item)
+            except Exception:
+                self.failed += 1
+                self.log.exception("Handler error")
+            finally:
+                tracing.detach(trace_token)
+                request_id_var.reset(token)
+                elapsed = time.perf_counter() - started_at
+                self._run_total += elapsed
+                self._run_max = max(self._run_max, elapsed)
+                self.in_flight -= 1
+                self.processed += 1
+                queue.task_done()
+
+    def stats(self) -> dict:
+        done = self.processed or 1
+        return {
+            "name": self.name,
+            "workers": self.workers,
+            "capacity": self.shard_size * self.workers,
+            "depth": self.depth(),
+            "max_depth": self.max_depth,
+            "in_flight": self.in_flight,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "failed": self.failed,
+            "avg_wait_ms": round(self._wait_total / done * 1000, 3),
+            "max_wait_ms": round(self._wait_max * 1000, 3),
+            "avg_handle_ms": round(self._run_total / done * 1000, 3),
+            "max_handle_ms": round(self._run_max * 1000, 3),
+        }
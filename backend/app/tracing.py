@@ -0,0 +1,198 @@
+"""
+OpenTelemetry tracing (optional)
+
+TRACING_ENABLED turns it on; only then are the opentelemetry packages needed
+(opentelemetry-sdk, plus opentelemetry-exporter-otlp-proto-http for
+TRACING_EXPORTER=otlp). Spans cover:
+- HTTP requests (TracingMiddleware), named by route template. A W3C
+  traceparent header from the caller (the courier bot) makes the request a
+  child of the caller's span, so a button tap is one trace end to end
+- SQL statements (SQLAlchemy cursor events)
+- Telegram Bot API calls (telegram_api.call)
+- the scheduler run and notification jobs; the worker pool carries the
+  context of the request that queued a job
+
+TRACING_EXPORTER=file appends one JSON span per line to TRACING_FILE, which
+works offline; "otlp" sends to OTEL_EXPORTER_OTLP_ENDPOINT (default
+http://localhost:4318). Spans are exported in batches from a background thread.
+With tracing off every helper here is a no-op.
+"""
+import contextlib
+
+from sqlalchemy import event
+
+from app.config import settings
+from app.logging_config import get_logger, request_id_var
+
+log = get_logger("TRACING")
+
+_tracer = None
+_provider = None
+_NOOP = contextlib.nullcontext()
+
+
+def setup_tracing(service_name: str = None) -> bool:
+    """Install the tracer provider and exporter. Returns False if tracing stays off."""
+    global _tracer, _provider
+    if _tracer is not None:
+        return True
+    if not settings.TRACING_ENABLED:
+        return False
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+        from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+    except ImportError:
+        log.warning("TRACING_ENABLED is set but opentelemetry-sdk is not installed, tracing stays off")
+        return False
+
+    if settings.TRACING_EXPORTER == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            log.warning("TRACING_EXPORTER=otlp needs opentelemetry-exporter-otlp-proto-http, tracing stays off")
+            return False
+        exporter = OTLPSpanExporter()
+        target = "OTLP"
+    else:
+        exporter = ConsoleSpanExporter(
+            out=open(settings.TRACING_FILE, "a", encoding="utf-8"),
+            formatter=lambda span: span.to_json(indent=None) + "\n",
+        )
+        target = settings.TRACING_FILE
+
+    _provider = TracerProvider(
+        resource=Resource.create({"service.name": service_name or settings.TRACING_SERVICE_NAME}),
+        sampler=ParentBased(TraceIdRatioBased(settings.TRACING_SAMPLE_RATE)),
+    )
+    _provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(_provider)
+    _tracer = trace.get_tracer("yauberu")
+    log.info("Exporting spans to %s (sample rate %s)", target, settings.TRACING_SAMPLE_RATE)
+    return True
+
+
+def shutdown_tracing():
+    """Export spans still buffered"""
+    global _tracer, _provider
+    if _provider is not None:
+        _provider.shutdown()
+    _tracer = _provider = None
+
+
+def _kind(kind: str):
+    from opentelemetry.trace import SpanKind
+    return getattr(SpanKind, kind.upper())
+
+
+def span(name: str, kind: str = "internal", **attributes):
+    """Context manager for a child span of the current one; yields None when tracing is off"""
+    if _tracer is None:
+        return _NOOP
+    return _tracer.start_as_current_span(name, kind=_kind(kind), attributes=attributes)
+
+
+def set_error(current, error: str):
+    if current is not None:
+        from opentelemetry.trace import Status, StatusCode
+        current.set_status(Status(StatusCode.ERROR, error))
+
+
+# ============ CONTEXT HAND-OFF (worker pools) ============
+
+def current_context():
+    if _tracer is None:
+        return None
+    from opentelemetry import context
+    return context.get_current()
+
+
+def attach(ctx):
+    if ctx is None:
+        return None
+    from opentelemetry import context
+    return context.attach(ctx)
+
+
+def detach(token):
+    if token is not None:
+        from opentelemetry import context
+        context.detach(token)
+
+
+# ============ HTTP ============
+
+class TracingMiddleware:
+    """Pure ASGI: one server span per request, continuing the caller's trace if it sent traceparent"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _tracer is None:
+            return await self.app(scope, receive, send)
+        from opentelemetry import propagate
+
+        carrier = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+        method = scope["method"]
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        with _tracer.start_as_current_span(
+            f"{method} {scope['path']}", context=propagate.extract(carrier), kind=_kind("server"),
+            attributes={"http.method": method, "http.target": scope["path"]},
+        ) as current:
+            if request_id_var.get():
+                current.set_attribute("request.id", request_id_var.get())
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                route = scope.get("route")
+                if route is not None:
+                    # Route template keeps span names low-cardinality
+                    current.update_name(f"{method} {route.path}")
+                    current.set_attribute("http.route", route.path)
+                current.set_attribute("http.status_code", status[0])
+                if status[0] >= 500:
+                    set_error(current, f"HTTP {status[0]}")
+
+
+# ============ DATABASE ============
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+    current = _tracer.start_span(f"db {operation}", kind=_kind("client"), attributes={
+        "db.system": conn.dialect.name,
+        "db.statement": statement[:2000],
+    })
+    conn.info.setdefault("tracing_spans", []).append(current)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get("tracing_spans")
+    if spans:
+        spans.pop().end()
+
+
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    spans = conn.info.get("tracing_spans") if conn is not None else None
+    if spans:
+        current = spans.pop()
+        set_error(current, type(exception_context.original_exception).__name__)
+        current.end()
+
+
+def instrument_engine(engine):
+    if _tracer is None:
+        return
+    sync_engine = engine.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
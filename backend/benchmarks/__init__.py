@@ -0,0 +1 @@
+# Benchmarks and load-test harnesses (run from backend/: python -m benchmarks.<name>)
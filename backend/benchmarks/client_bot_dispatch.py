@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Per-update dispatch cost of the client bot (handle_update), Telegram excluded.
+
+Runs each recorded update type through client_bot.handle_update many times on a
+temporary SQLite DB. Bot API calls are replaced by a no-op that only records
+payload size, so the numbers are routing + DB + payload building/serialization.
+
+Usage (from backend/):
+    python -m benchmarks.client_bot_dispatch --iterations 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from benchmarks.replay_client_bot_updates import DEFAULT_UPDATES, load_updates, make_update, percentile
+
+
+def label(update):
+    if "callback_query" in update:
+        return f"callback:{update['callback_query'].get('data', '')}"
+    message = update.get("message", {})
+    if "contact" in message:
+        return "contact"
+    return f"text:{message.get('text', '')}"
+
+
+async def run(args):
+    os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mktemp(suffix='.db')}")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from app.models import Base, engine, async_session, TariffPrice
+    from app.api import client_bot
+    from app.services import telegram_api
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_session() as db:
+        db.add_all([
+            TariffPrice(tariff_id="single", name="Разовый вынос", price=139, old_price=250, description="-"),
+            TariffPrice(tariff_id="trial", name="Пробный старт", price=199, period="2 недели", description="-"),
+            TariffPrice(tariff_id="monthly", name="Комфорт", price=1490, period="месяц", description="-"),
+        ])
+        await db.commit()
+
+    sent_bytes = defaultdict(int)
+
+    async def fake_call(method, payload=None, use_courier_bot=False, content=None):
+        # Serialize like the real client would, so payload building cost is included
+        body = content if content is not None else json.dumps(payload or {}, ensure_ascii=False).encode()
+        sent_bytes[method] += len(body)
+        if method == "sendPhoto":
+            return {"ok": True, "result": {"message_id": 1, "photo": [{"file_id": "bench-file-id"}]}}
+        if method == "sendMediaGroup":
+            return {"ok": True, "result": [
+                {"message_id": i, "photo": [{"file_id": f"bench-file-id-{i}"}]} for i in range(len(payload["media"]))
+            ]}
+        return {"ok": True, "result": True}
+
+    telegram_api.call = fake_call
+
+    # Register every chat's user first so /start and menu take the full path
+    templates = load_updates(args.updates)
+    chat_id = 700_000_001
+    for template in templates:
+        if "contact" in template.get("message", {}):
+            async with async_session() as db:
+                await client_bot.handle_update(make_update(template, 0, chat_id), db)
+                await db.commit()
+
+    timings = defaultdict(list)
+    update_id = 1
+    for template in templates:
+        name = label(template)
+        for _ in range(args.warmup):
+            async with async_session() as db:
+                await client_bot.handle_update(make_update(template, update_id, chat_id), db)
+        for _ in range(args.iterations):
+            update = make_update(template, update_id, chat_id)
+            update_id += 1
+            async with async_session() as db:
+                started = time.perf_counter()
+                await client_bot.handle_update(update, db)
+                timings[name].append((time.perf_counter() - started) * 1_000_000)
+                await db.rollback()
+
+    print("\n" + "=" * 72)
+    print(f"📊 CLIENT BOT DISPATCH COST ({args.iterations} iterations per update, µs)")
+    print("=" * 72)
+    print(f"   {'update':<28}{'p50':>10}{'p95':>10}{'p99':>10}{'mean':>10}")
+    for name, values in timings.items():
+        print(f"   {name[:28]:<28}{percentile(values, 50):>10.1f}{percentile(values, 95):>10.1f}"
+              f"{percentile(values, 99):>10.1f}{statistics.mean(values):>10.1f}")
+    print(f"\n   Bytes sent per method: {dict(sent_bytes)}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", default=DEFAULT_UPDATES, help="JSONL file with recorded updates")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=20)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
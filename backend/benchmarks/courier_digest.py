@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Morning scheduler run: courier messages per order vs one digest per courier.
+
+Seeds a temporary SQLite DB with --orders daily subscriptions spread over
+--complexes complexes and --couriers couriers, points TELEGRAM_API_URL at a
+local Bot API stub and runs scheduler.generate_orders_for_today() once with
+COURIER_DIGEST off and once with it on. The stub answers sendMessage after
+--latency seconds and, like Telegram, answers 429 to a bot sending more than
+--rate-limit messages per second. Reports sendMessage calls, deliveries,
+429s and wall-clock time for each mode.
+
+Usage (from backend/):
+    python -m benchmarks.courier_digest --orders 500 --couriers 20
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import socket
+import sys
+import tempfile
+import time
+from collections import Counter, deque
+from datetime import date
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def telegram_stub(latency: float, rate_limit: int):
+    """Bot API stub: counts calls, simulates latency and the per-bot rate limit"""
+    from fastapi import FastAPI
+
+    app = FastAPI()
+    app.state.calls = Counter()
+    app.state.texts = []
+    sent_at = {}
+
+    @app.post("/bot{token}/{method}")
+    async def bot_api(token: str, method: str, payload: dict):
+        await asyncio.sleep(latency)
+        now = time.monotonic()
+        window = sent_at.setdefault(token, deque())
+        while window and now - window[0] > 1:
+            window.popleft()
+        if rate_limit and len(window) >= rate_limit:
+            app.state.calls[(method, 429)] += 1
+            return {"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1}}
+        window.append(now)
+        app.state.calls[(method, 200)] += 1
+        app.state.texts.append(payload.get("text", ""))
+        return {"ok": True, "result": {"message_id": len(app.state.texts), "chat": {"id": payload.get("chat_id")}}}
+
+    return app
+
+
+async def run(args):
+    port = free_port()
+    db_path = tempfile.mktemp(suffix=".db")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    os.environ["LOG_LEVEL"] = "WARNING"  # Logs go through a writer thread, not the redirected stdout
+    os.environ["TELEGRAM_API_URL"] = f"http://127.0.0.1:{port}"
+    os.environ["TELEGRAM_BOT_TOKEN"] = "bench-client"
+    os.environ["TELEGRAM_COURIER_BOT_TOKEN"] = "bench-courier"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    import uvicorn
+    from sqlalchemy import insert, update, delete
+    from app.config import settings
+    from app.models import (
+        Base, engine, User, UserRole, Balance, Address, ResidentialComplex, Order, Subscription, SlotBooking,
+        BalanceTransaction, Tariff, TimeSlot,
+    )
+    from app.services import scheduler, telegram_api
+
+    stub = telegram_stub(args.latency, args.rate_limit)
+    server = uvicorn.Server(uvicorn.Config(stub, port=port, log_level="warning", access_log=False))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    slots = list(TimeSlot)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(ResidentialComplex), [
+            {"id": i, "name": f"ЖК {i}", "short_name": f"C{i}", "is_active": True}
+            for i in range(1, args.complexes + 1)
+        ])
+        await conn.execute(insert(User), [
+            {"id": i, "telegram_id": 900_000_000 + i, "name": f"Client {i}", "role": UserRole.CLIENT,
+             "is_active": True}
+            for i in range(1, args.orders + 1)
+        ])
+        await conn.execute(insert(User), [
+            {"id": args.orders + i, "telegram_id": 910_000_000 + i, "name": f"Courier {i}",
+             "role": UserRole.COURIER, "is_active": True}
+            for i in range(1, args.couriers + 1)
+        ])
+        await conn.execute(insert(Balance), [
+            {"user_id": i, "credits": 100, "single_credits": 0} for i in range(1, args.orders + 1)
+        ])
+        await conn.execute(insert(Address), [
+            {"id": i, "user_id": i, "complex_id": i % args.complexes + 1, "building": str(i % 5 + 1),
+             "apartment": str(i)}
+            for i in range(1, args.orders + 1)
+        ])
+        await conn.execute(insert(Subscription), [
+            {"user_id": i, "address_id": i, "tariff": Tariff.MONTHLY, "total_credits": 100, "used_credits": 0,
+             "frequency": "daily", "start_date": date.today(), "default_time_slot": slots[i % len(slots)],
+             "is_active": True}
+            for i in range(1, args.orders + 1)
+        ])
+
+    rows = []
+    try:
+        for digest in (False, True):
+            async with engine.begin() as conn:
+                for table in (Order, SlotBooking, BalanceTransaction):
+                    await conn.execute(delete(table))
+                await conn.execute(update(Subscription).values(last_generated_date=None, used_credits=0))
+            stub.state.calls.clear()
+            settings.COURIER_DIGEST = digest
+
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):  # Scheduler and notification logging
+                generated, _ = await scheduler.generate_orders_for_today()
+            elapsed = time.perf_counter() - started
+            calls = stub.state.calls
+            rows.append(("digest" if digest else "per order", generated,
+                         calls[("sendMessage", 200)] + calls[("sendMessage", 429)],
+                         calls[("sendMessage", 200)], calls[("sendMessage", 429)], elapsed))
+    finally:
+        await telegram_api.close_client()
+        server.should_exit = True
+        await server_task
+        await engine.dispose()
+        os.unlink(db_path)
+
+    print("\n" + "=" * 78)
+    print(f"📊 COURIER NOTIFICATIONS ({args.orders} subscription orders, {args.couriers} couriers, "
+          f"stub {args.latency * 1000:.0f} ms, {args.rate_limit} msg/s)")
+    print("=" * 78)
+    print(f"   {'mode':<10}{'orders':>8}{'sendMessage':>13}{'delivered':>11}{'429':>8}{'seconds':>10}")
+    for mode, generated, calls, delivered, limited, elapsed in rows:
+        print(f"   {mode:<10}{generated:>8}{calls:>13}{delivered:>11}{limited:>8}{elapsed:>10.1f}")
+    if stub.state.texts:
+        print("\n   Digest sample:\n      " + stub.state.texts[-1][:400].replace("\n", "\n      "))
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=500, help="Subscriptions due today")
+    parser.add_argument("--couriers", type=int, default=20)
+    parser.add_argument("--complexes", type=int, default=12)
+    parser.add_argument("--latency", type=float, default=0.005, help="Stub sendMessage latency, seconds")
+    parser.add_argument("--rate-limit", type=int, default=30, help="Stub messages per second per bot (0 = off)")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+POST /api/orders latency vs. number of couriers.
+
+Runs the app in-process on a temporary SQLite DB with every Telegram call
+replaced by a fake that sleeps --telegram-latency seconds. For each courier
+count, creates --requests single orders and reports response percentiles,
+then waits for the notification dispatcher to drain and reports how many
+messages it delivered. Create-order latency should stay flat while the
+number of background deliveries grows with the courier count.
+
+Usage (from backend/):
+    python -m benchmarks.create_order_latency --couriers 0,10,100,500 --requests 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+
+from benchmarks.replay_client_bot_updates import percentile
+
+
+async def run(args):
+    os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mktemp(suffix='.db')}")
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "bench")
+    os.environ.setdefault("TELEGRAM_COURIER_BOT_TOKEN", "bench")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    import httpx
+    from app.main import app
+    from app.models import (
+        Base, engine, async_session, User, UserRole, Balance, Address, ResidentialComplex,
+    )
+    from app.services import telegram_api, dispatcher
+    from app.services.auth import create_access_token
+
+    sent = {"count": 0}
+
+    async def fake_call(method, payload=None, use_courier_bot=False, content=None):
+        await asyncio.sleep(args.telegram_latency)
+        sent["count"] += 1
+        return {"ok": True, "result": {"message_id": sent["count"]}}
+
+    telegram_api.call = fake_call
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_session() as db:
+        complex_obj = ResidentialComplex(name="ЖК Бенчмарк", short_name="B")
+        db.add(complex_obj)
+        user = User(telegram_id=900_000_001, name="Bench Client", phone="+79000000001")
+        db.add(user)
+        await db.flush()
+        db.add(Balance(user_id=user.id, credits=0, single_credits=10_000_000))
+        address = Address(user_id=user.id, complex_id=complex_obj.id, building="1", apartment="1")
+        db.add(address)
+        await db.commit()
+        user_id, address_id = user.id, address.id
+
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user_id)})}"}
+    body = {"address_id": address_id, "date": date.today().isoformat(), "time_slot": "20:00-22:00",
+            "tariff_type": "single"}
+
+    couriers_total = 0
+    rows = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for target in [int(c) for c in args.couriers.split(",")]:
+            async with async_session() as db:
+                db.add_all([
+                    User(telegram_id=910_000_000 + i, name=f"Courier {i}", role=UserRole.COURIER)
+                    for i in range(couriers_total, target)
+                ])
+                await db.commit()
+            couriers_total = max(couriers_total, target)
+
+            sent_before = sent["count"]
+            latencies = []
+            for _ in range(args.requests):
+                started = time.perf_counter()
+                resp = await client.post("/api/orders/", json=body, headers=headers)
+                latencies.append((time.perf_counter() - started) * 1000)
+                if resp.status_code != 200:
+                    print(f"   ❌ {resp.status_code}: {resp.text[:200]}")
+                    return 1
+
+            drain_started = time.perf_counter()
+            while dispatcher.notification_queue.depth() or dispatcher.notification_queue.in_flight:
+                await asyncio.sleep(0.01)
+            drain = time.perf_counter() - drain_started
+
+            rows.append((couriers_total, percentile(latencies, 50), percentile(latencies, 99),
+                         statistics.mean(latencies), sent["count"] - sent_before, drain))
+
+    await dispatcher.notification_queue.stop()
+
+    print("\n" + "=" * 78)
+    print(f"📊 CREATE ORDER LATENCY ({args.requests} requests per row, Telegram {args.telegram_latency * 1000:.0f} ms/call)")
+    print("=" * 78)
+    print(f"   {'couriers':>8}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}{'messages':>12}{'drain s':>10}")
+    for couriers, p50, p99, mean, messages, drain in rows:
+        print(f"   {couriers:>8}{p50:>10.2f}{p99:>10.2f}{mean:>10.2f}{messages:>12}{drain:>10.2f}")
+    print(f"\n   Dispatcher: {dispatcher.stats()['jobs']}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--couriers", default="0,10,100,500", help="Comma-separated courier counts")
+    parser.add_argument("--requests", type=int, default=100, help="Orders created per courier count")
+    parser.add_argument("--telegram-latency", type=float, default=0.05, help="Fake Bot API latency, seconds")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+Hot endpoints and background jobs: latency, SQL statements and allocations,
+compared against a JSON baseline.
+
+Seeds a temporary SQLite DB with benchmarks.seed_dataset (--users, --orders,
+--complexes), starts the Telegram stub, and runs the app in-process. Every
+case is called --warmup times, then --iterations times for latency
+(p50/p95) and SQL statements per call, then --alloc-iterations times under
+tracemalloc for peak allocated KiB per call:
+- courier.get_orders, courier.get_complexes_with_orders
+- courier.take_order, courier.complete_order   (fresh orders for today)
+- orders.create_order                          (single order, random slot)
+- auth.telegram_auth                           (signed initData, existing users)
+- admin.list_clients, admin.get_dashboard_stats
+- scheduler.generate_orders_for_today          (every run starts from the same DB snapshot)
+- payments.yookassa_webhook                    (payment.succeeded for pending payments)
+
+Results are compared with --baseline (benchmarks/baselines/hot_paths.json):
+more statements per call, p50 above --latency-tolerance (latency on a shared
+machine is noisy) or allocations above --alloc-tolerance is a regression and
+the exit code is 1. So is a timed call exceeding its route's
+@statement_budget (the SQL profiler is on for the run), baseline or not, and
+(without --only) a route with a @statement_budget that no case calls. --save
+writes the current run as the new baseline, so changes show up as a diff of
+that file in review.
+
+Usage (from backend/):
+    python -m benchmarks.hot_paths
+    python -m benchmarks.hot_paths --save
+    python -m benchmarks.hot_paths --only courier.get_orders,admin.list_clients --iterations 100
+"""
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import hashlib
+import hmac
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from urllib.parse import urlencode
+
+from benchmarks.courier_digest import free_port
+from benchmarks.replay_client_bot_updates import percentile
+from benchmarks.replica_routing import copy_database
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "hot_paths.json")
+BOT_TOKEN = "bench-client"
+TIME_SLOTS = ["08:00-10:00", "12:00-14:00", "16:00-18:00", "20:00-22:00"]
+
+
+def init_data(telegram_id: int, username: str) -> str:
+    """Mini App initData signed like Telegram does (see services/auth.verify_telegram_data)"""
+    fields = {
+        "auth_date": "1700000000",
+        "query_id": f"bench{telegram_id}",
+        "user": json.dumps({"id": telegram_id, "first_name": "Bench", "username": username}),
+    }
+    check_string = "\n".join(f"{key}={fields[key]}" for key in sorted(fields))
+    secret = hmac.new(b"WebAppData", BOT_TOKEN.encode(), hashlib.sha256).digest()
+    fields["hash"] = hmac.new(secret, check_string.encode(), hashlib.sha256).hexdigest()
+    return urlencode(fields)
+
+
+class Case:
+    """prepare(n) returns n payloads (untimed); before(payload) is untimed too; call(payload) is measured"""
+
+    def __init__(self, name, call, prepare=None, before=None, iterations=None):
+        self.name = name
+        self.call = call
+        self.prepare = prepare
+        self.before = before
+        self.iterations = iterations
+
+
+async def run(args):
+    db_path = tempfile.mktemp(suffix=".db")
+    database_url = f"sqlite+aiosqlite:///{db_path}"
+    telegram_port = free_port()
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["LOG_LEVEL"] = "WARNING"  # Logs go through a writer thread, not the redirected stdout
+    os.environ["TELEGRAM_API_URL"] = f"http://127.0.0.1:{telegram_port}"
+    os.environ["TELEGRAM_BOT_TOKEN"] = BOT_TOKEN
+    os.environ["TELEGRAM_COURIER_BOT_TOKEN"] = "bench-courier"
+    os.environ["SLOT_CAPACITY"] = "100000"
+    os.environ["SQL_PROFILE_ENABLED"] = "true"  # Route statement budgets are checked below
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    import httpx
+    import uvicorn
+    from sqlalchemy import event, select, insert, update, func
+    from benchmarks import seed_dataset
+    from stubs import telegram
+    from stubs.faults import Faults
+
+    seed_args = seed_dataset.build_parser().parse_args([
+        "--database-url", database_url, "--users", str(args.users), "--orders", str(args.orders),
+        "--complexes", str(args.complexes), "--couriers", "10", "--seed", str(args.seed),
+    ])
+    with contextlib.redirect_stdout(io.StringIO()):
+        await seed_dataset.seed(seed_args)
+
+    from app.main import app
+    from app.models import (
+        engine, read_engine, async_session, User, UserRole, Address, Order, OrderStatus, Subscription, Payment, TimeSlot,
+    )
+    from app.services import scheduler, dispatcher, telegram_api, ledger, sql_profile
+    from app.services.auth import create_access_token
+
+    stub = telegram.create_app(Faults(latency=args.telegram_latency, rate_limit=0))
+    stub_server = uvicorn.Server(uvicorn.Config(stub, port=telegram_port, log_level="warning", access_log=False))
+    stub_task = asyncio.create_task(stub_server.serve())
+    while not stub_server.started:
+        await asyncio.sleep(0.05)
+
+    # Statements are counted for the measured call's task only: ASGITransport runs the app
+    # in the caller's task, while notification workers (started here) never see the counter
+    statements = contextvars.ContextVar("statements", default=None)
+
+    def count_statement(*_):
+        counter = statements.get()
+        if counter is not None:
+            counter[0] += 1
+
+    for db_engine in (engine, read_engine):
+        event.listen(db_engine.sync_engine, "before_cursor_execute", count_statement)
+    if not dispatcher.notification_queue.started:
+        dispatcher.notification_queue.start()
+
+    async def settle():
+        while dispatcher.notification_queue.depth() or dispatcher.notification_queue.in_flight:
+            await asyncio.sleep(0.005)
+
+    rng = random.Random(args.seed)
+    today = date.today()
+    async with async_session() as db:
+        clients = (await db.execute(
+            select(User.id, User.telegram_id, User.username, Address.id)
+            .join(Address, Address.user_id == User.id)
+            .where(User.role == UserRole.CLIENT, Address.is_default == True)  # noqa: E712
+            .order_by(User.id)
+        )).all()
+        couriers = (await db.execute(select(User.telegram_id).where(User.role == UserRole.COURIER))).scalars().all()
+        buildings = (await db.execute(
+            select(func.coalesce(Address.complex_id, 0), Address.building, Address.street).distinct()
+            .join(Order, Order.address_id == Address.id)
+            .where(Order.date == today, Order.status == OrderStatus.SCHEDULED)
+        )).all()
+
+    bench_client = clients[0]
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': str(bench_client[0])})}"}
+
+    async def today_orders(n: int) -> list:
+        """Fresh scheduled orders for today, for take/complete"""
+        picked = [rng.choice(clients) for _ in range(n)]
+        async with async_session() as db:
+            result = await db.execute(
+                insert(Order).returning(Order.id),
+                [{"user_id": c[0], "address_id": c[3], "date": today, "time_slot": rng.choice(list(TimeSlot)),
+                  "status": OrderStatus.SCHEDULED} for c in picked],
+            )
+            ids = list(result.scalars())
+            await db.commit()
+        return ids
+
+    async def credits_for_orders(n: int) -> list:
+        async with async_session() as db:
+            balance = await ledger.get_or_create_balance(db, bench_client[0])
+            await ledger.post_entry(db, balance, n, description="Бенчмарк", credit_type=ledger.SINGLE_CREDITS)
+            await db.commit()
+        return [{
+            "address_id": bench_client[3],
+            "date": (today + timedelta(days=rng.randint(1, 14))).isoformat(),
+            "time_slot": rng.choice(TIME_SLOTS),
+            "tariff_type": "single",
+        } for _ in range(n)]
+
+    async def pending_payments(n: int) -> list:
+        rows = []
+        for i in range(n):
+            client = rng.choice(clients)
+            order_data = {"address_id": client[3], "date": (today + timedelta(days=rng.randint(1, 14))).isoformat(),
+                          "time_slot": rng.choice(TIME_SLOTS), "tariff_type": "single"}
+            rows.append({"user_id": client[0], "yookassa_payment_id": f"bench-{rng.getrandbits(64):016x}",
+                         "amount": 150, "status": "pending", "description": "Разовый вынос мусора",
+                         "tariff_type": "single", "order_data": json.dumps(order_data), "created_at": today})
+        async with async_session() as db:
+            await db.execute(insert(Payment), rows)
+            await db.commit()
+        return [{
+            "type": "notification", "event": "payment.succeeded",
+            "object": {"id": row["yookassa_payment_id"], "status": "succeeded", "paid": True,
+                       "amount": {"value": "150.00", "currency": "RUB"}, "created_at": f"{today}T10:00:00.000Z",
+                       "metadata": {"user_id": row["user_id"], "tariff_type": "single"}},
+        } for row in rows]
+
+    scheduler_snapshot = db_path + ".scheduler"
+
+    async def rearm_subscriptions(_):
+        """
+        Put the DB back as it was before the first scheduler run: a run adds
+        orders, slot bookings and ledger entries and uses up credits, so
+        re-arming last_generated_date alone would give each run less to do
+        """
+        if os.path.exists(scheduler_snapshot):
+            copy_database(scheduler_snapshot, db_path)  # NullPool: no connection is open between calls
+            return
+        async with async_session() as db:
+            await db.execute(update(Subscription).where(Subscription.is_active == True)  # noqa: E712
+                             .values(last_generated_date=today - timedelta(days=1)))
+            await db.commit()
+        copy_database(db_path, scheduler_snapshot)
+
+    taken = []
+
+    def cycle(items):
+        return lambda n: [items[i % len(items)] for i in range(n)]
+
+    http = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+
+    async def get(url, **kwargs):
+        response = await http.get(url, **kwargs)
+        response.raise_for_status()
+
+    async def post(url, **kwargs):
+        response = await http.post(url, **kwargs)
+        response.raise_for_status()
+        return response
+
+    async def take(order_id):
+        await post(f"/api/courier/orders/{order_id}/take", json={"courier_telegram_id": rng.choice(couriers)})
+        taken.append(order_id)
+
+    cases = [
+        Case("courier.get_orders",
+             lambda b: get("/api/courier/orders", params={
+                 "complex_id": b[0], "building": b[1] if b[0] else f"{b[2] or ''}, {b[1]}"}),
+             prepare=cycle(buildings)),
+        Case("courier.get_complexes_with_orders", lambda _: get("/api/courier/complexes")),
+        Case("courier.take_order", take, prepare=today_orders),
+        Case("courier.complete_order",
+             lambda order_id: post(f"/api/courier/orders/{order_id}/complete", params={"bags_count": 1}),
+             prepare=lambda n: [taken.pop() for _ in range(min(n, len(taken)))]),
+        Case("orders.create_order", lambda body: post("/api/orders/", json=body, headers=headers),
+             prepare=credits_for_orders),
+        Case("auth.telegram_auth",
+             lambda c: post("/api/auth/telegram", json={"init_data": init_data(c[1], c[2] or f"user{c[0]}")}),
+             prepare=cycle(clients)),
+        Case("admin.list_clients", lambda _: get("/api/admin/clients"), iterations=args.heavy_iterations),
+        Case("admin.get_dashboard_stats", lambda _: get("/api/admin/stats")),
+        Case("scheduler.generate_orders_for_today", lambda _: scheduler.generate_orders_for_today(),
+             before=rearm_subscriptions, iterations=args.heavy_iterations),
+        Case("payments.yookassa_webhook", lambda body: post("/api/payments/webhook", json=body),
+             prepare=pending_payments),
+    ]
+    if args.only:
+        wanted = set(args.only.split(","))
+        cases = [case for case in cases if case.name in wanted]
+
+    results, over_budget, exercised = {}, {}, set()
+    try:
+        for case in cases:
+            timed = case.iterations or args.iterations
+            total = args.warmup + timed + args.alloc_iterations
+            payloads = case.prepare(total) if case.prepare else [None] * total
+            if asyncio.iscoroutine(payloads):
+                payloads = await payloads
+            latencies, counts, peaks = [], [], []
+            with contextlib.redirect_stdout(io.StringIO()):  # Request logging
+                for i, payload in enumerate(payloads):
+                    if i == args.warmup:
+                        sql_profile.reset()  # Cold caches may exceed a budget during warmup
+                    if case.before:
+                        await case.before(payload)
+                    measure_alloc = i >= args.warmup + timed
+                    if measure_alloc and not tracemalloc.is_tracing():
+                        tracemalloc.start()
+                    if measure_alloc:
+                        tracemalloc.reset_peak()
+                        baseline_memory = tracemalloc.get_traced_memory()[0]
+                    counter = [0]
+                    token = statements.set(counter)
+                    started = time.perf_counter()
+                    await case.call(payload)
+                    elapsed = (time.perf_counter() - started) * 1000
+                    statements.reset(token)
+                    if measure_alloc:
+                        peaks.append((tracemalloc.get_traced_memory()[1] - baseline_memory) / 1024)
+                    elif i >= args.warmup:
+                        latencies.append(elapsed)
+                        counts.append(counter[0])
+                    await settle()
+                if tracemalloc.is_tracing():
+                    tracemalloc.stop()
+            results[case.name] = {
+                "calls": len(latencies),
+                "p50_ms": round(percentile(latencies, 50), 2),
+                "p95_ms": round(percentile(latencies, 95), 2),
+                "statements": statistics.median(counts) if counts else 0,
+                "alloc_kib": round(statistics.median(peaks), 1) if peaks else 0,
+            }
+            profile = sql_profile.top(0)
+            over_budget[case.name] = [f"budget {v['budget']} < {v['max']} stmts ({v['route']})"
+                                      for v in profile["budget_violations"]]
+            exercised.update(entry["route"] for entry in profile["budgets"])
+        await dispatcher.notification_queue.stop()
+    finally:
+        await http.aclose()
+        await telegram_api.close_client()
+        stub_server.should_exit = True
+        await stub_task
+        await engine.dispose()
+        for path in (db_path, scheduler_snapshot):
+            if os.path.exists(path):
+                os.unlink(path)
+
+    unexercised = [] if args.only else sorted(set(sql_profile.budgeted_routes(app.routes)) - exercised)
+    return report(args, results, over_budget, unexercised)
+
+
+def report(args, results: dict, over_budget: dict, unexercised: list) -> int:
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f).get("cases", {})
+
+    print("\n" + "=" * 104)
+    print(f"📊 HOT PATHS ({args.users} clients, {args.orders} orders, SQLite, "
+          f"baseline {os.path.relpath(args.baseline) if baseline else 'none'})")
+    print("=" * 104)
+    print(f"   {'case':<38}{'calls':>6}{'p50 ms':>9}{'p95 ms':>9}{'stmts':>7}{'KiB':>9}   vs baseline")
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        notes = list(over_budget.get(name, ()))
+        if old:
+            if result["statements"] > old["statements"]:
+                notes.append(f"statements {old['statements']}→{result['statements']}")
+            for key, label, tolerance in (("p50_ms", "p50", args.latency_tolerance),
+                                          ("alloc_kib", "KiB", args.alloc_tolerance)):
+                if old[key] and result[key] > old[key] * (1 + tolerance):
+                    notes.append(f"{label} +{(result[key] / old[key] - 1) * 100:.0f}%")
+        if notes:
+            regressions.append(name)
+        status = "⚠️  " + ", ".join(notes) if notes else ("✅" if old else "—")
+        print(f"   {name:<38}{result['calls']:>6}{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}"
+              f"{result['statements']:>7g}{result['alloc_kib']:>9.1f}   {status}")
+
+    for route in unexercised:
+        print(f"   ⚠️  {route} has a @statement_budget but no case calls it")
+
+    if args.save and not any(over_budget.values()) and not unexercised:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "dataset": {"users": args.users, "orders": args.orders, "complexes": args.complexes,
+                            "seed": args.seed},
+                "cases": results,
+            }, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\n   💾 Baseline saved to {os.path.relpath(args.baseline)}")
+        return 0
+    if regressions or unexercised:
+        print(f"\n   ❌ Regressions: {', '.join(regressions + unexercised)}")
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000, help="Seeded clients")
+    parser.add_argument("--orders", type=int, default=40_000, help="Seeded orders")
+    parser.add_argument("--complexes", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--heavy-iterations", type=int, default=10, help="For list_clients and the scheduler")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--alloc-iterations", type=int, default=5)
+    parser.add_argument("--telegram-latency", type=float, default=0.0)
+    parser.add_argument("--only", default=None, help="Comma-separated case names")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--latency-tolerance", type=float, default=1.0, help="Allowed p50 growth (1.0 = 2x)")
+    parser.add_argument("--alloc-tolerance", type=float, default=0.25, help="Allowed allocation growth")
+    parser.add_argument("--save", action="store_true", help="Write this run as the baseline")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Per-request cost of logging (app/logging_config.py).
+
+Runs the app in-process on a temporary SQLite DB and alternates --rounds
+rounds of --requests calls per endpoint in three modes, so drift hits all
+of them:
+  off     - the "app" logger disabled
+  queued  - the production setup: QueueHandler, writer thread, JSON lines
+  sync    - the same JSON formatter on a StreamHandler in the request path
+            (what print() amounted to)
+Records go to a temporary file; --sink-delay-us adds a sleep per write to
+stand in for a slow stdout pipe (container log drivers under load).
+
+Endpoints: GET /api/users/me (no log lines) and POST /api/auth/telegram with
+a bad signature (two lines per request).
+
+Usage (from backend/):
+    python -m benchmarks.logging_overhead --rounds 10 --requests 300 --sink-delay-us 200
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.replay_client_bot_updates import percentile
+
+
+class SlowFile:
+    """File wrapper whose writes take at least `delay` seconds"""
+
+    def __init__(self, path: str, delay: float):
+        self.file = open(path, "w")
+        self.delay = delay
+        self.lines = 0
+
+    def write(self, data: str):
+        if self.delay:
+            time.sleep(self.delay)
+        self.lines += data.count("\n")
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+async def run(args):
+    db_path = tempfile.mktemp(suffix=".db")
+    log_path = tempfile.mktemp(suffix=".log")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    os.environ["METRICS_ENABLED"] = "false"
+    os.environ["TELEGRAM_BOT_TOKEN"] = "bench-logging"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    import httpx
+    from app import logging_config
+    from app.main import app
+    from app.models import Base, engine, async_session, User, Balance
+    from app.services.auth import create_access_token
+
+    sink = SlowFile(log_path, args.sink_delay_us / 1e6)
+    root = logging.getLogger(logging_config.ROOT)
+
+    def use_mode(mode: str):
+        logging_config.shutdown_logging()
+        if mode == "off":
+            root.handlers[:] = []
+            root.disabled = True
+            return
+        root.disabled = False
+        logging_config.setup_logging(level="INFO", fmt="json", stream=sink, force=True)
+        if mode == "sync":
+            # Same formatter and filter, written on the calling thread
+            logging_config.shutdown_logging()
+
+    use_mode("off")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_session() as db:
+        user = User(telegram_id=900_000_001, name="Bench Client", phone="+79000000001")
+        db.add(user)
+        await db.flush()
+        db.add(Balance(user_id=user.id, credits=0, single_credits=0))
+        await db.commit()
+        headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"}
+
+    bad_auth = {"init_data": "auth_date=1700000000&user=%7B%22id%22%3A1%7D&hash=" + "0" * 64}
+    endpoints = [
+        ("GET /api/users/me", "GET", "/api/users/me", {"headers": headers}),
+        ("POST /api/auth/telegram", "POST", "/api/auth/telegram", {"json": bad_auth}),
+    ]
+    modes = ("off", "queued", "sync")
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+    latencies = {(label, mode): [] for label, *_ in endpoints for mode in modes}
+
+    for _ in range(args.rounds):
+        for mode in modes:
+            use_mode(mode)
+            for label, method, url, kwargs in endpoints:
+                for _ in range(args.requests):
+                    started = time.perf_counter()
+                    await client.request(method, url, **kwargs)
+                    latencies[(label, mode)].append((time.perf_counter() - started) * 1e6)
+
+    use_mode("off")
+    await client.aclose()
+    await engine.dispose()
+    sink.close()
+    os.unlink(db_path)
+    os.unlink(log_path)
+
+    print("\n" + "=" * 78)
+    print(f"📊 LOGGING OVERHEAD ({args.rounds} rounds x {args.requests} requests per endpoint, "
+          f"sink delay {args.sink_delay_us:.0f} µs/write)")
+    print("=" * 78)
+    print(f"   {'endpoint':<26}{'mode':<8}{'p50 µs':>10}{'p99 µs':>10}{'mean µs':>10}{'Δ mean':>10}")
+    for label, *_ in endpoints:
+        base = statistics.mean(latencies[(label, "off")])
+        for mode in modes:
+            values = latencies[(label, mode)]
+            print(f"   {label:<26}{mode:<8}{percentile(values, 50):>10.0f}{percentile(values, 99):>10.0f}"
+                  f"{statistics.mean(values):>10.0f}{statistics.mean(values) - base:>10.1f}")
+    print(f"\n   Lines written: {sink.lines}, dropped by a full queue: {logging_config.dropped}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=300, help="Requests per endpoint per round")
+    parser.add_argument("--sink-delay-us", type=float, default=200,
+                        help="Extra time per write to the log sink (simulated slow stdout)")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Per-request cost of the Prometheus instrumentation (services/metrics.py).
+
+Runs the app in-process on a temporary SQLite DB and alternates --rounds
+rounds of --requests calls per endpoint with and without MetricsMiddleware
+plus the SQLAlchemy event hooks, so drift (disk cache, GC) hits both sides.
+Reports p50 and mean latency per endpoint for both and the difference in
+microseconds, then the time to render /metrics.
+
+Usage (from backend/):
+    python -m benchmarks.metrics_overhead --rounds 10 --requests 500
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.replay_client_bot_updates import percentile
+
+
+async def run(args):
+    db_path = tempfile.mktemp(suffix=".db")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    os.environ["LOG_LEVEL"] = "WARNING"  # Logs go through a writer thread, not the redirected stdout
+    os.environ["METRICS_ENABLED"] = "false"  # Instrumentation is switched on and off below
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    import httpx
+    from sqlalchemy import event
+    from app.main import app
+    from app.models import Base, engine, async_session, User, Balance
+    from app.services import metrics
+    from app.services.auth import create_access_token
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_session() as db:
+        user = User(telegram_id=900_000_001, name="Bench Client", phone="+79000000001")
+        db.add(user)
+        await db.flush()
+        db.add(Balance(user_id=user.id, credits=0, single_credits=0))
+        await db.commit()
+        headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"}
+
+    endpoints = [("GET /health", "/health", {}), ("GET /api/users/me", "/api/users/me", headers)]
+    hooks = [
+        (engine.sync_engine, "before_cursor_execute", metrics._before_cursor_execute),
+        (engine.sync_engine, "after_cursor_execute", metrics._after_cursor_execute),
+        (engine.sync_engine.pool, "connect", metrics._on_connect),
+        (engine.sync_engine.pool, "checkout", metrics._on_checkout),
+        (engine.sync_engine.pool, "checkin", metrics._on_checkin),
+    ]
+    plain = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+    instrumented = httpx.AsyncClient(transport=httpx.ASGITransport(app=metrics.MetricsMiddleware(app)),
+                                     base_url="http://bench")
+    latencies = {(label, mode): [] for label, _, _ in endpoints for mode in ("off", "on")}
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(args.rounds):
+            for mode, client in (("off", plain), ("on", instrumented)):
+                if mode == "on":
+                    for target, name, func in hooks:
+                        event.listen(target, name, func)
+                for label, url, request_headers in endpoints:
+                    for _ in range(args.requests):
+                        started = time.perf_counter()
+                        await client.get(url, headers=request_headers)
+                        latencies[(label, mode)].append((time.perf_counter() - started) * 1e6)
+                if mode == "on":
+                    for target, name, func in hooks:
+                        event.remove(target, name, func)
+
+        render_started = time.perf_counter()
+        text = metrics.render()
+        render_ms = (time.perf_counter() - render_started) * 1000
+
+    await plain.aclose()
+    await instrumented.aclose()
+    await engine.dispose()
+    os.unlink(db_path)
+
+    print("\n" + "=" * 78)
+    print(f"📊 METRICS OVERHEAD ({args.rounds} rounds x {args.requests} requests per endpoint, in-process)")
+    print("=" * 78)
+    print(f"   {'endpoint':<22}{'off p50 µs':>12}{'on p50 µs':>12}{'off mean':>11}{'on mean':>10}{'Δ mean µs':>11}")
+    for label, _, _ in endpoints:
+        off, on = latencies[(label, "off")], latencies[(label, "on")]
+        print(f"   {label:<22}{percentile(off, 50):>12.0f}{percentile(on, 50):>12.0f}"
+              f"{statistics.mean(off):>11.0f}{statistics.mean(on):>10.0f}"
+              f"{statistics.mean(on) - statistics.mean(off):>11.1f}")
+    print(f"\n   /metrics render: {render_ms:.2f} ms, {len(text.splitlines())} lines")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=500, help="Requests per endpoint per round")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
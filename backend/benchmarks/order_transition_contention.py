@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Courier complete/undo under contention: throughput and double deductions.
+
+Runs the app in-process on a temporary SQLite DB (Telegram tokens empty, so
+notifications are skipped) with one subscription client and --orders of
+their subscription orders. Every round, --workers concurrent requests try to
+complete each order at once (as when a courier double-taps or two couriers
+race), then every order is undone. A correct server completes - and deducts
+a credit for - each order exactly once per round, whatever the other requests
+get back, and each undo gives that credit back. Reports request throughput,
+response codes, credits deducted and refunded against the expected
+orders x rounds, and checks the balance and used credits end where they
+started. Any 5xx fails the run.
+
+The SQLite connections wait up to 60 s for a lock (the default 5 s busy
+timeout ran out under this contention and answered 500 "database is
+locked"); PostgreSQL row locks do that waiting in production.
+
+Usage (from backend/):
+    python -m benchmarks.order_transition_contention --orders 4 --workers 16 --rounds 50
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date
+
+
+async def run(args):
+    db_path = tempfile.mktemp(suffix=".db")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}?timeout=60"  # Busy timeout, seconds
+    os.environ["LOG_LEVEL"] = "WARNING"  # Logs go through a writer thread, not the redirected stdout
+    os.environ["TELEGRAM_BOT_TOKEN"] = ""
+    os.environ["TELEGRAM_COURIER_BOT_TOKEN"] = ""
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    import httpx
+    from sqlalchemy import select, func
+    from app.main import app
+    from app.models import (
+        Base, engine, async_session, User, Balance, BalanceTransaction, Address, ResidentialComplex,
+        Order, Subscription, Tariff, TimeSlot,
+    )
+
+    credits = args.orders * args.rounds * args.workers  # Enough for every request to deduct
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_session() as db:
+        complex_obj = ResidentialComplex(name="ЖК Бенчмарк", short_name="B")
+        user = User(telegram_id=900_000_001, name="Bench Client", phone="+79000000001",
+                    active_subscriptions_count=1)
+        db.add_all([complex_obj, user])
+        await db.flush()
+        balance = Balance(user_id=user.id, credits=credits, single_credits=0)
+        address = Address(user_id=user.id, complex_id=complex_obj.id, building="1", apartment="1")
+        db.add_all([balance, address])
+        await db.flush()
+        subscription = Subscription(user_id=user.id, address_id=address.id, tariff=Tariff.MONTHLY,
+                                    total_credits=credits * 2, used_credits=0, is_active=True)
+        db.add(subscription)
+        await db.flush()
+        orders = [
+            Order(user_id=user.id, address_id=address.id, date=date.today(), time_slot=TimeSlot.NIGHT,
+                  is_subscription=True, subscription_id=subscription.id)
+            for _ in range(args.orders)
+        ]
+        db.add_all(orders)
+        await db.commit()
+        order_ids = [o.id for o in orders]
+        balance_id, subscription_id = balance.id, subscription.id
+
+    codes = Counter()
+    completed = 0
+
+    async def post(client, path):
+        resp = await client.post(path)
+        codes[(path.rsplit("/", 1)[-1].split("?")[0], resp.status_code)] += 1
+        return resp.status_code
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    started = time.perf_counter()
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        with contextlib.redirect_stdout(io.StringIO()):  # Endpoint logging
+            for _ in range(args.rounds):
+                results = await asyncio.gather(*(
+                    post(client, f"/api/courier/orders/{order_id}/complete?bags_count=1")
+                    for order_id in order_ids for _ in range(args.workers)
+                ))
+                completed += sum(1 for code in results if code == 200)
+                await asyncio.gather(*(post(client, f"/api/courier/orders/{order_id}/undo") for order_id in order_ids))
+    elapsed = time.perf_counter() - started
+    requests = sum(codes.values())
+
+    async with async_session() as db:
+        deducted = -(await db.scalar(
+            select(func.coalesce(func.sum(BalanceTransaction.amount), 0))
+            .where(BalanceTransaction.balance_id == balance_id, BalanceTransaction.amount < 0)
+        ))
+        refunded = await db.scalar(
+            select(func.coalesce(func.sum(BalanceTransaction.amount), 0))
+            .where(BalanceTransaction.balance_id == balance_id, BalanceTransaction.amount > 0)
+        )
+        credits_left = await db.scalar(select(Balance.credits).where(Balance.id == balance_id))
+        used = await db.scalar(select(Subscription.used_credits).where(Subscription.id == subscription_id))
+    await engine.dispose()
+    os.unlink(db_path)
+
+    expected = args.orders * args.rounds
+    print("\n" + "=" * 70)
+    print(f"📊 COMPLETE/UNDO CONTENTION ({args.orders} orders x {args.workers} concurrent completes, "
+          f"{args.rounds} rounds)")
+    print("=" * 70)
+    print(f"   Requests:          {requests} in {elapsed:.1f}s ({requests / elapsed:.0f} req/s)")
+    for (action, code), count in sorted(codes.items()):
+        print(f"   {action:<10} {code}: {count:>8}")
+    print(f"   Completes -> 200:  {completed} (expected {expected})")
+    print(f"   Credits deducted:  {deducted} (expected {expected}), refunded by undo: {refunded}")
+    print(f"   Balance:           {credits} -> {credits_left}, subscription used: {used} (expected unchanged)")
+    errors = sum(count for (_, code), count in codes.items() if code >= 500)
+    ok = deducted == expected and refunded == expected and used == 0 and credits_left == credits and not errors
+    if errors:
+        print(f"   ❌ {errors} server errors")
+    elif ok:
+        print("   ✅ One deduction per completion")
+    else:
+        print(f"   ❌ {deducted - expected:+d} credits vs expected")
+    return 0 if ok else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=4, help="Subscription orders raced on")
+    parser.add_argument("--workers", type=int, default=16, help="Concurrent completes per order per round")
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
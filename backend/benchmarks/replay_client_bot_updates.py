@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Replay recorded client-bot updates against the webhook at a fixed rate.
+
+Updates are taken from a JSONL file (record real traffic with
+CLIENT_BOT_RECORD_UPDATES=/path/updates.jsonl) and fanned out across
+--chats synthetic chats. Reports webhook latency percentiles, 503s
+(backpressure), worker-pool stats and per-chat ordering violations.
+
+Usage (from backend/):
+    python -m benchmarks.replay_client_bot_updates --rate 1000 --count 10000
+    python -m benchmarks.replay_client_bot_updates --url http://localhost:8000 --rate 200
+
+Without --url the app runs in-process on a temporary SQLite DB with Telegram
+sends disabled; --handler-latency simulates Telegram round-trips per update.
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+DEFAULT_UPDATES = os.path.join(os.path.dirname(__file__), "data", "client_bot_updates.jsonl")
+
+
+def load_updates(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def make_update(template, update_id, chat_id):
+    """Rebind a recorded update to a synthetic chat/user"""
+    data = copy.deepcopy(template)
+    data["update_id"] = update_id
+    body = data.get("message") or data.get("callback_query", {})
+    if "from" in body:
+        body["from"]["id"] = chat_id
+    chat = body.get("chat") or body.get("message", {}).get("chat")
+    if chat is not None:
+        chat["id"] = chat_id
+    if "contact" in body:
+        body["contact"]["user_id"] = chat_id
+        body["contact"]["phone_number"] = f"7{chat_id}"
+    return data
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+
+async def run(args):
+    import httpx
+
+    templates = load_updates(args.updates)
+    in_process = not args.url
+
+    if in_process:
+        os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mktemp(suffix='.db')}")
+        os.environ["TELEGRAM_BOT_TOKEN"] = ""
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+        from app.main import app
+        from app.models import Base, engine
+        from app.api import client_bot
+
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        # Wrap the handler to check per-chat ordering and simulate Telegram latency
+        seen = defaultdict(list)
+        original_handler = client_bot.update_queue.handler
+
+        async def traced_handler(data):
+            seen[client_bot._update_chat_id(data)].append(data["update_id"])
+            if args.handler_latency:
+                await asyncio.sleep(args.handler_latency)
+            await original_handler(data)
+
+        client_bot.update_queue.handler = traced_handler
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://replay")
+    else:
+        client = httpx.AsyncClient(base_url=args.url, timeout=30)
+
+    latencies = []
+    statuses = defaultdict(int)
+    interval = 1.0 / args.rate if args.rate else 0
+
+    async def send(update):
+        started = time.perf_counter()
+        resp = await client.post("/api/client-bot/webhook", json=update)
+        latencies.append((time.perf_counter() - started) * 1000)
+        statuses[resp.status_code] += 1
+
+    print(f"▶️  Replaying {args.count} updates at {args.rate}/s across {args.chats} chats "
+          f"({'in-process' if in_process else args.url})")
+
+    pending = []
+    started = time.perf_counter()
+    for i in range(args.count):
+        chat_id = 700_000_000 + (i % args.chats)
+        update = make_update(templates[i % len(templates)], i + 1, chat_id)
+        pending.append(asyncio.create_task(send(update)))
+        if interval:
+            next_at = started + (i + 1) * interval
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+    await asyncio.gather(*pending)
+    sent_in = time.perf_counter() - started
+
+    stats_resp = await client.get("/api/client-bot/queue-stats")
+    stats = stats_resp.json()
+
+    drain_time = None
+    if in_process:
+        drain_started = time.perf_counter()
+        await client_bot.update_queue.stop(timeout=600)
+        drain_time = time.perf_counter() - drain_started
+        stats = client_bot.update_queue.stats() | {"depth_at_end_of_send": stats["depth"]}
+
+    await client.aclose()
+
+    print("\n" + "=" * 60)
+    print("📊 WEBHOOK REPLAY RESULTS")
+    print("=" * 60)
+    print(f"   Sent:        {args.count} in {sent_in:.2f}s ({args.count / sent_in:.0f}/s)")
+    print(f"   Statuses:    {dict(statuses)}")
+    print(f"   Latency ms:  p50={percentile(latencies, 50):.3f} p95={percentile(latencies, 95):.3f} "
+          f"p99={percentile(latencies, 99):.3f} max={max(latencies):.3f} mean={statistics.mean(latencies):.3f}")
+    if drain_time is not None:
+        print(f"   Drain time:  {drain_time:.2f}s")
+    print(f"   Queue stats: {json.dumps(stats, ensure_ascii=False)}")
+
+    if in_process:
+        violations = sum(
+            1 for ids in seen.values()
+            for a, b in zip(ids, ids[1:]) if b < a
+        )
+        print(f"   Ordering:    {'✅ per-chat order preserved' if not violations else f'❌ {violations} violations'}")
+        return 1 if violations else 0
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", default=DEFAULT_UPDATES, help="JSONL file with recorded updates")
+    parser.add_argument("--url", default="", help="Base URL of a running backend (default: in-process)")
+    parser.add_argument("--rate", type=float, default=500, help="Updates per second (0 = as fast as possible)")
+    parser.add_argument("--count", type=int, default=5000)
+    parser.add_argument("--chats", type=int, default=200, help="Number of distinct synthetic chats")
+    parser.add_argument("--handler-latency", type=float, default=0.0, help="Simulated seconds per update (in-process)")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
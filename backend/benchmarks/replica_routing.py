@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Read-replica routing check on SQLite file copies (app/models/replicas.py).
+
+Seeds a temporary primary, copies it to two "replicas" with the SQLite backup
+API and points DATABASE_READ_URL at the copies. Statements are counted per
+engine (primary read-write, primary read-only, each replica) while the app runs
+in-process, and each step checks where the reads went:
+  - fresh copies: reads alternate between the replicas
+  - a user who writes is pinned to the primary and sees the write; others stay
+    on the replicas
+  - incremental sync (GET /api/orders?since=...) reads the orders from the
+    primary, since its X-Sync-Token must not skip what a replica lacks
+  - the primary is written after the copies and --max-lag passes: lag goes over
+    the limit and every read falls back to the primary
+  - re-copied: the replicas are back in rotation
+  - a replica file disappears: it drops out, the other one keeps serving
+  - replica sessions refuse writes
+Exits 1 if any check fails.
+
+Usage (from backend/):
+    python -m benchmarks.replica_routing --max-lag 0.5
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+
+
+def copy_database(source: str, target: str):
+    """Consistent snapshot of a SQLite database (the "replication" here)"""
+    src, dst = sqlite3.connect(source), sqlite3.connect(target)
+    with dst:
+        src.backup(dst)
+    src.close()
+    dst.close()
+
+
+async def run(args):
+    primary_path = tempfile.mktemp(suffix=".db")
+    replica_paths = [tempfile.mktemp(suffix=f"-replica{i}.db") for i in (1, 2)]
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{primary_path}"
+    os.environ["DATABASE_READ_URL"] = ",".join(f"sqlite+aiosqlite:///{path}" for path in replica_paths)
+    os.environ["DB_REPLICA_MAX_LAG_SECONDS"] = str(args.max_lag)
+    os.environ["DB_READ_YOUR_WRITES_SECONDS"] = "60"
+    os.environ["METRICS_ENABLED"] = "false"
+    os.environ["LOG_LEVEL"] = "WARNING"
+    os.environ["TELEGRAM_BOT_TOKEN"] = "bench-replicas"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    import httpx
+    from sqlalchemy import event, update
+    from app.main import app
+    from app.models import Base, engine, read_engine, async_session, replicas, User, Balance, ResidentialComplex
+    from app.services.auth import create_access_token
+
+    counts = Counter()
+    labels = {engine: "primary", read_engine: "primary-ro"}
+    labels.update({replica.engine: replica.name for replica in replicas.replicas})
+    for db_engine, label in labels.items():
+        event.listen(db_engine.sync_engine, "before_cursor_execute",
+                     lambda *_, label=label: counts.update([label]))
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_session() as db:
+        complex_ = ResidentialComplex(name="ЖК Реплика", short_name="R")
+        db.add(complex_)
+        users = [User(telegram_id=900_000_100 + i, name=f"Reader {i}", phone=f"+7900000010{i}") for i in range(2)]
+        db.add_all(users)
+        await db.flush()
+        db.add_all([Balance(user_id=user.id, credits=0, single_credits=0) for user in users])
+        await db.commit()
+        writer, reader = ({"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"} for user in users)
+        writer_id, complex_id = users[0].id, complex_.id
+
+    def refresh_copies():
+        for path in replica_paths:
+            copy_database(primary_path, path)
+
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+    results = []
+
+    def check(name: str, ok: bool, detail: str = ""):
+        results.append((name, ok, detail))
+
+    async def served_by(method: str, url: str, headers: dict, **kwargs):
+        before = counts.copy()
+        response = await client.request(method, url, headers=headers, **kwargs)
+        used = {label: n for label, n in (counts - before).items()}
+        return response, used
+
+    refresh_copies()
+    await replicas.check_lag()
+    check("fresh copies in rotation", all(r.usable for r in replicas.replicas),
+          ", ".join(f"{r.name} lag {r.lag}" for r in replicas.replicas))
+
+    seen = set()
+    for _ in range(4):
+        _, used = await served_by("GET", "/api/users/me", reader)
+        seen.update(used)
+    check("reads alternate between replicas", seen == {r.name for r in replicas.replicas}, f"served by {sorted(seen)}")
+
+    response, used = await served_by("POST", "/api/users/addresses", writer, json={
+        "street": "Лесная", "complex_id": complex_id, "building": "1", "apartment": "12",
+    })
+    check("write goes to the primary", response.status_code == 200 and set(used) == {"primary"}, f"{used}")
+    check("writer pinned to the primary", replicas.is_pinned(writer_id))
+
+    response, used = await served_by("GET", "/api/users/addresses", writer)
+    check("writer reads own write from the primary",
+          len(response.json()) == 1 and set(used) == {"primary-ro"}, f"{len(response.json())} address(es), {used}")
+    response, used = await served_by("GET", "/api/users/addresses", reader)
+    check("other users stay on replicas", set(used) <= {r.name for r in replicas.replicas} and used != {}, f"{used}")
+    response, used = await served_by("GET", "/api/orders/", reader, params={"since": "2000-01-01T00:00:00"})
+    check("sync reads (since) come from the primary",
+          response.status_code == 200 and "X-Sync-Token" in response.headers and used.get("primary-ro") == 1,
+          f"{used}")
+
+    await asyncio.sleep(args.max_lag + 0.2)
+    await replicas.check_lag()
+    check("lag over the limit detected", not any(r.usable for r in replicas.replicas),
+          ", ".join(f"{r.name} lag {r.lag:.2f}s" for r in replicas.replicas))
+    _, used = await served_by("GET", "/api/admin/stats", {})
+    check("lagging replicas: reads fall back to the primary", set(used) == {"primary-ro"}, f"{used}")
+
+    refresh_copies()
+    await replicas.check_lag()
+    _, used = await served_by("GET", "/api/admin/stats", {})
+    check("caught up: replicas back in rotation", set(used) <= {r.name for r in replicas.replicas} and used != {},
+          f"{used}")
+
+    os.unlink(replica_paths[0])
+    await replicas.check_lag()
+    seen = set()
+    for _ in range(4):
+        _, used = await served_by("GET", "/api/users/me", reader)
+        seen.update(used)
+    check("missing replica drops out", seen == {replicas.replicas[1].name}, f"served by {sorted(seen)}")
+
+    try:
+        async with replicas.replicas[1].session() as db:
+            await db.execute(update(User).values(name="x"))
+        check("replica sessions refuse writes", False, "UPDATE went through")
+    except Exception as e:
+        check("replica sessions refuse writes", True, type(e).__name__)
+
+    started = time.perf_counter()
+    for _ in range(10_000):
+        replicas.pick()
+    pick_us = (time.perf_counter() - started) / 10_000 * 1e6
+
+    await client.aclose()
+    for db_engine in labels:
+        await db_engine.dispose()
+    for path in [primary_path, *replica_paths]:
+        if os.path.exists(path):
+            os.unlink(path)
+
+    print("\n" + "=" * 96)
+    print(f"📊 REPLICA ROUTING (SQLite copies, max lag {args.max_lag}s, pick() {pick_us:.2f} µs)")
+    print("=" * 96)
+    for name, ok, detail in results:
+        print(f"   {'✅' if ok else '❌'} {name:<50}{detail}")
+    failed = sum(1 for _, ok, _ in results if not ok)
+    print(f"\n   {len(results) - failed}/{len(results)} checks passed")
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-lag", type=float, default=0.5, help="DB_REPLICA_MAX_LAG_SECONDS for the run")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Availability grid generation for many complexes.
+
+Seeds a temporary SQLite DB with --complexes complexes, one address each and
+about --orders-per-slot orders in every slot of the next --days days, with
+slot_bookings filled to match. Then builds every complex's grid twice:
+- counters: slot_capacity.availability(), one primary-key range scan of slot_bookings
+- orders:   the same grid from COUNT(*) over orders joined to addresses
+and reports per-grid latency for both. The grids must be identical.
+
+Usage (from backend/):
+    python -m benchmarks.slot_availability --complexes 200 --days 14
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from benchmarks.replay_client_bot_updates import percentile
+
+
+async def run(args):
+    db_path = tempfile.mktemp(suffix=".db")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from sqlalchemy import select, func, insert
+    from app.models import (
+        Base, engine, async_session, User, Address, ResidentialComplex, Order, OrderStatus, SlotBooking,
+    )
+    from app.services import slot_capacity
+
+    random.seed(1)
+    today = date.today()
+    now = datetime.utcnow()
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(User), [{"id": 1, "telegram_id": 900_000_001, "name": "Bench Client"}])
+        await conn.execute(insert(ResidentialComplex), [
+            {"id": i, "name": f"ЖК {i}", "short_name": f"C{i}", "is_active": True}
+            for i in range(1, args.complexes + 1)
+        ])
+        await conn.execute(insert(Address), [
+            {"id": i, "user_id": 1, "complex_id": i, "building": "1", "apartment": "1"}
+            for i in range(1, args.complexes + 1)
+        ])
+        orders, bookings = [], []
+        for complex_id in range(1, args.complexes + 1):
+            for offset in range(args.days):
+                day = today + timedelta(days=offset)
+                for slot in slot_capacity.SLOTS:
+                    count = random.randint(0, args.orders_per_slot * 2)
+                    orders += [
+                        {"user_id": 1, "address_id": complex_id, "date": day, "time_slot": slot,
+                         "status": OrderStatus.SCHEDULED, "created_at": now, "updated_at": now}
+                    ] * count
+                    if count:
+                        bookings.append({"complex_id": complex_id, "date": day, "time_slot": slot, "booked": count})
+        await conn.execute(insert(Order), orders)
+        await conn.execute(insert(SlotBooking), bookings)
+
+    async def grid_from_orders(db, complex_id):
+        limit = await slot_capacity.capacity(db, complex_id)
+        result = await db.execute(
+            select(Order.date, Order.time_slot, func.count(Order.id))
+            .join(Address, Address.id == Order.address_id)
+            .where(
+                Address.complex_id == complex_id,
+                Order.date.between(today, today + timedelta(days=args.days - 1)),
+                Order.status != OrderStatus.CANCELLED,
+            )
+            .group_by(Order.date, Order.time_slot)
+        )
+        booked = {(d, s): n for d, s, n in result.all()}
+        return {
+            "complex_id": complex_id,
+            "capacity": limit,
+            "days": [
+                {"date": (today + timedelta(days=o)).isoformat(), "slots": [
+                    {"time_slot": s.value, "booked": booked.get((today + timedelta(days=o), s), 0),
+                     "available": max(limit - booked.get((today + timedelta(days=o), s), 0), 0)}
+                    for s in slot_capacity.SLOTS
+                ]}
+                for o in range(args.days)
+            ],
+        }
+
+    timings = {"counters": [], "orders": []}
+    grids = {"counters": {}, "orders": {}}
+    async with async_session() as db:
+        await slot_capacity.capacity(db, 1)  # Warm the complex catalog
+        for _ in range(args.repeat):
+            for complex_id in range(1, args.complexes + 1):
+                started = time.perf_counter()
+                grids["counters"][complex_id] = await slot_capacity.availability(db, complex_id, today, args.days)
+                timings["counters"].append((time.perf_counter() - started) * 1000)
+
+                started = time.perf_counter()
+                grids["orders"][complex_id] = await grid_from_orders(db, complex_id)
+                timings["orders"].append((time.perf_counter() - started) * 1000)
+    await engine.dispose()
+    os.unlink(db_path)
+
+    print("\n" + "=" * 70)
+    print(f"📊 SLOT AVAILABILITY ({args.complexes} complexes, {args.days} days, "
+          f"{len(orders)} orders, {len(bookings)} booked slots)")
+    print("=" * 70)
+    print(f"   {'source':<10}{'p50 ms':>10}{'p99 ms':>10}{'all complexes ms':>20}")
+    for source, values in timings.items():
+        total = sum(values) / args.repeat
+        print(f"   {source:<10}{percentile(values, 50):>10.2f}{percentile(values, 99):>10.2f}{total:>20.0f}")
+    same = grids["counters"] == grids["orders"]
+    print("   ✅ Grids match" if same else "   ❌ Grids differ")
+    return 0 if same else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--complexes", type=int, default=200)
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--orders-per-slot", type=int, default=10, help="Average orders per slot")
+    parser.add_argument("--repeat", type=int, default=3, help="Grids per complex")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
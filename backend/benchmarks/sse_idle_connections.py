@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Idle GET /api/orders/events streams per worker: memory, and fan-out latency.
+
+Starts one uvicorn worker in a subprocess on a temporary SQLite DB (Telegram
+tokens empty, so notifications are skipped), opens --connections SSE streams
+for one client, holds them idle for --hold seconds (heartbeats keep flowing),
+then has a courier take the client's order and measures how long each stream
+takes to receive the order.taken event. Reports the worker's RSS before and
+after connecting, and how many streams survived.
+
+Usage (from backend/):
+    python -m benchmarks.sse_idle_connections --connections 5000 --hold 20
+"""
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+
+from benchmarks.replay_client_bot_updates import percentile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+class Stream:
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+        self.pings = 0
+        self.event_at = None
+        self.closed = False
+
+    async def open(self, port: int, token: str):
+        self.reader, self.writer = await asyncio.open_connection("127.0.0.1", port)
+        self.writer.write(
+            f"GET /api/orders/events?token={token} HTTP/1.1\r\nHost: bench\r\nAccept: text/event-stream\r\n\r\n".encode()
+        )
+        await self.writer.drain()
+        buffer = b""
+        while b"retry:" not in buffer:
+            chunk = await self.reader.read(4096)
+            if not chunk:
+                raise ConnectionError(buffer[:200])
+            buffer += chunk
+
+    async def listen(self):
+        tail = b""
+        while True:
+            chunk = await self.reader.read(4096)
+            if not chunk:
+                self.closed = True
+                return
+            data = tail + chunk
+            self.pings += chunk.count(b": ping")
+            if self.event_at is None and b"event: order.taken" in data:
+                self.event_at = time.perf_counter()
+            tail = data[-64:]
+
+
+async def run(args):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    if hard < args.connections * 2 + 100:
+        print(f"   ⚠️ RLIMIT_NOFILE is {hard}; client and server each need ~{args.connections} descriptors")
+
+    db_path = tempfile.mktemp(suffix=".db")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    os.environ["TELEGRAM_BOT_TOKEN"] = ""
+    os.environ["TELEGRAM_COURIER_BOT_TOKEN"] = ""
+    os.environ["EVENTS_HEARTBEAT_SECONDS"] = str(args.heartbeat)
+    sys.path.insert(0, BACKEND_DIR)
+
+    import httpx
+    from app.models import (
+        Base, engine, async_session, User, UserRole, Balance, Address, ResidentialComplex, Order, TimeSlot,
+    )
+    from app.services.auth import create_access_token
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_session() as db:
+        complex_obj = ResidentialComplex(name="ЖК Бенчмарк", short_name="B")
+        db.add(complex_obj)
+        user = User(telegram_id=900_000_001, name="Bench Client", phone="+79000000001")
+        courier = User(telegram_id=910_000_001, name="Bench Courier", role=UserRole.COURIER)
+        db.add_all([user, courier])
+        await db.flush()
+        db.add(Balance(user_id=user.id, credits=0, single_credits=0))
+        address = Address(user_id=user.id, complex_id=complex_obj.id, building="1", apartment="1")
+        db.add(address)
+        await db.flush()
+        order = Order(user_id=user.id, address_id=address.id, date=date.today(), time_slot=TimeSlot.NIGHT)
+        db.add(order)
+        await db.commit()
+        order_id, token = order.id, create_access_token({"sub": str(user.id)})
+    await engine.dispose()
+
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port),
+         "--log-level", "warning", "--no-access-log", "--backlog", "4096",
+         "--timeout-graceful-shutdown", "2"],
+        cwd=BACKEND_DIR, env=os.environ.copy(),
+        stdout=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    streams = []
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+            for _ in range(100):
+                try:
+                    if (await client.get("/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.1)
+            else:
+                print("   ❌ Server did not start")
+                return 1
+
+            rss_before = rss_mb(server.pid)
+            semaphore = asyncio.Semaphore(200)
+
+            async def open_stream():
+                stream = Stream()
+                async with semaphore:
+                    await stream.open(args.port, token)
+                return stream
+
+            started = time.perf_counter()
+            results = await asyncio.gather(*(open_stream() for _ in range(args.connections)), return_exceptions=True)
+            open_seconds = time.perf_counter() - started
+            streams = [s for s in results if isinstance(s, Stream)]
+            failed = [r for r in results if not isinstance(r, Stream)]
+            if failed:
+                print(f"   ⚠️ {len(failed)} streams failed to open, first error: {failed[0]!r}")
+
+            listeners = [asyncio.create_task(s.listen()) for s in streams]
+            await asyncio.sleep(args.hold)
+            rss_after = rss_mb(server.pid)
+            stats = (await client.get("/api/admin/notifications/stats")).json().get("events", {})
+
+            sent_at = time.perf_counter()
+            resp = await client.post(f"/api/courier/orders/{order_id}/take",
+                                     json={"courier_telegram_id": 910_000_001})
+            take_ms = (time.perf_counter() - sent_at) * 1000
+            if resp.status_code != 200:
+                print(f"   ❌ take: {resp.status_code} {resp.text[:200]}")
+                return 1
+
+            deadline = time.perf_counter() + 30
+            while time.perf_counter() < deadline and any(s.event_at is None and not s.closed for s in streams):
+                await asyncio.sleep(0.01)
+            for task in listeners:
+                task.cancel()
+    finally:
+        for stream in streams:
+            if stream.writer:
+                stream.writer.close()
+        await asyncio.sleep(1)  # Let the worker see the disconnects before shutting down
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        os.unlink(db_path)
+
+    delivered = [(s.event_at - sent_at) * 1000 for s in streams if s.event_at is not None]
+    alive = sum(1 for s in streams if not s.closed)
+    per_connection_kb = (rss_after - rss_before) * 1024 / max(len(streams), 1)
+
+    print("\n" + "=" * 70)
+    print(f"📊 SSE IDLE CONNECTIONS ({args.connections} streams, 1 worker, held {args.hold}s)")
+    print("=" * 70)
+    print(f"   Opened:            {len(streams)} in {open_seconds:.1f}s, {alive} alive after hold")
+    print(f"   Server subscribers:{stats.get('subscribers', '?'):>8}")
+    print(f"   Heartbeats/stream: {sum(s.pings for s in streams) / max(len(streams), 1):.1f}")
+    print(f"   Worker RSS:        {rss_before:.0f} MB -> {rss_after:.0f} MB ({per_connection_kb:.1f} KB per stream)")
+    print(f"   Take request:      {take_ms:.1f} ms")
+    if delivered:
+        print(f"   order.taken fan-out: {len(delivered)}/{len(streams)} delivered, "
+              f"p50 {percentile(delivered, 50):.0f} ms, p99 {percentile(delivered, 99):.0f} ms, "
+              f"max {max(delivered):.0f} ms")
+    else:
+        print("   ❌ order.taken was not delivered")
+    return 0 if len(delivered) == len(streams) else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", type=int, default=5000, help="Concurrent SSE streams")
+    parser.add_argument("--hold", type=float, default=20, help="Seconds to hold streams idle before the event")
+    parser.add_argument("--heartbeat", type=int, default=5, help="EVENTS_HEARTBEAT_SECONDS for the server")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
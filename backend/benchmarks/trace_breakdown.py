@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Where does a courier tap spend its time? Summarizes TRACING_EXPORTER=file output.
+
+Reads one or more span files (the courier bot's and the backend's, or one
+shared TRACING_FILE), groups spans by trace, and for every trace rooted in a
+"tap ..." span (or, without the bot, an HTTP server span) splits the root's
+duration into:
+  bot      - the root span minus the backend requests it made
+  backend  - HTTP server spans minus SQL and Telegram time inside them
+  sql      - "db ..." spans
+  telegram - "telegram ..." spans on the request path
+Notification jobs run after the response and are reported separately (jobs).
+Prints count, p50/p95 of the root duration and mean ms per component, per
+root span name.
+
+Usage (from backend/):
+    python -m benchmarks.trace_breakdown traces.jsonl ../courier-bot/traces.jsonl
+"""
+import argparse
+import json
+import sys
+from collections import defaultdict
+from datetime import datetime
+
+from benchmarks.replay_client_bot_updates import percentile
+
+COMPONENTS = ("bot", "backend", "sql", "telegram", "jobs")
+
+
+def _ms(span: dict) -> float:
+    start = datetime.fromisoformat(span["start_time"].replace("Z", "+00:00"))
+    end = datetime.fromisoformat(span["end_time"].replace("Z", "+00:00"))
+    return (end - start).total_seconds() * 1000
+
+
+def load(paths: list) -> dict:
+    traces = defaultdict(dict)
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    span = json.loads(line)
+                    traces[span["context"]["trace_id"]][span["context"]["span_id"]] = span
+    return traces
+
+
+def breakdown(spans: dict):
+    """(root name, root ms, {component: ms}) or None for traces without a tap or request root"""
+    roots = [s for s in spans.values() if not s.get("parent_id") or s["parent_id"] not in spans]
+    root = next((s for s in roots if s["name"].startswith("tap ")), None) \
+        or next((s for s in roots if s["kind"].endswith("SERVER")), None)
+    if root is None:
+        return None
+
+    def ancestors(span):
+        while span.get("parent_id") in spans:
+            span = spans[span["parent_id"]]
+            yield span
+
+    parts = dict.fromkeys(COMPONENTS, 0.0)
+    for span in spans.values():
+        in_job = any(a["name"].startswith("job ") for a in ancestors(span))
+        if span["name"].startswith("job "):
+            parts["jobs"] += _ms(span)
+        elif in_job:
+            continue
+        elif span["name"].startswith("db "):
+            parts["sql"] += _ms(span)
+        elif span["name"].startswith("telegram "):
+            parts["telegram"] += _ms(span)
+        elif span["kind"].endswith("SERVER"):
+            parts["backend"] += _ms(span)
+    parts["backend"] = max(parts["backend"] - parts["sql"] - parts["telegram"], 0.0)
+    total = _ms(root)
+    if root["name"].startswith("tap "):
+        parts["bot"] = max(total - parts["backend"] - parts["sql"] - parts["telegram"], 0.0)
+    return root["name"], total, parts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="+", help="Span files written with TRACING_EXPORTER=file")
+    args = parser.parse_args()
+
+    groups = defaultdict(list)
+    for spans in load(args.files).values():
+        result = breakdown(spans)
+        if result:
+            name, total, parts = result
+            groups[name].append((total, parts))
+    if not groups:
+        print("No traces with a tap or HTTP request root found")
+        return 1
+
+    print("\n" + "=" * 104)
+    print(f"📊 TRACE BREAKDOWN ({sum(len(v) for v in groups.values())} traces, mean ms per component)")
+    print("=" * 104)
+    print(f"   {'root span':<40}{'count':>6}{'p50':>8}{'p95':>8}" + "".join(f"{c:>9}" for c in COMPONENTS))
+    for name, rows in sorted(groups.items(), key=lambda item: -len(item[1])):
+        totals = [total for total, _ in rows]
+        means = [sum(parts[c] for _, parts in rows) / len(rows) for c in COMPONENTS]
+        print(f"   {name[:39]:<40}{len(rows):>6}{percentile(totals, 50):>8.1f}{percentile(totals, 95):>8.1f}"
+              + "".join(f"{m:>9.1f}" for m in means))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
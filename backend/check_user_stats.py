@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Consistency check for denormalized user counters.
+
+Recomputes users.orders_count / users.active_subscriptions_count in bulk
+and reports drift. Pass --fix to write the recomputed values back.
+
+Usage:
+    python check_user_stats.py          # report only
+    python check_user_stats.py --fix    # report and repair
+"""
+import asyncio
+import sys
+
+from app.models import async_session, replicas
+from app.services.user_stats import check_user_stats
+
+
+async def main(fix: bool):
+    # A report can run on a replica; --fix recomputes on the primary it writes to
+    if not fix:
+        await replicas.check_lag()
+    async with (async_session() if fix else replicas.analytics_session()) as db:
+        drift = await check_user_stats(db, fix=fix)
+        if fix:
+            await db.commit()
+
+    print("\n" + "=" * 60)
+    print(f"🔍 USER COUNTERS CHECK ({'FIX' if fix else 'REPORT'})")
+    print("=" * 60)
+
+    if not drift:
+        print("✅ All counters are consistent")
+        return 0
+
+    for d in drift:
+        print(
+            f"   User #{d['user_id']}: "
+            f"orders {d['orders_count']} → {d['actual_orders']}, "
+            f"active subs {d['active_subscriptions_count']} → {d['actual_subscriptions']}"
+        )
+
+    print(f"\n⚠️  Drifted users: {len(drift)}" + (" (fixed)" if fix else ""))
+    return 0 if fix else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main("--fix" in sys.argv)))
@@ -0,0 +1,40 @@
+-- Balance ledger: typed transactions + per-balance snapshots
+-- After this migration all balance changes go through app/services/ledger.py
+
+ALTER TABLE balance_transactions ADD COLUMN IF NOT EXISTS credit_type VARCHAR(20) NOT NULL DEFAULT 'credits';
+
+CREATE INDEX IF NOT EXISTS ix_balance_transactions_balance_id_id ON balance_transactions (balance_id, id);
+
+CREATE TABLE IF NOT EXISTS balance_snapshots (
+    id SERIAL PRIMARY KEY,
+    balance_id INTEGER NOT NULL UNIQUE REFERENCES balances(id),
+    credits INTEGER NOT NULL DEFAULT 0,
+    single_credits INTEGER NOT NULL DEFAULT 0,
+    last_transaction_id INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Opening snapshot: the historical ledger was incomplete, so current balances
+-- become the starting point and only new transactions are replayed on top
+INSERT INTO balance_snapshots (balance_id, credits, single_credits, last_transaction_id)
+SELECT
+    b.id,
+    COALESCE(b.credits, 0),
+    COALESCE(b.single_credits, 0),
+    COALESCE((SELECT MAX(id) FROM balance_transactions), 0)
+FROM balances b
+WHERE NOT EXISTS (SELECT 1 FROM balance_snapshots s WHERE s.balance_id = b.id);
+
+-- Entry kind: what code looks entries up by (undoing a completion refunds
+-- only a charge that still stands), descriptions are just for people.
+-- Backfill from the texts order_state.py wrote before the column existed
+ALTER TABLE balance_transactions ADD COLUMN IF NOT EXISTS kind VARCHAR(30);
+
+CREATE INDEX IF NOT EXISTS ix_balance_transactions_order_id ON balance_transactions (order_id);
+
+UPDATE balance_transactions SET kind = 'completion'
+WHERE kind IS NULL AND order_id IS NOT NULL AND description = 'Выполнен заказ #' || order_id;
+
+UPDATE balance_transactions SET kind = 'completion_undo'
+WHERE kind IS NULL AND order_id IS NOT NULL AND description = 'Отмена выполнения заказа #' || order_id;
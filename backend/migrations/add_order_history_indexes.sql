@@ -0,0 +1,8 @@
+-- Keyset pagination and incremental sync for GET /api/orders
+-- (user_id, date, id) for history pages, (user_id, updated_at, id) for ?since=
+
+CREATE INDEX IF NOT EXISTS ix_orders_user_date_id ON orders (user_id, date, id);
+CREATE INDEX IF NOT EXISTS ix_orders_user_updated_id ON orders (user_id, updated_at, id);
+
+-- Rows created before updated_at was maintained
+UPDATE orders SET updated_at = COALESCE(created_at, NOW()) WHERE updated_at IS NULL;
@@ -0,0 +1,23 @@
+-- Pickup capacity per (complex, date, time slot)
+-- booked is maintained by app/services/slot_capacity.py; complex_id 0 = addresses outside a complex
+
+CREATE TABLE IF NOT EXISTS slot_bookings (
+    complex_id INTEGER NOT NULL,
+    date DATE NOT NULL,
+    time_slot timeslot NOT NULL,
+    booked INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (complex_id, date, time_slot)
+);
+
+ALTER TABLE residential_complexes ADD COLUMN IF NOT EXISTS slot_capacity INTEGER;
+
+-- Backfill from upcoming orders (re-running recounts)
+INSERT INTO slot_bookings (complex_id, date, time_slot, booked)
+SELECT COALESCE(a.complex_id, 0), o.date, o.time_slot, COUNT(*)
+FROM orders o
+JOIN addresses a ON a.id = o.address_id
+WHERE o.date >= CURRENT_DATE AND o.status <> 'CANCELLED'
+GROUP BY COALESCE(a.complex_id, 0), o.date, o.time_slot
+ON CONFLICT (complex_id, date, time_slot) DO UPDATE SET booked = EXCLUDED.booked;
@@ -0,0 +1,10 @@
+-- Cache of Telegram file_ids for bot images (onboarding slides, menu photo)
+
+CREATE TABLE IF NOT EXISTS telegram_media (
+    id SERIAL PRIMARY KEY,
+    key VARCHAR(50) NOT NULL UNIQUE,
+    source_url VARCHAR(500) NOT NULL,
+    file_id VARCHAR(200) NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW()
+);
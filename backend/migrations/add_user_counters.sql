@@ -0,0 +1,15 @@
+-- Denormalized per-user counters (orders / active subscriptions)
+-- Keeps auth, profile and admin client list reads to a single primary-key lookup
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS orders_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS active_subscriptions_count INTEGER NOT NULL DEFAULT 0;
+
+-- Backfill from existing data
+UPDATE users SET orders_count = (
+    SELECT COUNT(*) FROM orders WHERE orders.user_id = users.id
+);
+
+UPDATE users SET active_subscriptions_count = (
+    SELECT COUNT(*) FROM subscriptions
+    WHERE subscriptions.user_id = users.id AND subscriptions.is_active = true
+);
@@ -67,14 +67,23 @@ async def reset_all_balances():
         else:
             print("   (Все балансы уже обнулены)")
         
-        # 2. Обнуляем все балансы
+        # 2. Обнуляем все балансы (через леджер: списание = текущий остаток)
         print(f"\n🗑️  Обнуляю все балансы...")
         
-        result = await conn.execute("""
-            UPDATE balances 
-            SET credits = 0, single_credits = 0
-            WHERE credits > 0 OR single_credits > 0
-        """)
+        async with conn.transaction():
+            for credit_type in ("credits", "single_credits"):
+                await conn.execute(f"""
+                    INSERT INTO balance_transactions (balance_id, amount, credit_type, description, created_at, updated_at)
+                    SELECT id, -{credit_type}, '{credit_type}', 'Обнуление баланса (reset_all_balances_prod)', NOW(), NOW()
+                    FROM balances
+                    WHERE {credit_type} != 0
+                """)
+            
+            result = await conn.execute("""
+                UPDATE balances 
+                SET credits = 0, single_credits = 0
+                WHERE credits != 0 OR single_credits != 0
+            """)
         
         print(f"   ✅ Обнулено записей: {result.split()[-1]}")
         
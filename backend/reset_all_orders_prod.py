@@ -60,9 +60,19 @@ async def reset_all_orders():
         await conn.execute("DELETE FROM balance_transactions")
         print("   ✅ Все транзакции удалены")
         
+        # Леджер очищен - текущие балансы становятся новой точкой отсчёта
+        await conn.execute("DELETE FROM balance_snapshots")
+        await conn.execute("""
+            INSERT INTO balance_snapshots (balance_id, credits, single_credits, last_transaction_id)
+            SELECT id, COALESCE(credits, 0), COALESCE(single_credits, 0), 0 FROM balances
+        """)
+        print("   ✅ Снимки балансов пересозданы")
+        
         # 3. Удаление всех заказов
         print(f"\n🗑️  Удаляю все {orders_count} заказов...")
         await conn.execute("DELETE FROM orders")
+        await conn.execute("DELETE FROM slot_bookings")  # Занятость слотов считалась по этим заказам
+        await conn.execute("UPDATE users SET orders_count = 0")
         print("   ✅ Все заказы удалены")
         
         # 4. Сброс used_credits в подписках
@@ -101,6 +111,11 @@ async def reset_all_orders():
                     "UPDATE balances SET credits = $1 WHERE user_id = $2",
                     new_credits, user['user_id']
                 )
+                await conn.execute("""
+                    INSERT INTO balance_transactions (balance_id, amount, credit_type, description, created_at, updated_at)
+                    SELECT id, $1, 'credits', 'Восстановление баланса по подпискам', NOW(), NOW()
+                    FROM balances WHERE user_id = $2
+                """, new_credits - old_credits, user['user_id'])
                 print(f"   👤 {user['name']}: баланс {old_credits} → {new_credits}")
         
         print("\n" + "=" * 60)
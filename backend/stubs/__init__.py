@@ -0,0 +1,11 @@
+"""
+Local stand-ins for the external services, for load tests and offline development
+
+- stubs.telegram: Bot API (sendMessage, sendPhoto, getChat, answerCallbackQuery, ...)
+- stubs.yookassa: payment create/get, plus the payment.succeeded webhook back to the backend
+
+Both inject latency, 429 rate limiting and errors (stubs.faults) and are run
+from backend/ as `python -m stubs.telegram` / `python -m stubs.yookassa`, or
+in-process via their create_app(). Point the backend at them with
+TELEGRAM_API_URL and YOOKASSA_API_URL.
+"""
@@ -0,0 +1,101 @@
+"""
+Fault injection shared by the stub servers: latency, per-key rate limit, random errors
+
+Each stub also exposes its counters and live settings:
+    GET  /_stub/stats    calls per (method, status)
+    POST /_stub/reset    clear the counters
+    POST /_stub/faults   change settings, e.g. {"latency": 0.2, "error_rate": 0.05}
+"""
+import asyncio
+import random
+import time
+from collections import Counter, defaultdict, deque
+
+from fastapi import FastAPI
+
+
+class Faults:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, rate_limit: int = 0,
+                 error_rate: float = 0.0, error_status: int = 500, seed: int = None):
+        self.latency = latency          # Seconds before every answer
+        self.jitter = jitter            # +- random seconds on top of latency
+        self.rate_limit = rate_limit    # Calls per second per key before 429 (0 = off)
+        self.error_rate = error_rate    # Share of calls answered with error_status
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self._windows = defaultdict(deque)
+        self.calls = Counter()
+
+    def update(self, **changes):
+        for name, value in changes.items():
+            if name in ("latency", "jitter", "rate_limit", "error_rate", "error_status"):
+                setattr(self, name, type(getattr(self, name))(value))
+
+    def settings(self) -> dict:
+        return {
+            "latency": self.latency, "jitter": self.jitter, "rate_limit": self.rate_limit,
+            "error_rate": self.error_rate, "error_status": self.error_status,
+        }
+
+    async def delay(self):
+        seconds = self.latency + (self._random.uniform(-self.jitter, self.jitter) if self.jitter else 0)
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+    def limited(self, key: str) -> bool:
+        """True if `key` already made rate_limit calls in the last second"""
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        window = self._windows[key]
+        while window and now - window[0] > 1:
+            window.popleft()
+        if len(window) >= self.rate_limit:
+            return True
+        window.append(now)
+        return False
+
+    def failing(self) -> bool:
+        return self.error_rate > 0 and self._random.random() < self.error_rate
+
+    def record(self, method: str, status: int):
+        self.calls[(method, status)] += 1
+
+    def stats(self) -> dict:
+        by_method = defaultdict(dict)
+        for (method, status), count in sorted(self.calls.items()):
+            by_method[method][str(status)] = count
+        return {"calls": dict(by_method), "total": sum(self.calls.values()), "faults": self.settings()}
+
+
+def add_control_routes(app: FastAPI, faults: Faults, reset=None):
+    @app.get("/_stub/stats")
+    async def stub_stats():
+        return faults.stats()
+
+    @app.post("/_stub/reset")
+    async def stub_reset():
+        faults.calls.clear()
+        if reset:
+            reset()
+        return {"ok": True}
+
+    @app.post("/_stub/faults")
+    async def stub_faults(changes: dict):
+        faults.update(**changes)
+        return faults.settings()
+
+
+def add_fault_arguments(parser):
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds before every answer")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random +- seconds on top of latency")
+    parser.add_argument("--rate-limit", type=int, default=30, help="Calls per second per bot/shop before 429 (0 = off)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls that fail")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def faults_from_args(args) -> Faults:
+    return Faults(latency=args.latency, jitter=args.jitter, rate_limit=args.rate_limit,
+                  error_rate=args.error_rate, error_status=args.error_status, seed=args.seed)
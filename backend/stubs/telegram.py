@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Telegram Bot API stub
+
+Answers POST/GET /bot<token>/<method> with JSON, form or multipart parameters
+like api.telegram.org: sendMessage, sendPhoto, sendMediaGroup,
+editMessageText, deleteMessage, getChat, getMe, answerCallbackQuery; any
+other method answers {"ok": true, "result": true}. The rate limit is per bot
+token, as Telegram's ~30 msg/s; rate-limited calls get 429 with retry_after.
+Chats listed in --blocked answer 403 like users who blocked the bot.
+
+The last --keep messages per chat are kept for inspection:
+    GET /_stub/messages?chat_id=...
+
+Usage (from backend/):
+    python -m stubs.telegram --port 8081 --latency 0.05 --rate-limit 30
+    TELEGRAM_API_URL=http://127.0.0.1:8081 uvicorn app.main:app
+"""
+import argparse
+import itertools
+import json
+import time
+from collections import defaultdict, deque
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from stubs.faults import Faults, add_control_routes, add_fault_arguments, faults_from_args
+
+MESSAGE_METHODS = {"sendMessage", "sendPhoto", "sendDocument", "editMessageText", "editMessageReplyMarkup"}
+
+
+def _error(status: int, description: str, **extra) -> JSONResponse:
+    return JSONResponse({"ok": False, "error_code": status, "description": description, **extra}, status_code=status)
+
+
+async def _params(request: Request) -> dict:
+    params = dict(request.query_params)
+    content_type = request.headers.get("content-type", "")
+    if "json" in content_type:
+        body = await request.body()
+        if body:
+            params.update(json.loads(body))
+    elif "form" in content_type:
+        form = await request.form()
+        for key, value in form.items():
+            params[key] = value if isinstance(value, str) else f"upload:{value.filename}"
+    return params
+
+
+def create_app(faults: Faults = None, blocked=(), keep: int = 20) -> FastAPI:
+    faults = faults or Faults()
+    app = FastAPI(title="Telegram Bot API stub")
+    message_ids = itertools.count(1)
+    file_ids = itertools.count(1)
+    messages = defaultdict(lambda: deque(maxlen=keep))
+    blocked = {int(chat_id) for chat_id in blocked}
+
+    def chat_id_of(params: dict):
+        try:
+            return int(params.get("chat_id"))
+        except (TypeError, ValueError):
+            return params.get("chat_id")
+
+    def message(params: dict, **fields) -> dict:
+        chat_id = chat_id_of(params)
+        result = {
+            "message_id": int(params.get("message_id") or next(message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            **fields,
+        }
+        if "text" in params:
+            result["text"] = params["text"]
+        if "caption" in params:
+            result["caption"] = params["caption"]
+        messages[chat_id].append(result)
+        return result
+
+    def photo() -> list:
+        file_id = f"stub-photo-{next(file_ids)}"
+        return [
+            {"file_id": f"{file_id}-s", "file_unique_id": f"{file_id}-s", "width": 90, "height": 90, "file_size": 1500},
+            {"file_id": file_id, "file_unique_id": file_id, "width": 1280, "height": 1280, "file_size": 120000},
+        ]
+
+    def result_for(method: str, params: dict):
+        if method == "sendPhoto":
+            return message(params, photo=photo())
+        if method == "sendMediaGroup":
+            media = params.get("media")
+            media = json.loads(media) if isinstance(media, str) else media or []
+            return [message({**params, "caption": item.get("caption", "")}, photo=photo()) for item in media]
+        if method in MESSAGE_METHODS:
+            return message(params)
+        if method == "getChat":
+            chat_id = chat_id_of(params)
+            return {"id": chat_id, "type": "private", "username": f"user{chat_id}", "first_name": f"User {chat_id}"}
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Stub Bot", "username": "stub_bot"}
+        return True
+
+    @app.api_route("/bot{token}/{method}", methods=["GET", "POST"])
+    async def bot_api(token: str, method: str, request: Request):
+        params = await _params(request)
+        await faults.delay()
+        if faults.limited(token):
+            faults.record(method, 429)
+            return _error(429, "Too Many Requests: retry after 1", parameters={"retry_after": 1})
+        if faults.failing():
+            faults.record(method, faults.error_status)
+            return _error(faults.error_status, "Internal Server Error")
+        if chat_id_of(params) in blocked:
+            faults.record(method, 403)
+            return _error(403, "Forbidden: bot was blocked by the user")
+        faults.record(method, 200)
+        return {"ok": True, "result": result_for(method, params)}
+
+    @app.get("/_stub/messages")
+    async def stub_messages(chat_id: int):
+        return list(messages.get(chat_id, ()))
+
+    add_control_routes(app, faults, reset=messages.clear)
+    app.state.faults = faults
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--blocked", default="", help="Comma-separated chat ids that blocked the bot")
+    parser.add_argument("--keep", type=int, default=20, help="Messages kept per chat")
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+    blocked = [c for c in args.blocked.split(",") if c.strip()]
+    app = create_app(faults_from_args(args), blocked=blocked, keep=args.keep)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
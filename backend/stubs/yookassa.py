@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+YooKassa API stub
+
+POST /v3/payments creates a pending payment (repeating an Idempotence-Key
+returns the same payment), GET /v3/payments/<id> reads it. With --webhook-url
+every payment is settled --webhook-delay seconds later - succeeded, or
+canceled for a --decline-rate share - and the payment.<status> notification
+is POSTed to the backend like YooKassa does (retried 3 times).
+Settle one by hand with POST /_stub/payments/<id>/succeeded (or /canceled).
+
+Usage (from backend/):
+    python -m stubs.yookassa --port 8082 --webhook-url http://127.0.0.1:8080/api/payments/webhook
+    YOOKASSA_API_URL=http://127.0.0.1:8082/v3 uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import random
+import uuid
+from datetime import datetime, timezone
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+
+from stubs.faults import Faults, add_control_routes, add_fault_arguments, faults_from_args
+
+WEBHOOK_ATTEMPTS = 3
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+def _error(status: int, code: str, description: str) -> JSONResponse:
+    return JSONResponse(
+        {"type": "error", "id": str(uuid.uuid4()), "code": code, "description": description},
+        status_code=status,
+    )
+
+
+def create_app(faults: Faults = None, webhook_url: str = None, webhook_delay: float = 0.5,
+               decline_rate: float = 0.0, seed: int = None) -> FastAPI:
+    faults = faults or Faults()
+    app = FastAPI(title="YooKassa API stub")
+    payments = {}
+    by_idempotence_key = {}
+    tasks = set()
+    rng = random.Random(seed)
+    client = httpx.AsyncClient(timeout=10)
+
+    async def send_webhook(payment: dict):
+        notification = {"type": "notification", "event": f"payment.{payment['status']}", "object": payment}
+        for attempt in range(WEBHOOK_ATTEMPTS):
+            try:
+                response = await client.post(webhook_url, json=notification)
+                faults.record("webhook", response.status_code)
+                if response.status_code == 200:
+                    return
+            except httpx.HTTPError:
+                faults.record("webhook", 0)
+            await asyncio.sleep(2 ** attempt)
+
+    async def settle(payment: dict, status: str):
+        if payment["status"] != "pending":
+            return
+        payment["status"] = status
+        if status == "succeeded":
+            payment.update(paid=True, captured_at=_now(), income_amount=payment["amount"])
+        else:
+            payment["cancellation_details"] = {"party": "payment_network", "reason": "card_expired"}
+        if webhook_url:
+            await send_webhook(payment)
+
+    async def settle_later(payment: dict):
+        await asyncio.sleep(webhook_delay)
+        await settle(payment, "canceled" if rng.random() < decline_rate else "succeeded")
+
+    @app.post("/v3/payments")
+    async def create_payment(request: Request):
+        await faults.delay()
+        if faults.limited("shop"):
+            faults.record("payments.create", 429)
+            return _error(429, "too_many_requests", "Too many requests")
+        if faults.failing():
+            faults.record("payments.create", faults.error_status)
+            return _error(faults.error_status, "internal_server_error", "Internal server error")
+
+        key = request.headers.get("idempotence-key")
+        if key and key in by_idempotence_key:
+            faults.record("payments.create", 200)
+            return payments[by_idempotence_key[key]]
+
+        body = await request.json()
+        payment_id = str(uuid.uuid4())
+        payment = {
+            "id": payment_id,
+            "status": "pending",
+            "paid": False,
+            "amount": body["amount"],
+            "confirmation": {
+                "type": "redirect",
+                "return_url": body.get("confirmation", {}).get("return_url"),
+                "confirmation_url": f"{request.base_url}checkout/{payment_id}",
+            },
+            "created_at": _now(),
+            "description": body.get("description"),
+            "metadata": body.get("metadata", {}),
+            "recipient": {"account_id": "stub", "gateway_id": "stub"},
+            "refundable": False,
+            "test": True,
+        }
+        payments[payment_id] = payment
+        if key:
+            by_idempotence_key[key] = payment_id
+        if webhook_url and webhook_delay >= 0:
+            task = asyncio.create_task(settle_later(payment))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        faults.record("payments.create", 200)
+        return payment
+
+    @app.get("/v3/payments/{payment_id}")
+    async def get_payment(payment_id: str):
+        await faults.delay()
+        if payment_id not in payments:
+            faults.record("payments.get", 404)
+            return _error(404, "not_found", "Payment not found")
+        faults.record("payments.get", 200)
+        return payments[payment_id]
+
+    @app.post("/_stub/payments/{payment_id}/{status}")
+    async def stub_settle(payment_id: str, status: str):
+        if payment_id not in payments or status not in ("succeeded", "canceled"):
+            raise HTTPException(status_code=404)
+        await settle(payments[payment_id], status)
+        return payments[payment_id]
+
+    @app.on_event("shutdown")
+    async def close():
+        for task in list(tasks):
+            task.cancel()
+        await client.aclose()
+
+    add_control_routes(app, faults)
+    app.state.faults = faults
+    app.state.payments = payments
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--webhook-url", default=None, help="Backend /api/payments/webhook")
+    parser.add_argument("--webhook-delay", type=float, default=0.5, help="Seconds until a payment is settled")
+    parser.add_argument("--decline-rate", type=float, default=0.0, help="Share of payments that get canceled")
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+    app = create_app(faults_from_args(args), webhook_url=args.webhook_url, webhook_delay=args.webhook_delay,
+                     decline_rate=args.decline_rate, seed=args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
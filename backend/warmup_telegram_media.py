@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Pre-register client bot images (onboarding slides, menu photo) at deploy.
+
+Uploads every asset that has no stored file_id to a service chat, deletes the
+messages and saves the file_ids to telegram_media, so the first real /start
+already sends by file_id.
+
+Usage:
+    python warmup_telegram_media.py                  # first ADMIN_IDS chat
+    python warmup_telegram_media.py --chat-id 12345
+    python warmup_telegram_media.py --force          # re-upload everything
+"""
+import argparse
+import asyncio
+import sys
+
+from app.config import settings
+from app.models import Base, engine
+from app.services import telegram_api, telegram_media
+
+
+async def main(chat_id: int, force: bool):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    try:
+        file_ids = await telegram_media.warm_up(chat_id, force=force)
+    finally:
+        await telegram_api.close_client()
+
+    print("\n" + "=" * 60)
+    print(f"🖼  TELEGRAM MEDIA WARM-UP (chat {chat_id})")
+    print("=" * 60)
+    missing = 0
+    for key, file_id in file_ids.items():
+        if file_id:
+            print(f"   ✅ {key}: {file_id[:30]}...")
+        else:
+            missing += 1
+            print(f"   ❌ {key}: not registered ({telegram_media.ASSETS[key]})")
+    return 1 if missing else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Register Telegram file_ids for bot images")
+    parser.add_argument("--chat-id", type=int, help="Chat to upload to (default: first ADMIN_IDS entry)")
+    parser.add_argument("--force", action="store_true", help="Re-upload assets that already have a file_id")
+    args = parser.parse_args()
+
+    chat_id = args.chat_id or (settings.admin_ids[0] if settings.admin_ids else None)
+    if not chat_id:
+        print("❌ No chat: pass --chat-id or set ADMIN_IDS")
+        sys.exit(1)
+
+    sys.exit(asyncio.run(main(chat_id, args.force)))
@@ -1,4 +1,5 @@
 import asyncio
+import contextlib
 import logging
 import os
 import aiohttp
@@ -8,6 +9,7 @@ from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher, Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.filters import CommandStart, Command
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
@@ -34,27 +36,247 @@ bot = Bot(token=TOKEN)
 dp = Dispatcher()
 router = Router()
 
+# ================== TRACING (optional) ==================
+# TRACING_ENABLED=true: a span per button tap and per backend call. The traceparent
+# header makes the backend's request, SQL and Telegram spans part of the same trace.
+# Needs opentelemetry-sdk (+ opentelemetry-exporter-otlp-proto-http for TRACING_EXPORTER=otlp)
+tracer = None
+
+def setup_tracing():
+    global tracer
+    if os.getenv("TRACING_ENABLED", "").lower() not in ("1", "true", "yes"):
+        return
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+        if os.getenv("TRACING_EXPORTER", "file") == "otlp":
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            exporter = OTLPSpanExporter()
+        else:
+            exporter = ConsoleSpanExporter(
+                out=open(os.getenv("TRACING_FILE", "traces.jsonl"), "a", encoding="utf-8"),
+                formatter=lambda span: span.to_json(indent=None) + "\n",
+            )
+    except ImportError as e:
+        logger.warning(f"TRACING_ENABLED is set but OpenTelemetry is not installed ({e}), tracing stays off")
+        return
+    provider = TracerProvider(resource=Resource.create(
+        {"service.name": os.getenv("TRACING_SERVICE_NAME", "yauberu-courier-bot")}))
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    tracer = trace.get_tracer("courier-bot")
+
+def trace_span(name, kind="INTERNAL", **attributes):
+    if tracer is None:
+        return contextlib.nullcontext()
+    from opentelemetry.trace import SpanKind
+    return tracer.start_as_current_span(name, kind=getattr(SpanKind, kind), attributes=attributes)
+
+def trace_headers(headers=None):
+    """Request headers plus traceparent for the current span"""
+    if tracer is None:
+        return headers
+    from opentelemetry import propagate
+    headers = dict(headers or {})
+    propagate.inject(headers)
+    return headers
+
+def trace_status(span, status: int):
+    if span is not None:
+        span.set_attribute("http.status_code", status)
+
 # ================== API CLIENT ==================
+# (endpoint, params) -> (etag, data) for endpoints that send an ETag
+_etag_cache = {}
+
 async def fetch(endpoint, params=None):
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{API_BASE}{endpoint}", params=params) as resp:
-                if resp.status == 200:
-                    return await resp.json()
-                logger.error(f"API Error {resp.status} on {endpoint}")
-                return None
-    except Exception as e:
-        logger.error(f"Fetch error: {e}")
-        return None
+    cache_key = (endpoint, tuple(sorted((params or {}).items())))
+    cached = _etag_cache.get(cache_key)
+    headers = {"If-None-Match": cached[0]} if cached else None
+    with trace_span(f"GET {endpoint}", kind="CLIENT", **{"http.method": "GET"}) as span:
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f"{API_BASE}{endpoint}", params=params, headers=trace_headers(headers)) as resp:
+                    trace_status(span, resp.status)
+                    if resp.status == 304 and cached:
+                        return cached[1]
+                    if resp.status == 200:
+                        data = await resp.json()
+                        etag = resp.headers.get("ETag")
+                        if etag:
+                            _etag_cache[cache_key] = (etag, data)
+                        return data
+                    logger.error(f"API Error {resp.status} on {endpoint}")
+                    return None
+        except Exception as e:
+            logger.error(f"Fetch error: {e}")
+            return None
 
 async def post(endpoint, params=None, json_data=None):
+    with trace_span(f"POST {endpoint}", kind="CLIENT", **{"http.method": "POST"}) as span:
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(f"{API_BASE}{endpoint}", params=params, json=json_data,
+                                        headers=trace_headers()) as resp:
+                    trace_status(span, resp.status)
+                    return resp.status == 200
+        except Exception as e:
+            logger.error(f"Post error: {e}")
+            return False
+
+# ================== COURIER BOARD MIRROR ==================
+# Local copy of the backend courier board (today's + overdue open orders),
+# kept in sync over the /courier/stream WebSocket. Task navigation is answered
+# from it; while it is not synced the handlers fall back to the REST endpoints.
+STREAM_URL = os.getenv("COURIER_STREAM_URL", API_BASE.replace("http", "ws", 1) + "/courier/stream")
+LIVE_VIEW_DELAY = 1.5  # Seconds to collect board changes before editing task messages
+
+board = {"synced": False, "orders": {}, "complexes": []}
+
+# Task messages that follow the board: chat_id -> {"message_id", "view", "text"}
+# view is ("tasks",) or ("building", complex_id, building)
+live_views = {}
+_board_changed = asyncio.Event()
+
+def _manual_building(order: dict) -> str:
+    """Manual addresses are listed as 'Street, Building'"""
+    return f"{order.get('street') or ''}, {order['building']}"
+
+def _apply_board_message(message: dict):
+    kind = message.get("type")
+    if kind == "snapshot":
+        board["orders"] = {o["id"]: o for o in message["orders"]}
+        board["complexes"] = message["complexes"]
+        board["synced"] = True
+    elif kind and kind.startswith("order."):
+        if message["card"] is None:
+            board["orders"].pop(message["order_id"], None)
+        else:
+            board["orders"][message["order_id"]] = message["card"]
+    else:
+        return
+    _board_changed.set()
+
+async def follow_board():
+    """Keep the mirror in sync; reconnects with backoff and starts from a fresh snapshot"""
+    delay = 1
+    while True:
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.ws_connect(STREAM_URL, heartbeat=30) as ws:
+                    logger.info("📡 Courier board stream connected")
+                    delay = 1
+                    async for msg in ws:
+                        if msg.type != aiohttp.WSMsgType.TEXT:
+                            break
+                        _apply_board_message(msg.json())
+        except Exception as e:
+            logger.error(f"Board stream error: {e}")
+        board["synced"] = False
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 60)
+
+def _board_complexes() -> list:
+    counts = {}
+    for order in board["orders"].values():
+        counts[order["complex_id"]] = counts.get(order["complex_id"], 0) + 1
+    complexes = [
+        {"id": c["id"], "name": c["name"], "orders_count": counts.get(c["id"], 0)}
+        for c in board["complexes"]
+    ]
+    if counts.get(0):
+        complexes.append({"id": 0, "name": "📍 Другие адреса", "orders_count": counts[0]})
+    return complexes
+
+def _board_buildings(complex_id: int) -> list:
+    orders = [o for o in board["orders"].values() if o["complex_id"] == complex_id]
+    if complex_id == 0:
+        return sorted({_manual_building(o) for o in orders})
+    return sorted({o["building"] for o in orders})
+
+def _board_orders(complex_id: int, building: str) -> list:
+    if complex_id == 0:
+        orders = [o for o in board["orders"].values() if o["complex_id"] == 0 and _manual_building(o) == building]
+    else:
+        orders = [o for o in board["orders"].values() if o["complex_id"] == complex_id and o["building"] == building]
+    return sorted(orders, key=lambda o: (o["time_slot"], o["id"]))
+
+async def get_complexes():
+    return _board_complexes() if board["synced"] else await fetch("/courier/complexes")
+
+async def get_buildings(complex_id: int):
+    return _board_buildings(complex_id) if board["synced"] else await fetch("/courier/buildings", {"complex_id": complex_id})
+
+async def get_building_orders(complex_id: int, building: str):
+    if board["synced"]:
+        return _board_orders(complex_id, building)
+    return await fetch("/courier/orders", {"complex_id": complex_id, "building": building})
+
+def _render_view(chat_id: int, view: tuple):
+    if view[0] == "tasks":
+        return render_tasks(_board_complexes())
+    return render_building(_board_orders(view[1], view[2]), chat_id, view[1], view[2])
+
+async def show_live(callback: CallbackQuery, view: tuple, text: str, markup: InlineKeyboardMarkup):
+    """Show a task screen and keep it updated in place as the board changes"""
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(f"{API_BASE}{endpoint}", params=params, json=json_data) as resp:
-                return resp.status == 200
-    except Exception as e:
-        logger.error(f"Post error: {e}")
-        return False
+        await callback.message.edit_text(text, reply_markup=markup, parse_mode="Markdown")
+    except TelegramBadRequest as e:
+        if "not modified" not in str(e):
+            raise
+        await callback.answer()
+    live_views[callback.message.chat.id] = {
+        "message_id": callback.message.message_id,
+        "view": view,
+        "text": text,
+    }
+
+async def refresh_live_views():
+    """Re-render live task messages whose content changed (one edit per message per burst)"""
+    while True:
+        await _board_changed.wait()
+        await asyncio.sleep(LIVE_VIEW_DELAY)
+        _board_changed.clear()
+        if not board["synced"]:
+            continue
+        for chat_id, live in list(live_views.items()):
+            text, markup = _render_view(chat_id, live["view"])
+            if text == live["text"]:
+                continue
+            try:
+                await bot.edit_message_text(
+                    text, chat_id=chat_id, message_id=live["message_id"],
+                    reply_markup=markup, parse_mode="Markdown",
+                )
+                live["text"] = text
+            except TelegramBadRequest as e:
+                if "not modified" in str(e):
+                    live["text"] = text
+                else:
+                    live_views.pop(chat_id, None)
+            except Exception as e:
+                logger.error(f"Live view update failed for {chat_id}: {e}")
+            await asyncio.sleep(0.05)  # Stay well under the Bot API rate limit
+
+@router.callback_query.outer_middleware()
+async def trace_tap(handler, event: CallbackQuery, data):
+    """Root span for a button tap; the backend calls it makes join its trace"""
+    if tracer is None:
+        return await handler(event, data)
+    # take_42 -> "tap take": ids go to the attribute, not the span name
+    action = "_".join(part for part in (event.data or "").split("_") if not part.isdigit())
+    with trace_span(f"tap {action}", **{"telegram.callback_data": event.data or ""}):
+        return await handler(event, data)
+
+@router.callback_query.outer_middleware()
+async def release_live_view(handler, event: CallbackQuery, data):
+    """Any button pressed on a live task message takes it over; task screens re-register it"""
+    live = live_views.get(event.message.chat.id) if event.message else None
+    if live and live["message_id"] == event.message.message_id:
+        del live_views[event.message.chat.id]
+    return await handler(event, data)
 
 # ================== KEYBOARDS ==================
 def get_main_keyboard(is_admin: bool = False) -> InlineKeyboardMarkup:
@@ -471,13 +693,7 @@ async def admin_complexes(callback: CallbackQuery):
     )
 
 # ================== TASKS ==================
-@router.callback_query(F.data == "my_tasks")
-async def show_tasks(callback: CallbackQuery):
-    complexes = await fetch("/courier/complexes")
-    if complexes is None:
-        await callback.answer("Ошибка связи с сервером", show_alert=True)
-        return
-
+def render_tasks(complexes: list):
     total_orders = sum(c["orders_count"] for c in complexes)
     
     if total_orders == 0:
@@ -497,57 +713,16 @@ _Новые заказы появятся здесь автоматически.
 
 Выберите локацию:
 """
-    
-    await callback.message.edit_text(
-        text,
-        reply_markup=get_complexes_keyboard(complexes),
-        parse_mode="Markdown"
-    )
-
-@router.callback_query(F.data.startswith("complex_"))
-async def show_buildings(callback: CallbackQuery, state: FSMContext):
-    complex_id = int(callback.data.split("_")[1])
-    
-    buildings = await fetch(f"/courier/buildings?complex_id={complex_id}")
-    if buildings is None:
-        await callback.answer("Ошибка загрузки", show_alert=True)
-        return
-
-    await state.update_data(complex_id=complex_id)
-    
-    if not buildings:
-        await callback.answer("В этом ЖК нет активных заказов", show_alert=True)
-        return
-    
-    text = "🏢 **Выберите дом:**"
-    await callback.message.edit_text(
-        text,
-        reply_markup=get_buildings_keyboard(complex_id, buildings),
-        parse_mode="Markdown"
-    )
+    return text, get_complexes_keyboard(complexes)
 
-@router.callback_query(F.data.startswith("building_"))
-async def show_orders_in_building(callback: CallbackQuery, state: FSMContext):
-    # Use maxsplit=2 to handle buildings/streets with underscores
-    parts = callback.data.split("_", 2)
-    complex_id = int(parts[1])
-    building = parts[2]
-    
-    await state.update_data(building=building, complex_id=complex_id)
-    
-    orders = await fetch(f"/courier/orders?complex_id={complex_id}&building={building}")
-    
+def render_building(orders: list, courier_tg_id: int, complex_id: int, building: str):
     if not orders:
-        await callback.message.edit_text(
+        return (
             f"🏠 **Дом {building}**\n\n✅ Все заказы выполнены!",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+            InlineKeyboardMarkup(inline_keyboard=[
                 [InlineKeyboardButton(text="⬅️ Назад", callback_data=f"complex_{complex_id}")]
             ]),
-            parse_mode="Markdown"
         )
-        return
-    
-    courier_tg_id = callback.from_user.id
     
     text = f"🏠 **Дом {building}**\n\n"
     buttons = []
@@ -565,20 +740,10 @@ async def show_orders_in_building(callback: CallbackQuery, state: FSMContext):
             status_emoji = "🔵"
             status_text = "🔵 Взят"
         
-        # Format date
-        date_str = ""
-        if order.get('date'):
-            try:
-                from datetime import datetime
-                date_obj = datetime.fromisoformat(str(order['date']))
-                date_str = date_obj.strftime('%d.%m.%Y')
-            except:
-                date_str = str(order['date'])
-        
         text += f"{status_emoji} **Заказ #{order['id']}** — {status_text}\n"
         text += f"┌ 📍 {order.get('full_address', f'д. {building}')}\n"
-        if date_str:
-            text += f"├ 📅 {date_str}\n"
+        if order.get('date'):
+            text += f"├ 📅 {order['date']}\n"
         text += f"├ 🕐 {order['time_slot']}\n"
         text += f"├ 🚪 Подъезд {order['entrance']}, этаж {order['floor']}\n"
         text += f"├ 🏠 Квартира {order['apartment']}\n"
@@ -605,12 +770,58 @@ async def show_orders_in_building(callback: CallbackQuery, state: FSMContext):
     buttons.append([InlineKeyboardButton(text="🔄 Обновить", callback_data=f"building_{complex_id}_{building}")])
     buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=f"complex_{complex_id}")])
     
+    return text, InlineKeyboardMarkup(inline_keyboard=buttons)
+
+async def show_building(callback: CallbackQuery, complex_id: int, building: str):
+    orders = await get_building_orders(complex_id, building)
+    if orders is None:
+        await callback.answer("Ошибка загрузки", show_alert=True)
+        return
+    text, markup = render_building(orders, callback.from_user.id, complex_id, building)
+    await show_live(callback, ("building", complex_id, building), text, markup)
+
+@router.callback_query(F.data == "my_tasks")
+async def show_tasks(callback: CallbackQuery):
+    complexes = await get_complexes()
+    if complexes is None:
+        await callback.answer("Ошибка связи с сервером", show_alert=True)
+        return
+    
+    text, markup = render_tasks(complexes)
+    await show_live(callback, ("tasks",), text, markup)
+
+@router.callback_query(F.data.startswith("complex_"))
+async def show_buildings(callback: CallbackQuery, state: FSMContext):
+    complex_id = int(callback.data.split("_")[1])
+    
+    buildings = await get_buildings(complex_id)
+    if buildings is None:
+        await callback.answer("Ошибка загрузки", show_alert=True)
+        return
+
+    await state.update_data(complex_id=complex_id)
+    
+    if not buildings:
+        await callback.answer("В этом ЖК нет активных заказов", show_alert=True)
+        return
+    
+    text = "🏢 **Выберите дом:**"
     await callback.message.edit_text(
         text,
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons),
+        reply_markup=get_buildings_keyboard(complex_id, buildings),
         parse_mode="Markdown"
     )
 
+@router.callback_query(F.data.startswith("building_"))
+async def show_orders_in_building(callback: CallbackQuery, state: FSMContext):
+    # Use maxsplit=2 to handle buildings/streets with underscores
+    parts = callback.data.split("_", 2)
+    complex_id = int(parts[1])
+    building = parts[2]
+    
+    await state.update_data(building=building, complex_id=complex_id)
+    await show_building(callback, complex_id, building)
+
 @router.callback_query(F.data.startswith("take_"))
 async def take_order_handler(callback: CallbackQuery, state: FSMContext):
     order_id = int(callback.data.split("_")[1])
@@ -627,86 +838,12 @@ async def take_order_handler(callback: CallbackQuery, state: FSMContext):
     # Show success notification
     await callback.answer(f"✅ Заказ #{order_id} взят!", show_alert=False)
     
-    # Get state to refresh the same page
+    # Refresh the same page (the board stream may not have delivered the change yet)
     data = await state.get_data()
-    complex_id = data.get("complex_id")
-    building = data.get("building")
-    
-    # Refresh the orders list (stay on the same page)
-    orders = await fetch(f"/courier/orders?complex_id={complex_id}&building={building}")
-    
-    if not orders:
-        await callback.message.edit_text(
-            f"🏠 **Дом {building}**\n\n✅ Все заказы выполнены!",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="⬅️ Назад", callback_data=f"complex_{complex_id}")]
-            ]),
-            parse_mode="Markdown"
-        )
-        return
-    
-    # Rebuild the list
-    text = f"🏠 **Дом {building}**\n\n"
-    buttons = []
-    
-    for order in orders:
-        is_mine = order.get('courier_telegram_id') == courier_tg_id
-        
-        if order['status'] == 'scheduled':
-            status_emoji = "🟡"
-            status_text = "🟢 Доступен"
-        elif order['status'] == 'in_progress' and is_mine:
-            status_emoji = "🔵"
-            status_text = "💼 Ваш заказ"
-        else:
-            status_emoji = "🔵"
-            status_text = "🔵 Взят"
-        
-        # Format date
-        date_str = ""
-        if order.get('date'):
-            try:
-                from datetime import datetime
-                date_obj = datetime.fromisoformat(str(order['date']))
-                date_str = date_obj.strftime('%d.%m.%Y')
-            except:
-                date_str = str(order['date'])
-        
-        text += f"{status_emoji} **Заказ #{order['id']}** — {status_text}\n"
-        text += f"┌ 📍 {order.get('full_address', f'д. {building}')}\n"
-        if date_str:
-            text += f"├ 📅 {date_str}\n"
-        text += f"├ 🕐 {order['time_slot']}\n"
-        text += f"├ 🚪 Подъезд {order['entrance']}, этаж {order['floor']}\n"
-        text += f"├ 🏠 Квартира {order['apartment']}\n"
-        text += f"├ 🔑 Домофон: `{order['intercom']}`\n"
-        if order.get('comment'):
-            text += f"└ 💬 _{order['comment']}_\n"
-        text += "\n"
-        
-        # Add buttons based on status
-        if order['status'] == 'scheduled':
-            # Available order - show "Take" button
-            buttons.append([InlineKeyboardButton(
-                text=f"🚀 Взять заказ #{order['id']}",
-                callback_data=f"take_{order['id']}"
-            )])
-        elif order['status'] == 'in_progress' and is_mine:
-            # My order in progress - show "Complete" button
-            buttons.append([InlineKeyboardButton(
-                text=f"✅ Выполнить заказ #{order['id']}",
-                callback_data=f"complete_{order['id']}"
-            )])
-    
-    # Navigation buttons
-    buttons.append([InlineKeyboardButton(text="🔄 Обновить", callback_data=f"building_{complex_id}_{building}")])
-    buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=f"complex_{complex_id}")])
-    
-    await callback.message.edit_text(
-        text,
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons),
-        parse_mode="Markdown"
-    )
+    card = board["orders"].get(order_id)
+    if card:
+        board["orders"][order_id] = {**card, "status": "in_progress", "courier_telegram_id": courier_tg_id}
+    await show_building(callback, data.get("complex_id"), data.get("building"))
 
 @router.callback_query(F.data.startswith("complete_"))
 async def complete_order_handler(callback: CallbackQuery):
@@ -740,85 +877,10 @@ async def set_bags_and_complete(callback: CallbackQuery, state: FSMContext):
     # Show success notification
     await callback.answer(f"✅ Заказ #{order_id} выполнен! Забрали {bags_text}", show_alert=False)
     
-    # Get state to refresh the same page
+    # Refresh the same page (the board stream may not have delivered the change yet)
     data = await state.get_data()
-    complex_id = data.get("complex_id")
-    building = data.get("building")
-    
-    # Refresh the orders list (stay on the same page)
-    orders = await fetch(f"/courier/orders?complex_id={complex_id}&building={building}")
-    courier_tg_id = callback.from_user.id
-    
-    if not orders:
-        await callback.message.edit_text(
-            f"🏠 **Дом {building}**\n\n✅ Все заказы выполнены!",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="⬅️ Назад", callback_data=f"complex_{complex_id}")]
-            ]),
-            parse_mode="Markdown"
-        )
-        return
-    
-    # Rebuild the list
-    text = f"🏠 **Дом {building}**\n\n"
-    buttons = []
-    
-    for order in orders:
-        is_mine = order.get('courier_telegram_id') == courier_tg_id
-        
-        if order['status'] == 'scheduled':
-            status_emoji = "🟡"
-            status_text = "🟢 Доступен"
-        elif order['status'] == 'in_progress' and is_mine:
-            status_emoji = "🔵"
-            status_text = "💼 Ваш заказ"
-        else:
-            status_emoji = "🔵"
-            status_text = "🔵 Взят"
-        
-        # Format date
-        date_str = ""
-        if order.get('date'):
-            try:
-                from datetime import datetime
-                date_obj = datetime.fromisoformat(str(order['date']))
-                date_str = date_obj.strftime('%d.%m.%Y')
-            except:
-                date_str = str(order['date'])
-        
-        text += f"{status_emoji} **Заказ #{order['id']}** — {status_text}\n"
-        text += f"┌ 📍 {order.get('full_address', f'д. {building}')}\n"
-        if date_str:
-            text += f"├ 📅 {date_str}\n"
-        text += f"├ 🕐 {order['time_slot']}\n"
-        text += f"├ 🚪 Подъезд {order['entrance']}, этаж {order['floor']}\n"
-        text += f"├ 🏠 Квартира {order['apartment']}\n"
-        text += f"├ 🔑 Домофон: `{order['intercom']}`\n"
-        if order.get('comment'):
-            text += f"└ 💬 _{order['comment']}_\n"
-        text += "\n"
-        
-        # Add buttons based on status
-        if order['status'] == 'scheduled':
-            buttons.append([InlineKeyboardButton(
-                text=f"🚀 Взять заказ #{order['id']}",
-                callback_data=f"take_{order['id']}"
-            )])
-        elif order['status'] == 'in_progress' and is_mine:
-            buttons.append([InlineKeyboardButton(
-                text=f"✅ Выполнить заказ #{order['id']}",
-                callback_data=f"complete_{order['id']}"
-            )])
-    
-    # Navigation buttons
-    buttons.append([InlineKeyboardButton(text="🔄 Обновить", callback_data=f"building_{complex_id}_{building}")])
-    buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=f"complex_{complex_id}")])
-    
-    await callback.message.edit_text(
-        text,
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons),
-        parse_mode="Markdown"
-    )
+    board["orders"].pop(order_id, None)
+    await show_building(callback, data.get("complex_id"), data.get("building"))
 
 @router.callback_query(F.data.startswith("undo_"))
 async def undo_completion(callback: CallbackQuery):
@@ -844,8 +906,11 @@ async def back_to_orders(callback: CallbackQuery, state: FSMContext):
 
 # ================== MAIN ==================
 async def main():
+    setup_tracing()
     dp.include_router(router)
     logger.info("🚀 Courier bot starting...")
+    asyncio.create_task(follow_board())
+    asyncio.create_task(refresh_live_views())
     await dp.start_polling(bot)
 
 if __name__ == "__main__":